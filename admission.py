@@ -0,0 +1,164 @@
+"""
+Machine-wide admission control for the expensive resources a render uses.
+
+Every worker process (and Streamlit server) on the box shares three limits:
+image generation requests in flight, Chrome browsers alive and encoder
+(ffmpeg / MoviePy) processes running. A resource with N slots is N files
+under SLOTS_DIR, and holding a slot is holding an exclusive flock on one of
+them. The limits therefore hold across processes without a coordinator, and
+a worker that crashes gives its slots back with its file descriptors.
+
+    with get_admission().slot("encoders"):
+        run_ffmpeg()
+
+Waiting for a slot is traced as an admission.<resource> span and counted in
+`stats()`, so queueing inside the render shows up next to the stage timings.
+"""
+
+import fcntl
+import os
+import random
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+from telemetry import span
+
+# Absolute, so servers and batch runs started from different directories share the same slots
+SLOTS_DIR = os.path.abspath(os.getenv("VISION_DIARY_SLOTS_DIR",
+                                      os.path.join(tempfile.gettempdir(), "vision_diary_slots")))
+# Slots per resource across every process on the machine; 0 means unlimited
+IMAGE_SLOTS = int(os.getenv("VISION_DIARY_IMAGE_SLOTS", "8"))
+BROWSER_SLOTS = int(os.getenv("VISION_DIARY_BROWSER_SLOTS", "4"))
+ENCODER_SLOTS = int(os.getenv("VISION_DIARY_ENCODER_SLOTS", str(os.cpu_count() or 1)))
+POLL_INTERVAL = 0.05
+
+LIMITS = {"images": IMAGE_SLOTS, "browsers": BROWSER_SLOTS, "encoders": ENCODER_SLOTS}
+
+
+@contextmanager
+def file_lock(path):
+    """Hold an exclusive flock on path (created if missing) for the block."""
+    with open(path, "a+b") as f:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+class Slot:
+    """One held slot; release() (or the end of the process) frees it."""
+
+    def __init__(self, controller, resource, f=None):
+        self.controller = controller
+        self.resource = resource
+        self._file = f
+
+    def release(self):
+        if self.controller is None:
+            return
+        if self._file is not None:
+            self._file.close()  # drops the flock
+            self._file = None
+        self.controller._released(self.resource)
+        self.controller = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.release()
+        return False
+
+
+class AdmissionController:
+    """Counting semaphores over flock'd slot files, one set per resource."""
+
+    def __init__(self, limits=None, directory=SLOTS_DIR, poll_interval=POLL_INTERVAL):
+        self.limits = dict(LIMITS if limits is None else limits)
+        self.directory = directory
+        self.poll_interval = poll_interval
+        self._lock = threading.Lock()
+        self._stats = {resource: {"acquired": 0, "waited": 0, "wait_seconds": 0.0, "max_wait": 0.0,
+                                  "timeouts": 0, "held": 0} for resource in self.limits}
+        os.makedirs(directory, exist_ok=True)
+
+    def _try(self, resource):
+        limit = self.limits[resource]
+        start = random.randrange(limit)  # spread contenders over the slot files
+        for i in range(limit):
+            f = open(os.path.join(self.directory, f"{resource}.{(start + i) % limit}"), "a+b")
+            try:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                f.close()
+                continue
+            return f
+        return None
+
+    def acquire(self, resource, deadline=None):
+        """
+        Take a slot of resource, polling until one is free. deadline is a
+        time.monotonic() value; TimeoutError if no slot frees up by then.
+        """
+        if self.limits.get(resource, 0) <= 0:
+            return Slot(None, resource)
+        started = time.monotonic()
+        f = self._try(resource)
+        if f is None:
+            with span(f"admission.{resource}"):
+                while f is None:
+                    if deadline is not None and time.monotonic() >= deadline:
+                        self._record(resource, time.monotonic() - started, timed_out=True)
+                        raise TimeoutError(f"No {resource} slot free")
+                    wait = self.poll_interval
+                    if deadline is not None:
+                        wait = max(0.0, min(wait, deadline - time.monotonic()))
+                    time.sleep(wait)
+                    f = self._try(resource)
+        self._record(resource, time.monotonic() - started)
+        return Slot(self, resource, f)
+
+    def slot(self, resource, deadline=None):
+        """Context manager form of acquire()."""
+        return self.acquire(resource, deadline)
+
+    def _record(self, resource, waited, timed_out=False):
+        with self._lock:
+            stats = self._stats[resource]
+            if timed_out:
+                stats["timeouts"] += 1
+            else:
+                stats["acquired"] += 1
+                stats["held"] += 1
+            if waited > self.poll_interval / 2:
+                stats["waited"] += 1
+            stats["wait_seconds"] += waited
+            stats["max_wait"] = max(stats["max_wait"], waited)
+
+    def _released(self, resource):
+        with self._lock:
+            self._stats[resource]["held"] -= 1
+
+    def stats(self):
+        """This process's slot counts and waits, per resource."""
+        with self._lock:
+            return {resource: dict(stats, limit=self.limits[resource],
+                                   wait_seconds=round(stats["wait_seconds"], 3),
+                                   max_wait=round(stats["max_wait"], 3))
+                    for resource, stats in self._stats.items()}
+
+
+_admission = None
+_admission_lock = threading.Lock()
+
+
+def get_admission():
+    """The process's admission controller, created on first use."""
+    global _admission
+    with _admission_lock:
+        if _admission is None:
+            _admission = AdmissionController()
+        return _admission
@@ -0,0 +1,174 @@
+"""
+SQLite index of rendered diary entries.
+
+Every finished render records one row per (app, date): the text hash, the
+video, preview, audio and image paths, file sizes, the video's duration and
+when it was rendered. The history pages list entries from this index (an
+indexed, paged query) instead of scanning the per-date directories.
+
+Entries rendered before the index existed can be added with:
+
+    python archive.py --rebuild
+"""
+
+import argparse
+import glob
+import hashlib
+import json
+import os
+import sqlite3
+import time
+
+ARCHIVE_DB = os.getenv("VISION_DIARY_ARCHIVE_DB", "./vision_diary_archive.sqlite3")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    app TEXT NOT NULL,
+    entry_date TEXT NOT NULL,
+    text_hash TEXT NOT NULL,
+    video_path TEXT NOT NULL,
+    preview_path TEXT,
+    audio_path TEXT,
+    images TEXT NOT NULL DEFAULT '[]',
+    video_bytes INTEGER NOT NULL DEFAULT 0,
+    total_bytes INTEGER NOT NULL DEFAULT 0,
+    duration REAL,
+    scenes INTEGER NOT NULL DEFAULT 0,
+    rendered_at REAL NOT NULL,
+    PRIMARY KEY (app, entry_date)
+);
+CREATE INDEX IF NOT EXISTS entries_app_date ON entries (app, entry_date DESC);
+"""
+
+
+def connect(db_path=None):
+    """Open the archive index, creating the schema on first use."""
+    conn = sqlite3.connect(db_path or ARCHIVE_DB, timeout=30, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def _size(path):
+    try:
+        return os.path.getsize(path) if path else 0
+    except OSError:
+        return 0
+
+
+def _row_to_entry(row):
+    if row is None:
+        return None
+    entry = dict(row)
+    entry["images"] = json.loads(entry["images"])
+    return entry
+
+
+def record_entry(app, entry_date, text, video_path, images, audio_path=None, preview_path=None, duration=None,
+                 db_path=None):
+    """Add or replace the index row for a finished render."""
+    paths = [video_path, preview_path, audio_path] + list(images)
+    row = {
+        "app": app,
+        "entry_date": str(entry_date),
+        "text_hash": hashlib.sha256(text.encode("utf-8")).hexdigest() if text is not None else "",
+        "video_path": os.path.abspath(video_path),
+        "preview_path": os.path.abspath(preview_path) if preview_path else None,
+        "audio_path": os.path.abspath(audio_path) if audio_path else None,
+        "images": json.dumps([os.path.abspath(path) for path in images]),
+        "video_bytes": _size(video_path),
+        "total_bytes": sum(_size(path) for path in paths),
+        "duration": duration,
+        "scenes": len(images),
+        "rendered_at": time.time(),
+    }
+    conn = connect(db_path)
+    try:
+        conn.execute(f"INSERT OR REPLACE INTO entries ({', '.join(row)}) VALUES ({', '.join('?' * len(row))})",
+                     tuple(row.values()))
+    finally:
+        conn.close()
+    return row
+
+
+def get_entry(app, entry_date, db_path=None):
+    conn = connect(db_path)
+    try:
+        return _row_to_entry(conn.execute("SELECT * FROM entries WHERE app = ? AND entry_date = ?",
+                                          (app, str(entry_date))).fetchone())
+    finally:
+        conn.close()
+
+
+def list_entries(app, limit=20, before=None, db_path=None):
+    """
+    The app's entries, newest date first, one page at a time. Pass the last
+    entry_date of a page as before= to get the next one; the query seeks
+    the index there rather than skipping earlier pages.
+    """
+    conn = connect(db_path)
+    try:
+        if before is None:
+            rows = conn.execute("SELECT * FROM entries WHERE app = ? ORDER BY entry_date DESC LIMIT ?",
+                                (app, limit)).fetchall()
+        else:
+            rows = conn.execute("SELECT * FROM entries WHERE app = ? AND entry_date < ? "
+                                "ORDER BY entry_date DESC LIMIT ?", (app, str(before), limit)).fetchall()
+        return [_row_to_entry(row) for row in rows]
+    finally:
+        conn.close()
+
+
+def count_entries(app, db_path=None):
+    conn = connect(db_path)
+    try:
+        return conn.execute("SELECT COUNT(*) FROM entries WHERE app = ?", (app,)).fetchone()[0]
+    finally:
+        conn.close()
+
+
+def rebuild_index(db_path=None):
+    """Index videos on disk under the working directory that are not indexed yet; returns how many."""
+    from encoder import probe_duration
+    from render import APPS, entry_paths, preview_path_for, scene_image_path
+
+    added = 0
+    for app, settings in APPS.items():
+        pattern = settings["save_directory"].format(date="*")
+        name_prefix = os.path.basename(pattern).split("*")[0]
+        for directory in sorted(glob.glob(pattern)):
+            entry_date = os.path.basename(directory)[len(name_prefix):]
+            save_directory, audio_path, video_path = entry_paths(app, entry_date)
+            if not os.path.isfile(video_path) or get_entry(app, entry_date, db_path) is not None:
+                continue
+            images = []
+            while os.path.exists(scene_image_path(save_directory, len(images))):
+                images.append(scene_image_path(save_directory, len(images)))
+            preview_path = preview_path_for(video_path)
+            try:
+                duration = probe_duration(video_path)
+            except ValueError:
+                duration = None
+            record_entry(app, entry_date, None, video_path, images, audio_path if os.path.exists(audio_path) else None,
+                         preview_path if os.path.exists(preview_path) else None, duration, db_path=db_path)
+            added += 1
+    return added
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Vision Diary archive index.")
+    parser.add_argument("--rebuild", action="store_true", help="index entries already rendered in this directory")
+    parser.add_argument("--app", choices=("replicate", "selenium"), default=None)
+    parser.add_argument("--db", default=None)
+    args = parser.parse_args()
+    if args.rebuild:
+        print(f"Indexed {rebuild_index(args.db)} entries")
+    for app in [args.app] if args.app else ("replicate", "selenium"):
+        for entry in list_entries(app, limit=1000, db_path=args.db):
+            print(f"{app}\t{entry['entry_date']}\t{entry['scenes']} scenes\t{entry['video_bytes'] / 1e6:.1f} MB\t"
+                  f"{entry['video_path']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,686 @@
+"""
+Image backends: every way a scene image can be made, behind one interface.
+
+A backend turns a prompt into an image file (`ImageBackend.generate`).
+Scenes are generated through a chain of backends, e.g. replicate →
+placeholder, by `generate_scene`:
+
+* every scene has a deadline, and a backend's waits are capped by it;
+* a request still running after the backend's recent p95 latency is hedged
+  with one duplicate request, and whichever finishes first wins;
+* each backend has a circuit breaker that opens after repeated failures, so
+  later scenes go straight to the next backend until a trial request after
+  the cooldown succeeds;
+* the chain ends in the local placeholder renderer, so one slow or broken
+  service cannot cost an entry its scenes.
+
+Backends are created once per process (`get_backend`), so their latency
+history, breakers and request/browser limits are shared by every entry.
+Each backend imports its SDK (replicate, selenium) on first use, and
+`prewarm()` creates its clients ahead of the first scene.
+"""
+
+import collections
+import contextvars
+import hashlib
+import os
+import textwrap
+import threading
+import time
+import warnings
+
+from urllib3.exceptions import InsecureRequestWarning
+
+from admission import get_admission
+from concurrency import TokenBucket
+from downloads import download_file
+from telemetry import log, span
+
+warnings.simplefilter('ignore', InsecureRequestWarning)  # the generator page's images are fetched unverified
+
+# Concurrency settings for scene generation
+MAX_CONCURRENT_REQUESTS = int(os.getenv("VISION_DIARY_MAX_CONCURRENCY", "4"))
+REQUEST_TIMEOUT = float(os.getenv("VISION_DIARY_REQUEST_TIMEOUT", "180"))  # per-scene deadline
+REQUESTS_PER_SECOND = float(os.getenv("VISION_DIARY_REQUESTS_PER_SECOND", "2"))
+MAX_IMAGE_BYTES = 20 * 1024 * 1024
+
+PROMPT_PREFIX = "Professional photo-realistic image: "
+SDXL_MODEL = "stability-ai/sdxl:39ed52f2a78e934b3ba6e2a89f5b1c712de7dfea535525255b1aa35c5565e08b"
+# Longest Replicate holds a create request open for the result ("Prefer: wait"); polling takes over after
+PREFER_WAIT = 60
+
+GENERATOR_URL = os.getenv("VISION_DIARY_GENERATOR_URL", "https://aicreate.com/text-to-image-generator/")
+GENERATOR_MODEL = "aicreate-flux"
+# The generator page enhances the prompt and makes it photo-realistic
+GENERATOR_PROMPT_PREFIX = "enhance-prompt+make-photo-realistic"
+
+BROWSER_POOL_SIZE = int(os.getenv("VISION_DIARY_BROWSER_POOL_SIZE", "2"))
+BROWSER_MAX_USES = int(os.getenv("VISION_DIARY_BROWSER_MAX_USES", "25"))
+
+# Failover settings
+HEDGE = os.getenv("VISION_DIARY_HEDGE", "1") == "1"
+HEDGE_MIN_SAMPLES = 5  # latencies needed before a backend's p95 is trusted
+BREAKER_FAILURES = int(os.getenv("VISION_DIARY_BREAKER_FAILURES", "3"))
+BREAKER_COOLDOWN = float(os.getenv("VISION_DIARY_BREAKER_COOLDOWN", "60"))
+# Longest a scene waits on another scene's half-open trial before trying the next backend,
+# while the backend has too few latencies for a p95
+TRIAL_WAIT = float(os.getenv("VISION_DIARY_TRIAL_WAIT", "10"))
+RETRY_BACKOFF = 2.0
+LATENCY_WINDOW = 200
+
+PLACEHOLDER = "placeholder"
+IMAGE_SIZE = 1024
+
+
+class BackendStats:
+    """Rolling window of successful request latencies plus outcome counters."""
+
+    def __init__(self, window=LATENCY_WINDOW):
+        self.counts = {"requests": 0, "ok": 0, "errors": 0, "timeouts": 0, "hedges": 0, "hedge_wins": 0}
+        self._latencies = collections.deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def add(self, key, amount=1):
+        with self._lock:
+            self.counts[key] += amount
+
+    def record(self, seconds):
+        with self._lock:
+            self.counts["ok"] += 1
+            self._latencies.append(seconds)
+
+    def percentile(self, q, min_samples=1):
+        """The q-quantile of recent latencies, or None with fewer than min_samples."""
+        with self._lock:
+            latencies = sorted(self._latencies)
+        if len(latencies) < max(1, min_samples):
+            return None
+        return latencies[min(len(latencies) - 1, int(q * len(latencies)))]
+
+    def snapshot(self):
+        with self._lock:
+            counts = dict(self.counts)
+        p50, p95 = self.percentile(0.5), self.percentile(0.95)
+        counts["p50_seconds"] = round(p50, 3) if p50 is not None else None
+        counts["p95_seconds"] = round(p95, 3) if p95 is not None else None
+        return counts
+
+
+class CircuitBreaker:
+    """
+    Closed until `failures` requests fail in a row, then open (requests are
+    refused) for `cooldown` seconds, then half-open: one trial request is let
+    through, and its outcome closes or re-opens the breaker. Callers arriving
+    while the trial runs may wait for its outcome instead of being refused.
+    """
+
+    def __init__(self, failures=BREAKER_FAILURES, cooldown=BREAKER_COOLDOWN):
+        self.failures = failures
+        self.cooldown = cooldown
+        self.state = "closed"
+        self.trips = 0
+        self._consecutive = 0
+        self._opened_at = 0.0
+        self._trial = False
+        self._changed = threading.Condition()
+
+    def allow(self, wait_until=None):
+        """Whether a request may go out now; waits up to wait_until (monotonic) for a running trial."""
+        with self._changed:
+            while True:
+                if self.state == "open" and time.monotonic() - self._opened_at >= self.cooldown:
+                    self.state, self._trial = "half_open", False
+                if self.state == "closed":
+                    return True
+                if self.state == "half_open" and not self._trial:
+                    self._trial = True
+                    return True
+                remaining = None if wait_until is None else wait_until - time.monotonic()
+                if self.state == "open" or remaining is None or remaining <= 0:
+                    return False
+                self._changed.wait(remaining)
+
+    def success(self):
+        with self._changed:
+            self.state, self._consecutive, self._trial = "closed", 0, False
+            self._changed.notify_all()
+
+    def failure(self):
+        with self._changed:
+            self._consecutive += 1
+            if self.state == "half_open" or (self.state == "closed" and self._consecutive >= self.failures):
+                self.state, self._opened_at, self._trial = "open", time.monotonic(), False
+                self.trips += 1
+                self._changed.notify_all()
+                return True
+            return False
+
+
+class ImageBackend:
+    """
+    Base class for image backends. Subclasses set `name`, plus `model` and
+    `prompt_prefix` (which key the image cache), and implement generate().
+    """
+
+    name = None
+    model = ""
+    prompt_prefix = ""
+    cacheable = True  # worth caching and reusing in later renders
+    local = False  # runs inline, never hedged and never cut off by the deadline
+    hedge = True
+    attempts = 1
+
+    def __init__(self):
+        self.stats = BackendStats()
+        self.breaker = CircuitBreaker()
+
+    def check(self):
+        """Raise if the backend is not configured (e.g. a missing API token)."""
+
+    def prewarm(self):
+        """Load SDKs and create clients now rather than on the first scene."""
+
+    def concurrency(self):
+        """How many scenes to run at once when this backend leads the chain."""
+        return MAX_CONCURRENT_REQUESTS
+
+    def slots(self):
+        """Semaphore capping this backend's scenes across every entry in the process, or None."""
+        return None
+
+    def generate(self, prompt, image_path, deadline):
+        """Write the image for prompt to image_path, giving up at deadline (a time.monotonic() value)."""
+        raise NotImplementedError
+
+    def hedge_after(self):
+        """Seconds after which a request is hedged, or None to not hedge."""
+        if not (HEDGE and self.hedge) or self.breaker.state != "closed":
+            return None
+        return self.stats.percentile(0.95, min_samples=HEDGE_MIN_SAMPLES)
+
+    def trial_wait(self):
+        """Seconds a scene may wait for this backend's half-open trial: a normal request's p95."""
+        p95 = self.stats.percentile(0.95, min_samples=HEDGE_MIN_SAMPLES)
+        return TRIAL_WAIT if p95 is None else min(p95, TRIAL_WAIT)
+
+    def close(self):
+        pass
+
+    def cache_key(self, cache, prompt):
+        return cache.key(prompt, self.model, IMAGE_SIZE, IMAGE_SIZE, self.prompt_prefix)
+
+
+def _remaining(deadline, floor=0.5):
+    return None if deadline is None else max(floor, deadline - time.monotonic())
+
+
+def _download(url, image_path, verify=True):
+    with span("scene.download") as download:
+        stats = download_file(url, image_path, verify=verify, max_bytes=MAX_IMAGE_BYTES)
+        download.set(bytes=stats["bytes"], retries=stats["attempts"] - 1)
+
+
+_request_limits = None
+_request_limits_lock = threading.Lock()
+
+
+def get_request_limits():
+    """(slots, token bucket) capping Replicate requests across every entry in this process."""
+    global _request_limits
+    with _request_limits_lock:
+        if _request_limits is None:
+            _request_limits = (threading.BoundedSemaphore(MAX_CONCURRENT_REQUESTS), TokenBucket(REQUESTS_PER_SECOND))
+        return _request_limits
+
+
+class ReplicateBackend(ImageBackend):
+    """Stable Diffusion XL on Replicate."""
+
+    name = "replicate"
+    model = SDXL_MODEL
+    prompt_prefix = PROMPT_PREFIX
+
+    def __init__(self):
+        super().__init__()
+        self._client = None
+        self._client_lock = threading.Lock()
+
+    def check(self):
+        if not os.getenv("REPLICATE_API_TOKEN"):
+            raise ValueError("REPLICATE_API_TOKEN environment variable not set!")
+
+    def slots(self):
+        return get_request_limits()[0]
+
+    def prewarm(self):
+        self.client()
+
+    def client(self):
+        with self._client_lock:
+            if self._client is None:
+                import httpx
+                import replicate  # only the Replicate backend needs the SDK
+                # REPLICATE_BASE_URL lets us point the client at a local fake endpoint. A create
+                # request may be held open for PREFER_WAIT seconds, so reads may take that long
+                self._client = replicate.Client(api_token=os.getenv("REPLICATE_API_TOKEN"),
+                                                base_url=os.getenv("REPLICATE_BASE_URL") or None,
+                                                timeout=httpx.Timeout(10.0, read=PREFER_WAIT + 10.0))
+            return self._client
+
+    def generate(self, prompt, image_path, deadline):
+        # Every request, hedges included, pays into the shared start rate
+        get_request_limits()[1].acquire()
+        client = self.client()
+        with span("scene.generate"):
+            # client.run would wait for the prediction however long it takes; this waits until the deadline
+            prediction = client.predictions.create(
+                version=SDXL_MODEL.split(":", 1)[1],
+                input={
+                    "prompt": f"{PROMPT_PREFIX}{prompt}",
+                    "width": IMAGE_SIZE,
+                    "height": IMAGE_SIZE,
+                    "num_outputs": 1,
+                },
+                wait=max(1, min(PREFER_WAIT, int(_remaining(deadline, floor=1)))),
+            )
+            while prediction.status not in ("succeeded", "failed", "canceled"):
+                if time.monotonic() >= deadline:
+                    try:
+                        prediction.cancel()  # stop paying for a result nobody waits for
+                    except Exception as e:
+                        log(f"Could not cancel Replicate prediction {prediction.id}: {e}", level="warning")
+                    raise TimeoutError("Replicate prediction still running at the scene deadline")
+                time.sleep(min(client.poll_interval, _remaining(deadline, floor=0)))
+                prediction.reload()
+        if prediction.status != "succeeded":
+            raise RuntimeError(f"Replicate prediction {prediction.status}: {prediction.error}")
+        _download(str(prediction.output[0]), image_path)
+
+
+_browser_pool = None
+_browser_pool_lock = threading.Lock()
+
+
+def get_browser_pool():
+    """Warm Chrome drivers shared by every job this process runs."""
+    global _browser_pool
+    with _browser_pool_lock:
+        if _browser_pool is None:
+            from browser_pool import BrowserPool  # selenium only loads when a browser is needed
+            _browser_pool = BrowserPool(size=BROWSER_POOL_SIZE, max_uses=BROWSER_MAX_USES, warm_url=GENERATOR_URL,
+                                        admit=lambda deadline: get_admission().acquire("browsers", deadline))
+        return _browser_pool
+
+
+def _wait(driver, seconds, condition, step, deadline=None):
+    """WebDriverWait(driver, seconds).until(condition), traced as selenium.<step> and capped by deadline."""
+    from selenium.webdriver.support.ui import WebDriverWait
+
+    if deadline is not None:
+        seconds = min(seconds, _remaining(deadline))
+    with span(f"selenium.{step}"):
+        return WebDriverWait(driver, seconds).until(condition)
+
+
+def run_generator(driver, prompt, deadline=None):
+    """Drive the generator page for one prompt and return the image URL."""
+    from selenium.webdriver.common.by import By
+    from selenium.webdriver.support import expected_conditions as EC
+
+    # Wait for page to load
+    prompt_input = _wait(driver, 15, EC.element_to_be_clickable((By.NAME, "caption")), "caption", deadline)
+    prompt_input.clear()
+    prompt_input.send_keys(prompt)
+
+    # Enhance prompt
+    enhance_button = _wait(driver, 15, EC.element_to_be_clickable((By.ID, "enhance-prompt")), "enhance", deadline)
+    enhance_button.click()
+
+    # Make photo realistic
+    photo_realistic_button = _wait(driver, 15, EC.element_to_be_clickable((By.ID, "make-photo-realistic")),
+                                   "photo_realistic", deadline)
+    photo_realistic_button.click()
+
+    # Wait for loading to finish
+    _wait(driver, 30, EC.invisibility_of_element((By.ID, "loading-overlay")), "loading", deadline)
+
+    # Select model
+    model_select = _wait(driver, 15, EC.element_to_be_clickable((By.NAME, "model_version")), "model", deadline)
+    model_select.find_element(By.XPATH, "//option[@value='flux']").click()
+
+    # Select size
+    size_select = _wait(driver, 15, EC.element_to_be_clickable((By.NAME, "size")), "size", deadline)
+    size_select.find_element(By.XPATH, "//option[@value='1024x1024']").click()
+
+    # Generate images
+    generate_button = _wait(driver, 15, EC.element_to_be_clickable(
+        (By.XPATH, "//button[@type='submit' and contains(text(), 'Generate Images')]")), "generate_button", deadline)
+    driver.execute_script("arguments[0].click();", generate_button)
+
+    # Wait for image to be generated
+    _wait(driver, 60, EC.visibility_of_element_located((By.CLASS_NAME, "download-image")), "image", deadline)
+
+    # Get image URL
+    image_element = driver.find_element(By.CSS_SELECTOR, "div.image-wrapper img")
+    return image_element.get_attribute("src")
+
+
+class SeleniumBackend(ImageBackend):
+    """The aicreate.com generator page, driven in pooled Chrome browsers."""
+
+    name = "selenium"
+    model = GENERATOR_MODEL
+    prompt_prefix = GENERATOR_PROMPT_PREFIX
+    attempts = 2  # a failing driver is recycled by the pool before the retry
+
+    def concurrency(self):
+        return BROWSER_POOL_SIZE
+
+    def prewarm(self):
+        get_browser_pool()  # launches and parks the pool's browsers in the background
+
+    def generate(self, prompt, image_path, deadline):
+        pool = get_browser_pool()
+        with span("scene.generate"):
+            with pool.driver(timeout=_remaining(deadline)) as driver:
+                image_url = run_generator(driver, prompt, deadline)
+        _download(image_url, image_path, verify=False)
+
+    def close(self):
+        global _browser_pool
+        with _browser_pool_lock:
+            if _browser_pool is not None:
+                _browser_pool.close()
+                _browser_pool = None
+
+
+class PlaceholderBackend(ImageBackend):
+    """Local stand-in: a colour card showing the scene's text, drawn in milliseconds."""
+
+    name = PLACEHOLDER
+    model = "placeholder"
+    cacheable = False  # a later render should try the real backends again
+    local = True
+    hedge = False
+
+    def concurrency(self):
+        return os.cpu_count() or 1
+
+    def prewarm(self):
+        _placeholder_font()
+
+    def generate(self, prompt, image_path, deadline=None):
+        from PIL import Image, ImageDraw
+
+        digest = hashlib.sha256(prompt.encode("utf-8")).digest()
+        top = tuple(64 + b // 2 for b in digest[:3])
+        bottom = tuple(b // 4 for b in digest[3:6])
+        gradient = Image.linear_gradient("L").resize((IMAGE_SIZE, IMAGE_SIZE))
+        image = Image.composite(Image.new("RGB", gradient.size, bottom), Image.new("RGB", gradient.size, top),
+                                gradient)
+        font = _placeholder_font()
+        lines = textwrap.wrap(prompt, width=36)[:14]
+        draw = ImageDraw.Draw(image)
+        y = (IMAGE_SIZE - 60 * len(lines)) // 2
+        for line in lines:
+            draw.text((IMAGE_SIZE // 2, y), line, fill="white", font=font, anchor="mt")
+            y += 60
+        image.save(image_path, format="JPEG", quality=85)
+
+
+_font = None
+
+
+def _placeholder_font():
+    """The placeholder cards' font, loaded once per process."""
+    global _font
+    if _font is None:
+        from PIL import ImageFont
+
+        try:
+            _font = ImageFont.load_default(size=44)
+        except TypeError:  # Pillow < 10.1 has a single bitmap size
+            _font = ImageFont.load_default()
+    return _font
+
+
+_factories = {
+    "replicate": ReplicateBackend,
+    "selenium": SeleniumBackend,
+    PLACEHOLDER: PlaceholderBackend,
+}
+_backends = {}
+_backends_lock = threading.Lock()
+
+
+def register_backend(name, factory):
+    """Make factory() available as backend `name` in backend chains."""
+    with _backends_lock:
+        _factories[name] = factory
+        _backends.pop(name, None)
+
+
+def get_backend(name):
+    """The process-wide instance of backend `name`."""
+    with _backends_lock:
+        if name not in _backends:
+            if name not in _factories:
+                raise ValueError(f"Unknown image backend {name!r} (known: {', '.join(sorted(_factories))})")
+            _backends[name] = _factories[name]()
+        return _backends[name]
+
+
+def get_chain(names):
+    """Backends for a comma-separated (or list of) backend names, in failover order."""
+    if isinstance(names, str):
+        names = names.split(",")
+    chain = [get_backend(name.strip()) for name in names if name.strip()]
+    if not chain:
+        raise ValueError("At least one image backend is required")
+    return chain
+
+
+def backend_stats():
+    """{name: latency/outcome stats and breaker state} for every backend used so far."""
+    with _backends_lock:
+        backends = dict(_backends)
+    return {name: dict(backend.stats.snapshot(), breaker=backend.breaker.state, breaker_trips=backend.breaker.trips)
+            for name, backend in sorted(backends.items())}
+
+
+def reset_backends():
+    """Close and forget every backend (their stats, breakers and pools)."""
+    global _request_limits
+    with _backends_lock:
+        backends = list(_backends.values())
+        _backends.clear()
+    for backend in backends:
+        backend.close()
+    with _request_limits_lock:
+        _request_limits = None
+
+
+def generate_scene(chain, prompt, image_path, timeout=REQUEST_TIMEOUT):
+    """
+    Make the image for one scene with the first backend in chain that
+    delivers within timeout seconds. Returns the backend used; raises
+    RuntimeError naming every backend's error if none did. Once the deadline
+    has passed only local backends (the placeholder) are tried.
+    """
+    deadline = time.monotonic() + timeout
+    errors = []
+    for position, backend in enumerate(chain):
+        wait_until = None
+        if not backend.local:
+            if time.monotonic() >= deadline:
+                errors.append(f"{backend.name}: skipped, scene deadline passed")
+                continue
+            wait_until = min(deadline, time.monotonic() + backend.trial_wait())
+        if not backend.breaker.allow(wait_until=wait_until):
+            errors.append(f"{backend.name}: circuit open")
+            continue
+        try:
+            if backend.local:
+                _request(backend, prompt, image_path, None)
+            else:
+                _with_retries(backend, prompt, image_path, deadline)
+            return backend
+        except Exception as e:
+            errors.append(f"{backend.name}: {e}")
+            if position + 1 < len(chain):
+                log(f"{backend.name} failed ({e}), falling back to {chain[position + 1].name}", level="warning",
+                    backend=backend.name)
+    raise RuntimeError("; ".join(errors))
+
+
+def _request(backend, prompt, path, deadline, hedge=False, outstanding=None):
+    """
+    One traced request to backend, feeding its stats and breaker. Remote
+    requests first wait (up to the deadline) for a machine-wide image slot;
+    running out of time there is not held against the backend. Once
+    `outstanding` (see _Outstanding) is abandoned, the slot has been given
+    back and the outcome no longer counts towards the breaker.
+    """
+    slot = None if backend.local else get_admission().acquire("images", deadline)
+    if slot is not None and outstanding is not None and not outstanding.hold(slot):
+        raise TimeoutError("request abandoned before it started")
+    try:
+        backend.stats.add("requests")
+        started = time.monotonic()
+        try:
+            with span(f"backend.{backend.name}", hedge=hedge):
+                backend.generate(prompt, path, deadline)
+        except Exception:
+            backend.stats.add("errors")
+            if not (outstanding is not None and outstanding.abandoned) and backend.breaker.failure():
+                log(f"Circuit breaker for {backend.name} opened", level="warning", backend=backend.name)
+            raise
+        backend.stats.record(time.monotonic() - started)
+        if not (outstanding is not None and outstanding.abandoned):
+            backend.breaker.success()
+    finally:
+        if slot is not None:
+            if outstanding is not None:
+                outstanding.release(slot)
+            else:
+                slot.release()
+
+
+class _Outstanding:
+    """
+    The requests _hedged has out for one scene. Once it stops waiting for
+    them (one won, or the deadline passed) they are abandoned: their image
+    slots are given back at once, since the threads cannot be stopped, and
+    what they do later is not held for or against the backend.
+    """
+
+    def __init__(self):
+        self.abandoned = False
+        self._slots = set()
+        self._lock = threading.Lock()
+
+    def hold(self, slot):
+        """Track a request's slot; releases it and returns False if already abandoned."""
+        with self._lock:
+            if not self.abandoned:
+                self._slots.add(slot)
+                return True
+        slot.release()
+        return False
+
+    def release(self, slot):
+        with self._lock:
+            if slot not in self._slots:
+                return  # abandon() gave it back
+            self._slots.discard(slot)
+        slot.release()
+
+    def abandon(self):
+        with self._lock:
+            self.abandoned = True
+            slots, self._slots = self._slots, set()
+        for slot in slots:
+            slot.release()
+
+
+def _with_retries(backend, prompt, image_path, deadline):
+    for attempt in range(1, backend.attempts + 1):
+        try:
+            return _hedged(backend, prompt, image_path, deadline)
+        except TimeoutError:
+            raise
+        except Exception as e:
+            backoff = RETRY_BACKOFF * 2 ** (attempt - 1)
+            if attempt == backend.attempts or deadline - time.monotonic() <= backoff or not backend.breaker.allow():
+                raise
+            log(f"{backend.name} attempt {attempt}/{backend.attempts} failed: {e}", level="warning",
+                backend=backend.name, attempt=attempt)
+            time.sleep(backoff)
+
+
+def _hedged(backend, prompt, image_path, deadline):
+    """
+    Run the request, adding one duplicate if it outlives the backend's p95
+    latency. Each request writes its own file; the first to succeed is moved
+    to image_path and late finishers are discarded, along with their slots.
+    """
+    done = threading.Condition()
+    state = {"launched": 0, "errors": [], "winner": None}
+    outstanding = _Outstanding()
+
+    def request(n, path):
+        try:
+            _request(backend, prompt, path, deadline, hedge=n > 0, outstanding=outstanding)
+        except Exception as e:
+            with done:
+                state["errors"].append(e)
+                done.notify_all()
+            _remove_quietly(path)
+            return
+        with done:
+            if state["winner"] is None and not outstanding.abandoned:
+                os.replace(path, image_path)
+                state["winner"] = n
+            else:
+                _remove_quietly(path)
+            done.notify_all()
+
+    def launch():
+        n = state["launched"]
+        state["launched"] += 1
+        context = contextvars.copy_context()  # keeps the scene span as the parent
+        threading.Thread(target=context.run, args=(request, n, f"{image_path}.try{n}"),
+                         name=f"{backend.name}-request", daemon=True).start()
+
+    hedge_delay = backend.hedge_after()
+    hedge_at = time.monotonic() + hedge_delay if hedge_delay is not None else None
+    with done:
+        launch()
+        while True:
+            if state["winner"] is not None:
+                outstanding.abandon()  # a hedge still running gives its slot back
+                if state["winner"] > 0:
+                    backend.stats.add("hedge_wins")
+                return image_path
+            if len(state["errors"]) == state["launched"]:
+                raise state["errors"][-1]
+            now = time.monotonic()
+            if now >= deadline:
+                outstanding.abandon()
+                backend.stats.add("timeouts")
+                if backend.breaker.failure():
+                    log(f"Circuit breaker for {backend.name} opened", level="warning", backend=backend.name)
+                raise TimeoutError("no image within the scene deadline")
+            if hedge_at is not None and now >= hedge_at:
+                hedge_at = None
+                backend.stats.add("hedges")
+                launch()
+                continue
+            done.wait(min(deadline, hedge_at or deadline) - now)
+
+
+def _remove_quietly(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
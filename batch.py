@@ -0,0 +1,128 @@
+"""
+Render many diary entries from the command line, without Streamlit.
+
+Entries come from a directory of text files named after their date
+(2024-01-31.txt) or from a JSONL file of {"date": ..., "text": ...} lines.
+They are queued in a job database of their own, so an interrupted batch
+resumes where it stopped and finished entries are skipped on the next run.
+Several entries render side by side in this process and share its Replicate,
+TTS and browser limits, while videos are encoded in a process pool sized to
+the machine's cores:
+
+    python batch.py entries.jsonl --app replicate --parallel 4
+    python batch.py ./diary_texts --app selenium --encoders 2
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from jobs import claim_job, connect, execute_job, get_job, requeue_stale_jobs, submit_job
+from telemetry import log
+
+DB_NAME = "vision_diary_batch.sqlite3"
+ENTRY_EXTENSIONS = (".txt", ".md")
+
+
+def load_entries(source):
+    """Return [(date, text)] from a directory of <date>.txt files or a JSONL file."""
+    entries = []
+    if os.path.isdir(source):
+        for name in sorted(os.listdir(source)):
+            date, extension = os.path.splitext(name)
+            if extension in ENTRY_EXTENSIONS:
+                with open(os.path.join(source, name), encoding="utf-8") as f:
+                    entries.append((date, f.read()))
+    else:
+        with open(source, encoding="utf-8") as f:
+            for line_number, line in enumerate(f, 1):
+                if not line.strip():
+                    continue
+                try:
+                    record = json.loads(line)
+                    entries.append((str(record["date"]), record["text"]))
+                except (ValueError, KeyError) as e:
+                    raise ValueError(f"{source}:{line_number}: expected {{\"date\", \"text\"}} ({e})")
+    return [(date, text) for date, text in entries if text.strip()]
+
+
+def run_batch(entries, app, db_path, parallel=4, encoders=None):
+    """Render every entry not rendered yet and return a throughput summary."""
+    encoders = encoders or os.cpu_count() or 1
+    # Several encodes run at once, so split the cores between them instead of each taking all
+    os.environ.setdefault("VISION_DIARY_X264_THREADS", str(max(1, (os.cpu_count() or 1) // encoders)))
+    # Nobody watches a batch render, so skip the draft preview encode
+    os.environ.setdefault("VISION_DIARY_PREVIEW", "0")
+
+    connect(db_path).close()
+    requeue_stale_jobs(db_path)  # entries that were running when a previous batch stopped
+    jobs = [submit_job(app, date, text, db_path) for date, text in entries]
+    skipped = sum(job["status"] == "done" for job in jobs)
+    log(f"{len(jobs)} entries, {skipped} already rendered, {len(jobs) - skipped} to render")
+
+    started, started_at = time.monotonic(), time.time()
+    with ProcessPoolExecutor(max_workers=encoders, mp_context=multiprocessing.get_context("spawn")) as pool:
+        def worker():
+            while True:
+                job = claim_job(db_path)
+                if job is None:
+                    return
+                log(f"Rendering {job['entry_date']} ({job['id']})", job=job["id"])
+                execute_job(job, db_path, encode_executor=pool)
+
+        threads = [threading.Thread(target=worker, name=f"batch-{i}", daemon=True) for i in range(max(1, parallel))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            while thread.is_alive():
+                thread.join(timeout=0.5)  # wake up regularly so Ctrl-C is handled
+    elapsed = time.monotonic() - started
+    return summarize([get_job(job["id"], db_path) for job in jobs], skipped, started_at, elapsed)
+
+
+def summarize(jobs, skipped, started_at, elapsed):
+    rendered = [job for job in jobs if job["status"] == "done" and (job["started_at"] or 0) >= started_at]
+    failed = [job for job in jobs if job["status"] == "failed"]
+    stage_totals = {}
+    for job in rendered:
+        for stage, seconds in job["result"].get("stage_seconds", {}).items():
+            stage_totals.setdefault(stage, []).append(seconds)
+    return {
+        "entries": len(jobs),
+        "skipped": skipped,
+        "rendered": len(rendered),
+        "failed": len(failed),
+        "failures": {job["entry_date"]: job["error"] for job in failed},
+        "wall_seconds": round(elapsed, 2),
+        "entries_per_minute": round(len(rendered) / elapsed * 60, 2) if elapsed and rendered else 0.0,
+        "mean_stage_seconds": {stage: round(sum(times) / len(times), 2)
+                               for stage, times in sorted(stage_totals.items())},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Render Vision Diary entries in bulk.")
+    parser.add_argument("source", help="directory of <date>.txt files, or a JSONL file of {date, text}")
+    parser.add_argument("--app", choices=("replicate", "selenium"), default="replicate")
+    parser.add_argument("--parallel", type=int, default=4, help="entries rendering at once")
+    parser.add_argument("--encoders", type=int, default=None, help="encoder processes (default: one per core)")
+    parser.add_argument("--db", default=None, help=f"batch state database (default: ./{DB_NAME})")
+    parser.add_argument("--workdir", default=".", help="where the entry directories are written")
+    args = parser.parse_args()
+
+    entries = load_entries(args.source)
+    os.chdir(args.workdir)
+    try:
+        summary = run_batch(entries, args.app, args.db or DB_NAME, args.parallel, args.encoders)
+    except KeyboardInterrupt:
+        print("Interrupted; run the same command again to resume.")
+        raise SystemExit(130)
+    print(json.dumps(summary, indent=2))
+
+
+if __name__ == "__main__":
+    main()
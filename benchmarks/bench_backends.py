@@ -0,0 +1,118 @@
+"""
+Tail latency of the image stage with and without hedged requests, and
+failover during an outage, against the local stand-in services.
+
+Each entry generates `--scenes` fresh prompts through the replicate →
+placeholder chain, so its image stage lasts as long as its slowest scene.
+The fake prediction API sends `--slow-rate` of requests into a
+`--slow-latency` second tail. After warm-up entries (hedging needs a p95 to
+work from), the same entries run with hedging off and on; the outage run
+then fails every prediction to show the breaker opening, scenes falling
+back to placeholders, and the breaker closing again once the service is
+back. Prints JSON.
+
+    python benchmarks/bench_backends.py --entries 10 --scenes 8 --slow-rate 0.05
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import uuid
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCH_DIR)
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+from bench_pipeline import percentiles  # noqa: E402
+from fakes import FakeServices  # noqa: E402
+
+
+def run_entries(render, backends, workdir, entries, scenes):
+    """Generate `entries` entries of fresh prompts; returns their image-stage seconds and scene sources."""
+    chain = backends.get_chain("replicate,placeholder")
+    seconds, sources = [], {}
+    for _ in range(entries):
+        entry = uuid.uuid4().hex[:8]
+        prompts = [f"Scene {i} of entry {entry}: a quiet walk by the river" for i in range(scenes)]
+        directory = os.path.join(workdir, entry)
+        os.makedirs(directory)
+        scene_sources = {}
+        started = time.perf_counter()
+        render.generate_scene_images(prompts, directory, chain, max_concurrency=scenes, sources=scene_sources)
+        seconds.append(time.perf_counter() - started)
+        for source in scene_sources.values():
+            sources[source] = sources.get(source, 0) + 1
+    return seconds, sources
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure hedging and failover of the image backends.")
+    parser.add_argument("--entries", type=int, default=10)
+    parser.add_argument("--scenes", type=int, default=8)
+    parser.add_argument("--latency", type=float, default=0.5, help="typical fake prediction latency (s)")
+    parser.add_argument("--jitter", type=float, default=0.1)
+    parser.add_argument("--slow-rate", type=float, default=0.05, help="share of predictions in the slow tail")
+    parser.add_argument("--slow-latency", type=float, default=6.0)
+    parser.add_argument("--timeout", type=float, default=20.0, help="per-scene deadline (s)")
+    parser.add_argument("--output", help="write JSON here instead of stdout")
+    args = parser.parse_args()
+
+    with FakeServices(latency=args.latency, jitter=args.jitter, slow_rate=args.slow_rate,
+                      slow_latency=args.slow_latency, seed=1) as services, \
+            tempfile.TemporaryDirectory(prefix="bench_backends_") as workdir:
+        # Configure before importing render: its settings are read at import time
+        os.environ.update(services.env())
+        os.environ.update({
+            "VISION_DIARY_CACHE_DIR": os.path.join(workdir, "image-cache"),
+            "VISION_DIARY_REQUESTS_PER_SECOND": "1000",
+            "VISION_DIARY_MAX_CONCURRENCY": str(args.scenes),
+            "VISION_DIARY_REQUEST_TIMEOUT": str(args.timeout),
+            "VISION_DIARY_BREAKER_COOLDOWN": "2",
+        })
+        import backends
+        import render
+
+        report = {"scenes_per_entry": args.scenes, "slow_rate": args.slow_rate,
+                  "slow_latency": args.slow_latency, "runs": []}
+        for hedge in (False, True):
+            print(f"hedging {'on' if hedge else 'off'}...", file=sys.stderr)
+            backends.reset_backends()
+            backends.HEDGE = hedge
+            run_entries(render, backends, workdir, 3, args.scenes)  # warm-up: learn the p95
+            requests_before = services.requests["predictions"]
+            seconds, sources = run_entries(render, backends, workdir, args.entries, args.scenes)
+            report["runs"].append({
+                "hedge": hedge,
+                "entry_image_seconds": percentiles(seconds),
+                "predictions_per_scene": round((services.requests["predictions"] - requests_before)
+                                               / (args.entries * args.scenes), 3),
+                "scene_sources": sources,
+                "backend_stats": backends.backend_stats()["replicate"],
+            })
+
+        print("outage...", file=sys.stderr)
+        services.failure_rate = 1.0
+        seconds, sources = run_entries(render, backends, workdir, 2, args.scenes)
+        outage = {"entry_image_seconds": percentiles(seconds), "scene_sources": sources,
+                  "breaker": backends.backend_stats()["replicate"]["breaker"]}
+        services.failure_rate = 0.0
+        time.sleep(2.5)  # past the breaker cooldown
+        seconds, sources = run_entries(render, backends, workdir, 1, args.scenes)
+        outage["recovered_sources"] = sources
+        outage["breaker_after_recovery"] = backends.backend_stats()["replicate"]["breaker"]
+        outage["breaker_trips"] = backends.backend_stats()["replicate"]["breaker_trips"]
+        report["outage"] = outage
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""
+Run the batch CLI against the local stand-in services.
+
+Writes a JSONL file of synthetic entries, starts `batch.py` with the fakes
+from fakes.py configured, optionally kills it part way through, and runs it
+again to check that the batch resumes (finished entries are skipped) and
+ends with every entry rendered. Prints each run's summary as JSON.
+
+    python benchmarks/bench_batch.py --entries 12 --parallel 4 --interrupt-after 5
+"""
+
+import argparse
+import json
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+from bench_pipeline import make_story  # noqa: E402
+from fakes import FakeServices  # noqa: E402
+
+
+def run_cli(args, env, interrupt_after=None):
+    process = subprocess.Popen([sys.executable, os.path.join(REPO_DIR, "batch.py")] + args, env=env,
+                               stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+    if interrupt_after is not None:
+        try:
+            process.wait(timeout=interrupt_after)
+        except subprocess.TimeoutExpired:
+            process.send_signal(signal.SIGKILL)  # simulate a crash, not a clean Ctrl-C
+            process.wait()
+            return None
+    output, _ = process.communicate()
+    if process.returncode != 0:
+        raise RuntimeError(f"batch.py exited with {process.returncode}")
+    # The summary is the JSON object at the end of stdout
+    return json.loads(output[output.rindex("\n{") + 1:] if "\n{" in output else output)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Exercise batch.py against local fakes.")
+    parser.add_argument("--entries", type=int, default=12)
+    parser.add_argument("--sentences", type=int, default=6)
+    parser.add_argument("--parallel", type=int, default=4)
+    parser.add_argument("--encoders", type=int, default=None)
+    parser.add_argument("--latency", type=float, default=1.0)
+    parser.add_argument("--interrupt-after", type=float, default=None, help="kill the first run after N seconds")
+    args = parser.parse_args()
+
+    with FakeServices(latency=args.latency) as services, \
+            tempfile.TemporaryDirectory(prefix="bench_batch_") as workdir:
+        source = os.path.join(workdir, "entries.jsonl")
+        with open(source, "w") as f:
+            for i in range(args.entries):
+                f.write(json.dumps({"date": f"2024-01-{i + 1:02d}",
+                                    "text": make_story(args.sentences, f"batch-{i}-{time.time_ns()}")}) + "\n")
+
+        env = dict(os.environ, **services.env())
+        env.update({
+            "PYTHONPATH": os.pathsep.join([REPO_DIR, BENCH_DIR]),
+            "VISION_DIARY_CACHE_DIR": os.path.join(workdir, "image-cache"),
+            "VISION_DIARY_TTS_CACHE_DIR": os.path.join(workdir, "tts-cache"),
+            "VISION_DIARY_REQUESTS_PER_SECOND": "1000",
+        })
+        cli_args = [source, "--workdir", workdir, "--parallel", str(args.parallel)]
+        if args.encoders:
+            cli_args += ["--encoders", str(args.encoders)]
+
+        runs = []
+        if args.interrupt_after is not None:
+            print(f"First run, killed after {args.interrupt_after}s...", file=sys.stderr)
+            runs.append(run_cli(cli_args, env, args.interrupt_after))
+        print("Running batch...", file=sys.stderr)
+        runs.append(run_cli(cli_args, env))
+        print("Running again (everything should be skipped)...", file=sys.stderr)
+        runs.append(run_cli(cli_args, env))
+
+    print(json.dumps({"fake_requests": dict(services.requests), "runs": runs}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""
+Compare the ffmpeg still-image encoder against the MoviePy per-frame path.
+
+Generates synthetic 1024x1024 scenes and a narration track, encodes them with
+both backends and prints wall time and CPU seconds (this process plus child
+processes such as ffmpeg) as JSON.
+
+    python benchmarks/bench_encoder.py --scenes 8 --seconds 40
+"""
+
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from encoder import encode_stills, ffmpeg_binary, probe_duration  # noqa: E402
+
+
+def make_scenes(directory, count, size=1024):
+    rng = np.random.default_rng(0)
+    paths = []
+    for i in range(count):
+        gradient = np.linspace(0, 255, size, dtype=np.uint8)
+        pixels = np.stack([np.tile(gradient, (size, 1)), np.tile(gradient[:, None], (1, size)),
+                           np.full((size, size), (i * 37) % 256, dtype=np.uint8)], axis=-1)
+        pixels = np.clip(pixels + rng.integers(0, 24, pixels.shape, dtype=np.uint8), 0, 255)
+        path = os.path.join(directory, f"generated_image_{i+1}.jpg")
+        Image.fromarray(pixels.astype(np.uint8)).save(path, quality=90)
+        paths.append(path)
+    return paths
+
+
+def make_audio(path, seconds):
+    subprocess.run([ffmpeg_binary(), "-y", "-loglevel", "error", "-f", "lavfi",
+                    "-i", f"sine=frequency=220:duration={seconds}", "-ac", "1", "-b:a", "64k", path],
+                   check=True)
+
+
+def moviepy_encode(images, audio_path, video_path):
+    """The original create_video: ImageSequenceClip rendered at 24 fps."""
+    from moviepy.editor import ImageSequenceClip, AudioFileClip
+
+    audio = AudioFileClip(audio_path)
+    duration_per_image = audio.duration / len(images)
+    clip = ImageSequenceClip(images, durations=[duration_per_image] * len(images))
+    clip.set_audio(audio).write_videofile(video_path, codec="libx264", fps=24, logger=None)
+
+
+def ffmpeg_encode(images, audio_path, video_path):
+    duration_per_image = probe_duration(audio_path) / len(images)
+    encode_stills(images, [duration_per_image] * len(images), audio_path, video_path)
+
+
+def cpu_seconds():
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return own.ru_utime + own.ru_stime + children.ru_utime + children.ru_stime
+
+
+def measure(name, encode, images, audio_path, workdir):
+    video_path = os.path.join(workdir, f"{name}.mp4")
+    cpu_before, wall_before = cpu_seconds(), time.perf_counter()
+    encode(images, audio_path, video_path)
+    return {
+        "backend": name,
+        "wall_seconds": round(time.perf_counter() - wall_before, 3),
+        "cpu_seconds": round(cpu_seconds() - cpu_before, 3),
+        "output_bytes": os.path.getsize(video_path),
+        "output_duration": round(probe_duration(video_path), 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--scenes", type=int, default=8)
+    parser.add_argument("--seconds", type=float, default=40.0, help="narration length")
+    parser.add_argument("--backends", default="ffmpeg,moviepy")
+    args = parser.parse_args()
+
+    encoders = {"ffmpeg": ffmpeg_encode, "moviepy": moviepy_encode}
+    with tempfile.TemporaryDirectory(prefix="bench_encoder_") as workdir:
+        images = make_scenes(workdir, args.scenes)
+        audio_path = os.path.join(workdir, "story_audio.mp3")
+        make_audio(audio_path, args.seconds)
+        results = [measure(name, encoders[name], images, audio_path, workdir)
+                   for name in args.backends.split(",")]
+    print(json.dumps({"scenes": args.scenes, "seconds": args.seconds, "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
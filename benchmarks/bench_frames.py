@@ -0,0 +1,102 @@
+"""
+Peak memory of the MoviePy frame sources for long entries.
+
+For each scene count, a fresh child process builds the clip the way
+create_video used to (every scene decoded to an array up front, handed to
+ImageSequenceClip) or with frames.StreamingFrames, then pulls every frame in
+time order as the encoder would. Peak RSS above the post-import baseline is
+reported as JSON.
+
+    python benchmarks/bench_frames.py --scenes 8,32,128
+"""
+
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCH_DIR)
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+from bench_encoder import make_scenes  # noqa: E402
+
+
+def peak_rss_mb():
+    # ru_maxrss is KiB on Linux and bytes on macOS
+    scale = 1 if platform.system() == "Darwin" else 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale / 1e6
+
+
+def run_source(source, images, seconds_per_scene, fps):
+    """Build the clip and read every frame; runs in a child process."""
+    import numpy as np
+    from moviepy.editor import ImageSequenceClip
+    from PIL import Image
+
+    from frames import StreamingFrames
+
+    def load_frame(path):
+        # Each scene decoded up front, as create_video used to
+        with Image.open(path) as image:
+            return np.asarray(image.convert("RGB"))
+
+    durations = [seconds_per_scene] * len(images)
+    baseline = peak_rss_mb()
+    started = time.perf_counter()
+    if source == "arrays":
+        clip = ImageSequenceClip([load_frame(path) for path in images], durations=durations)
+    else:
+        clip = StreamingFrames(images, durations).clip()
+    checksum = 0
+    for frame in clip.iter_frames(fps=fps):
+        checksum += int(np.asarray(frame)[0, 0, 0])
+    return {
+        "source": source,
+        "scenes": len(images),
+        "seconds": round(time.perf_counter() - started, 3),
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+        "peak_rss_over_baseline_mb": round(peak_rss_mb() - baseline, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure peak memory of the MoviePy frame sources.")
+    parser.add_argument("--scenes", default="8,32,128")
+    parser.add_argument("--sources", default="arrays,streaming")
+    parser.add_argument("--seconds-per-scene", type=float, default=0.5)
+    parser.add_argument("--fps", type=float, default=4)
+    parser.add_argument("--child", nargs=2, metavar=("SOURCE", "IMAGE_DIR"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        source, image_dir = args.child
+        images = sorted((os.path.join(image_dir, name) for name in os.listdir(image_dir)),
+                        key=lambda path: int(path.rsplit("_", 1)[1].split(".")[0]))
+        print(json.dumps(run_source(source, images, args.seconds_per_scene, args.fps)))
+        return
+
+    results = []
+    with tempfile.TemporaryDirectory(prefix="bench_frames_") as workdir:
+        for count in (int(c) for c in args.scenes.split(",")):
+            image_dir = os.path.join(workdir, str(count))
+            os.makedirs(image_dir)
+            make_scenes(image_dir, count)
+            for source in args.sources.split(","):
+                print(f"{source}: {count} scenes...", file=sys.stderr)
+                output = subprocess.run(
+                    [sys.executable, os.path.abspath(__file__), "--child", source, image_dir,
+                     "--seconds-per-scene", str(args.seconds_per_scene), "--fps", str(args.fps)],
+                    stdout=subprocess.PIPE, check=True, text=True,
+                ).stdout
+                results.append(json.loads(output.strip().splitlines()[-1]))
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
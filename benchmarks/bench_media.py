@@ -0,0 +1,132 @@
+"""
+Memory and latency of delivering a rendered video through the media server
+versus reading it into the Streamlit process, plus the archive index's page
+query as the number of entries grows.
+
+The "read" case is what st.video(path) / st.download_button(data=file) did:
+the whole MP4 read into a bytes object per viewer. The "server" case plays
+the same video the way a browser does: a HEAD, a first range, a seek near
+the end, a revalidation with If-None-Match. Python allocations are measured
+with tracemalloc around each case. Prints JSON.
+
+    python benchmarks/bench_media.py --size-mb 64 --viewers 4 --entries 100000
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+import urllib.request
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCH_DIR)
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+import archive  # noqa: E402
+from media_server import MediaServer  # noqa: E402
+
+
+def fetch(url, method="GET", **headers):
+    request = urllib.request.Request(url, method=method, headers=headers)
+    try:
+        with urllib.request.urlopen(request) as response:
+            return response.status, dict(response.headers), response.read()
+    except urllib.error.HTTPError as e:
+        return e.code, dict(e.headers), b""
+
+
+def measure(work):
+    tracemalloc.start()
+    started = time.perf_counter()
+    result = work()
+    seconds = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, {"seconds": round(seconds, 4), "peak_python_mb": round(peak / 1e6, 2)}
+
+
+def play(url, size):
+    """The requests a browser's video element makes to start playing and seek."""
+    statuses = []
+    status, headers, _ = fetch(url, "HEAD")
+    statuses.append(status)
+    status, headers, body = fetch(url, Range="bytes=0-65535")
+    statuses.append(status)
+    assert len(body) == 65536 and headers["Content-Range"] == f"bytes 0-65535/{size}"
+    status, _, body = fetch(url, Range=f"bytes={size - 1_000_000}-")
+    statuses.append(status)
+    assert len(body) == 1_000_000
+    status, _, _ = fetch(url, **{"If-None-Match": headers["ETag"]})
+    statuses.append(status)
+    return statuses
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare in-process video reads with the media server.")
+    parser.add_argument("--size-mb", type=int, default=64)
+    parser.add_argument("--viewers", type=int, default=4)
+    parser.add_argument("--entries", type=int, default=100000, help="archive rows for the page query")
+    parser.add_argument("--output", help="write JSON here instead of stdout")
+    args = parser.parse_args()
+
+    report = {"video_mb": args.size_mb, "viewers": args.viewers}
+    with tempfile.TemporaryDirectory(prefix="bench_media_") as workdir:
+        video_path = os.path.join(workdir, "entry", "vision_diary.mp4")
+        os.makedirs(os.path.dirname(video_path))
+        with open(video_path, "wb") as f:
+            for _ in range(args.size_mb):
+                f.write(os.urandom(1 << 20))
+        size = os.path.getsize(video_path)
+
+        def read_whole():
+            copies = []
+            for _ in range(args.viewers):
+                with open(video_path, "rb") as f:
+                    copies.append(f.read())
+            return len(copies)
+
+        _, report["read_into_process"] = measure(read_whole)
+
+        server = MediaServer(workdir, port=0).start()
+        try:
+            url = server.url_for(video_path)
+            statuses, report["media_server"] = measure(lambda: [play(url, size) for _ in range(args.viewers)])
+            report["media_server"]["statuses"] = statuses[0]
+            report["media_server"]["bytes_sent"] = server.stats["bytes_sent"]
+            report["rejected"] = {
+                "traversal": fetch(server.base_url + "/media/../../etc/passwd")[0],
+                "not_media": fetch(server.base_url + "/media/" + os.path.basename(workdir))[0],
+                "unsatisfiable_range": fetch(url, Range=f"bytes={size}-")[0],
+            }
+        finally:
+            server.close()
+
+        # The history page's query on a large index: first page and a deep page
+        db_path = os.path.join(workdir, "archive.sqlite3")
+        conn = archive.connect(db_path)
+        conn.executemany(
+            "INSERT INTO entries (app, entry_date, text_hash, video_path, images, rendered_at) VALUES (?, ?, '', '', '[]', 0)",
+            [("replicate", f"{1000 + i // 365:04d}-{i % 365:03d}") for i in range(args.entries)],
+        )
+        conn.close()
+        page_seconds = {}
+        for name, before in (("first_page", None), ("deep_page", f"{1000 + args.entries // 730:04d}-000")):
+            started = time.perf_counter()
+            for _ in range(100):
+                archive.list_entries("replicate", limit=10, before=before, db_path=db_path)
+            page_seconds[name] = round((time.perf_counter() - started) / 100 * 1000, 3)
+        report["archive_page_ms"] = {"entries": args.entries, **page_seconds}
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,188 @@
+"""
+End-to-end pipeline benchmark against local stand-in services.
+
+Boots the fakes from fakes.py (Replicate-style prediction API, image host,
+offline TTS, stub generator page), then renders synthetic diary entries of
+several sizes at several concurrency levels through the real render stages
+and writes per-stage latency percentiles, throughput, peak RSS and CPU time
+as JSON so runs can be diffed across commits.
+
+    python benchmarks/bench_pipeline.py --sizes 4,8,16 --concurrency 1,4,8 \\
+        --latency 1.0 --failure-rate 0.05 --output bench.json
+
+The Selenium app (--apps selenium) needs Chrome and ChromeDriver installed.
+"""
+
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCH_DIR)
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+from fakes import FakeServices  # noqa: E402
+
+PEOPLE = ["my sister", "an old neighbour", "the baker", "two cyclists", "a street musician", "my best friend",
+          "the mail carrier", "a painter", "some tourists", "my grandfather", "a fisherman", "the librarian"]
+ACTIONS = ["shared lemonade", "fixed a kite", "sang folk songs", "painted murals", "fed pigeons",
+           "raced paper boats", "built a snowman", "read poetry", "planted tulips", "flew drones", "baked bread"]
+PLACES = ["beside the lake", "under the bridge", "in the meadow", "on the rooftop", "at the harbour",
+          "near the castle", "inside the greenhouse", "along the canal", "by the lighthouse", "at the station"]
+
+
+def make_story(sentence_count, salt):
+    """
+    A story of sentence_count distinct sentences (so the planner keeps one
+    scene per sentence). Every sentence carries the salt, so no image or
+    narration cache entry from another salt matches.
+    """
+    sentences = [f"I met {PEOPLE[i % len(PEOPLE)]} and we {ACTIONS[i % len(ACTIONS)]} "
+                 f"{PLACES[i % len(PLACES)]} on day {salt}" for i in range(sentence_count)]
+    return ". ".join(sentences) + "."
+
+
+def percentiles(values):
+    if not values:
+        return {}
+    ordered = sorted(values)
+
+    def pick(q):
+        return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))], 4)
+
+    return {"p50": pick(0.50), "p90": pick(0.90), "p99": pick(0.99), "max": round(ordered[-1], 4),
+            "mean": round(sum(ordered) / len(ordered), 4), "count": len(ordered)}
+
+
+def cpu_seconds():
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return own.ru_utime + own.ru_stime + children.ru_utime + children.ru_stime
+
+
+def peak_rss_mb():
+    # ru_maxrss is KiB on Linux and bytes on macOS
+    scale = 1 if platform.system() == "Darwin" else 1024
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * scale
+    return round(own / 1e6, 1), round(children / 1e6, 1)
+
+
+def run_config(render, app, size, concurrency, repeat):
+    """Render `repeat` entries and collect per-stage timings."""
+    import backends  # already imported by render, after the environment was configured
+
+    # Fresh backends (stats, breakers, request limits, browser pool) sized for this concurrency level
+    backends.reset_backends()
+    backends.MAX_CONCURRENT_REQUESTS = concurrency
+    backends.BROWSER_POOL_SIZE = concurrency
+    stage_times = {}
+    entry_times = []
+    preview_times, final_times = [], []
+    scene_sources = {}
+    failures = 0
+    cpu_before = cpu_seconds()
+    started = time.perf_counter()
+    for i in range(repeat):
+        story = make_story(size, f"{app}-{size}-{concurrency}-{i}-{time.time_ns()}")
+        entry_started = time.perf_counter()
+        try:
+            result = render.render_entry(app, f"bench-{app}-{size}-{concurrency}-{i}", story)
+        except Exception as e:
+            failures += 1
+            print(f"Entry failed: {e}", file=sys.stderr)
+            continue
+        entry_times.append(time.perf_counter() - entry_started)
+        for stage, seconds in result["stage_seconds"].items():
+            stage_times.setdefault(stage, []).append(seconds)
+        if "time_to_preview" in result["stats"]:
+            preview_times.append(result["stats"]["time_to_preview"])
+        final_times.append(result["stats"]["time_to_final"])
+        for source, count in result["stats"]["backends"].items():
+            scene_sources[source] = scene_sources.get(source, 0) + count
+    elapsed = time.perf_counter() - started
+    return {
+        "app": app,
+        "sentences": size,
+        "concurrency": concurrency,
+        "entries": repeat,
+        "failed_entries": failures,
+        "entry_seconds": percentiles(entry_times),
+        "stages": {stage: percentiles(times) for stage, times in sorted(stage_times.items())},
+        "time_to_preview": percentiles(preview_times),
+        "time_to_final": percentiles(final_times),
+        "scene_sources": scene_sources,
+        "backend_stats": backends.backend_stats(),
+        "throughput_entries_per_minute": round(len(entry_times) / elapsed * 60, 3) if elapsed else None,
+        "cpu_seconds": round(cpu_seconds() - cpu_before, 3),
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BENCH_DIR, capture_output=True,
+                              text=True).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the render pipeline against local fakes.")
+    parser.add_argument("--apps", default="replicate", help="comma separated: replicate,selenium")
+    parser.add_argument("--sizes", default="4,8", help="sentences per entry")
+    parser.add_argument("--concurrency", default="1,4", help="max in-flight image requests")
+    parser.add_argument("--repeat", type=int, default=3, help="entries per configuration")
+    parser.add_argument("--latency", type=float, default=1.0, help="mean fake prediction latency (s)")
+    parser.add_argument("--jitter", type=float, default=0.25)
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--output", help="write JSON here instead of stdout")
+    args = parser.parse_args()
+    output_path = os.path.abspath(args.output) if args.output else None
+
+    with FakeServices(latency=args.latency, jitter=args.jitter, failure_rate=args.failure_rate) as services, \
+            tempfile.TemporaryDirectory(prefix="bench_pipeline_") as workdir:
+        # Configure before importing render: its settings are read at import time
+        os.environ.update(services.env())
+        os.environ.update({
+            "VISION_DIARY_CACHE_DIR": os.path.join(workdir, "image-cache"),
+            "VISION_DIARY_TTS_CACHE_DIR": os.path.join(workdir, "tts-cache"),
+            "VISION_DIARY_REQUESTS_PER_SECOND": "1000",
+        })
+        os.chdir(workdir)
+        import render
+
+        results = []
+        for app in args.apps.split(","):
+            for size in (int(s) for s in args.sizes.split(",")):
+                for concurrency in (int(c) for c in args.concurrency.split(",")):
+                    print(f"{app}: {size} sentences, concurrency {concurrency}...", file=sys.stderr)
+                    results.append(run_config(render, app, size, concurrency, args.repeat))
+
+        rss_self, rss_children = peak_rss_mb()
+        report = {
+            "revision": git_revision(),
+            "python": platform.python_version(),
+            "fake_latency": args.latency,
+            "fake_failure_rate": args.failure_rate,
+            "fake_requests": dict(services.requests),
+            "peak_rss_mb": rss_self,
+            "peak_child_rss_mb": rss_children,
+            "runs": results,
+        }
+
+    output = json.dumps(report, indent=2)
+    if output_path:
+        with open(output_path, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
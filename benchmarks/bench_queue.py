@@ -0,0 +1,122 @@
+"""
+Fair queueing, admission control and per-job workspaces under several users.
+
+One "batch" session submits `--burst` entries, then an interactive user
+submits a single entry and two more users render the same date with
+different text. `--workers` worker processes (the real ones from jobs.py)
+then work through the queue against the local fakes. This runs twice: once
+with every job in one shared session, which is the old oldest-first order,
+and once with a session per user. It reports the interactive job's queue
+wait against the position and ETA it was shown, the encoder slot waits, and
+whether the contested date ended up with a manifest that matches its files.
+Prints JSON.
+
+    python benchmarks/bench_queue.py --workers 2 --burst 8 --scenes 4
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCH_DIR)
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+from bench_pipeline import make_story, percentiles  # noqa: E402
+from fakes import FakeServices  # noqa: E402
+
+
+def run_mode(jobs, manifest, encoder, fair, args, workdir):
+    db_path = os.path.join(workdir, f"jobs-{'fair' if fair else 'shared'}.sqlite3")
+    prefix = "fair" if fair else "shared"
+
+    def session(name):
+        return name if fair else None
+
+    submitted = [jobs.submit_job("replicate", f"{prefix}-batch-{i}", make_story(args.scenes, f"{prefix}{i}"),
+                                 db_path, session=session("batch")) for i in range(args.burst)]
+    user = jobs.submit_job("replicate", f"{prefix}-user", make_story(args.scenes, f"{prefix}-user"), db_path,
+                           session=session("user"))
+    contested = [jobs.submit_job("replicate", f"{prefix}-shared-date", make_story(args.scenes, f"{prefix}-{name}"),
+                                 db_path, session=session(name)) for name in ("alice", "bob")]
+    shown = jobs.get_job(user["id"], db_path)
+
+    started = time.monotonic()
+    workers = jobs.start_workers(args.workers, db_path)
+    all_jobs = submitted + [user] + contested
+    try:
+        while True:
+            states = [jobs.get_job(job["id"], db_path) for job in all_jobs]
+            if all(job["status"] in ("done", "failed", "cancelled") for job in states):
+                break
+            time.sleep(0.2)
+    finally:
+        for process in workers:
+            process.terminate()
+    elapsed = time.monotonic() - started
+
+    user = jobs.get_job(user["id"], db_path)
+    entry = os.path.join(workdir, f"diary_{prefix}-shared-date")
+    scenes = manifest.load_manifest(entry)["scenes"]
+    consistent = all(encoder.file_sha256(os.path.join(entry, scene["image"])) == scene["image_sha256"]
+                     for scene in scenes if scene["image"])
+    done = [job for job in states if job["status"] == "done"]
+    return {
+        "fair": fair,
+        "seconds": round(elapsed, 2),
+        "failed": len(states) - len(done),
+        "interactive_job": {"position_shown": shown["queue_position"], "queue_wait": round(user["queue_wait"], 2)},
+        "queue_wait": percentiles([job["queue_wait"] for job in done]),
+        "encoder_slot_wait": percentiles([job["result"]["stats"]["admission_wait"]["encoders"] for job in done]),
+        "contested_date_consistent": consistent,
+        "leftover_workspaces": os.path.exists(os.path.join(entry, ".work")),
+        "queue_stats": jobs.queue_stats(db_path),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure fair queueing and admission control across sessions.")
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--burst", type=int, default=8, help="entries the batch session submits first")
+    parser.add_argument("--scenes", type=int, default=4)
+    parser.add_argument("--latency", type=float, default=0.3)
+    parser.add_argument("--encoder-slots", type=int, default=1)
+    parser.add_argument("--output", help="write JSON here instead of stdout")
+    args = parser.parse_args()
+
+    with FakeServices(latency=args.latency, jitter=0.1, seed=1) as services, \
+            tempfile.TemporaryDirectory(prefix="bench_queue_") as workdir:
+        # Configure before importing anything of ours: settings are read at import time,
+        # and the spawned workers inherit the environment and working directory
+        os.environ.update(services.env())
+        os.environ.update({
+            "VISION_DIARY_CACHE_DIR": os.path.join(workdir, "image-cache"),
+            "VISION_DIARY_ARCHIVE_DB": os.path.join(workdir, "archive.sqlite3"),
+            "VISION_DIARY_SLOTS_DIR": os.path.join(workdir, "slots"),
+            "VISION_DIARY_ENCODER_SLOTS": str(args.encoder_slots),
+            "VISION_DIARY_REQUESTS_PER_SECOND": "1000",
+        })
+        os.chdir(workdir)
+        import encoder
+        import jobs
+        import manifest
+
+        report = {"workers": args.workers, "burst": args.burst, "encoder_slots": args.encoder_slots, "runs": []}
+        for fair in (False, True):
+            print(f"{'fair' if fair else 'shared'} queue...", file=sys.stderr)
+            report["runs"].append(run_mode(jobs, manifest, encoder, fair, args, workdir))
+        os.chdir(BENCH_DIR)
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
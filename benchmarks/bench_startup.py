@@ -0,0 +1,132 @@
+"""
+Cold-start cost of the Streamlit apps and the render workers.
+
+* app_imports: a fresh interpreter importing each app's own modules (every
+  top-level import of diary.py / vision_diary.py except Streamlit, which is
+  the same for both), then starting the media server and the job workers as
+  the apps do before their first paint.
+* worker_imports: a fresh interpreter importing the render stack (`render`)
+  next to importing the heavy SDKs it used to load eagerly.
+* first_job: seconds from submitting a job to its video being done on a
+  freshly started worker, with and without prewarming, against the fakes.
+
+Each measurement is the median of --repeat fresh processes. Prints JSON.
+
+    python benchmarks/bench_startup.py --repeat 5
+"""
+
+import argparse
+import ast
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, BENCH_DIR)
+sys.path.insert(0, REPO_DIR)
+
+from bench_pipeline import make_story  # noqa: E402
+from fakes import FakeServices  # noqa: E402
+
+APPS = ("diary.py", "vision_diary.py")
+EAGER_IMPORTS = ["moviepy.editor", "selenium.webdriver", "webdriver_manager.chrome", "gtts", "replicate"]
+
+
+def app_modules(path):
+    """Top-level modules an app imports, Streamlit aside."""
+    with open(path) as f:
+        tree = ast.parse(f.read())
+    modules = []
+    for node in tree.body:
+        if isinstance(node, ast.Import):
+            modules += [alias.name for alias in node.names]
+        elif isinstance(node, ast.ImportFrom) and node.module:
+            modules.append(node.module)
+    return [module for module in modules if module.split(".")[0] != "streamlit"]
+
+
+def timed_python(body, repeat, env=None):
+    """Median seconds `body` (lines of code) takes in a fresh interpreter."""
+    code = f"import time\nt = time.perf_counter()\n{body}\nprint('SECONDS', time.perf_counter() - t)\n"
+    times = []
+    for _ in range(repeat):
+        output = subprocess.run([sys.executable, "-c", code], cwd=REPO_DIR, env=env, check=True,
+                                stdout=subprocess.PIPE, text=True).stdout
+        # Workers started by `body` may print after the timing line
+        times.append(float(next(line.split()[1] for line in output.splitlines() if line.startswith("SECONDS "))))
+    return round(statistics.median(times), 4)
+
+
+def first_job(jobs, workdir, prewarm, settle):
+    db_path = os.path.join(workdir, f"jobs-{'warm' if prewarm else 'cold'}.sqlite3")
+    workers = jobs.start_workers(1, db_path, prewarm=prewarm)
+    try:
+        time.sleep(settle)  # the worker is up and idle, as it would be before the first visitor submits
+        started = time.monotonic()
+        job = jobs.submit_job("replicate", f"startup-{prewarm}", make_story(4, f"startup-{prewarm}"), db_path)
+        while job["status"] not in ("done", "failed"):
+            time.sleep(0.05)
+            job = jobs.get_job(job["id"], db_path)
+        return {"seconds": round(time.monotonic() - started, 3), "status": job["status"]}
+    finally:
+        for process in workers:
+            process.terminate()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure app and worker cold starts.")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--settle", type=float, default=5.0, help="seconds a new worker idles before the first job")
+    parser.add_argument("--output", help="write JSON here instead of stdout")
+    args = parser.parse_args()
+
+    report = {"repeat": args.repeat, "app_imports": {}, "worker_imports": {}}
+    with tempfile.TemporaryDirectory(prefix="bench_startup_") as workdir:
+        env = dict(os.environ, VISION_DIARY_JOBS_DB=os.path.join(workdir, "paint.sqlite3"),
+                   VISION_DIARY_ARCHIVE_DB=os.path.join(workdir, "archive.sqlite3"), VISION_DIARY_MEDIA_PORT="0",
+                   VISION_DIARY_MEDIA_URL="http://localhost")
+        for app in APPS:
+            modules = app_modules(os.path.join(REPO_DIR, app))
+            imports = "\n".join(f"import {module}" for module in modules)
+            report["app_imports"][app] = {
+                "modules": modules,
+                "import_seconds": timed_python(imports, args.repeat, env),
+                # What the script does before the home page renders: imports, media server, workers
+                "first_paint_seconds": timed_python(
+                    f"{imports}\nimport jobs, media_server\nmedia_server.get_media_server(\"replicate\")\njobs.start_workers(2)",
+                    args.repeat, env),
+            }
+        report["worker_imports"]["render"] = timed_python("import render", args.repeat)
+        report["worker_imports"]["eager_sdks"] = timed_python(
+            "\n".join(f"import {module}" for module in EAGER_IMPORTS), args.repeat)
+
+        with FakeServices(latency=0.2, jitter=0.05, seed=1) as services:
+            os.environ.update(services.env())
+            os.environ.update({
+                "VISION_DIARY_CACHE_DIR": os.path.join(workdir, "image-cache"),
+                "VISION_DIARY_TTS_CACHE_DIR": os.path.join(workdir, "tts-cache"),
+                "VISION_DIARY_ARCHIVE_DB": os.path.join(workdir, "archive.sqlite3"),
+                "VISION_DIARY_SLOTS_DIR": os.path.join(workdir, "slots"),
+            })
+            os.chdir(workdir)
+            import jobs
+
+            report["first_job"] = {"cold": first_job(jobs, workdir, False, args.settle),
+                                   "prewarmed": first_job(jobs, workdir, True, args.settle)}
+            os.chdir(BENCH_DIR)
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,231 @@
+"""
+Local stand-ins for the services the render pipeline talks to.
+
+FakeServices runs one threaded HTTP server that provides:
+
+* a Replicate-style prediction API (``/v1/predictions``) with configurable
+  latency, failure rate and a slow tail (``slow_rate`` of predictions take
+  ``slow_latency`` seconds), returning image URLs on the same server,
+* a static image host (``/images/<name>.jpg``) serving generated JPEGs,
+* ``/generator.html``, a stub of the aicreate.com page with the same
+  ``caption``/``enhance-prompt``/``download-image`` elements the Selenium
+  flow drives.
+
+``synthesize`` is an offline TTS backend (VISION_DIARY_TTS_BACKEND=
+fakes:synthesize) that writes a tone whose length follows the word count.
+"""
+
+import io
+import itertools
+import json
+import random
+import re
+import subprocess
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import imageio_ffmpeg
+import numpy as np
+from PIL import Image
+
+WORDS_PER_SECOND = 2.5
+
+GENERATOR_PAGE = """<!doctype html>
+<html><body>
+<form onsubmit="return false;">
+  <textarea name="caption"></textarea>
+  <button type="button" id="enhance-prompt">Enhance</button>
+  <button type="button" id="make-photo-realistic">Photo realistic</button>
+  <div id="loading-overlay" style="display:none">Loading...</div>
+  <select name="model_version"><option value="sdxl">sdxl</option><option value="flux">flux</option></select>
+  <select name="size"><option value="512x512">512x512</option><option value="1024x1024">1024x1024</option></select>
+  <button type="submit" id="generate">Generate Images</button>
+</form>
+<div id="results"></div>
+<script>
+  var counter = 0;
+  function overlay(ms) {
+    var o = document.getElementById('loading-overlay');
+    o.style.display = 'block';
+    setTimeout(function () { o.style.display = 'none'; }, ms);
+  }
+  document.getElementById('enhance-prompt').onclick = function () { overlay(50); };
+  document.getElementById('make-photo-realistic').onclick = function () { overlay(50); };
+  document.getElementById('generate').onclick = function () {
+    var results = document.getElementById('results');
+    results.innerHTML = '';
+    counter += 1;
+    setTimeout(function () {
+      results.innerHTML = '<div class="image-wrapper"><img src="/images/selenium-' + Date.now() + '-' +
+        counter + '.jpg"></div><a class="download-image" href="#">Download</a>';
+    }, %(latency_ms)d);
+  };
+</script>
+</body></html>
+"""
+
+
+def make_jpeg(seed, size=1024):
+    """Return JPEG bytes for a deterministic gradient-and-noise scene."""
+    rng = np.random.default_rng(seed)
+    gradient = np.linspace(0, 255, size, dtype=np.uint8)
+    pixels = np.stack([np.tile(gradient, (size, 1)), np.tile(gradient[:, None], (1, size)),
+                       np.full((size, size), seed % 256, dtype=np.uint8)], axis=-1)
+    pixels = np.clip(pixels.astype(np.int16) + rng.integers(0, 24, pixels.shape), 0, 255).astype(np.uint8)
+    buffer = io.BytesIO()
+    Image.fromarray(pixels).save(buffer, format="JPEG", quality=90)
+    return buffer.getvalue()
+
+
+class _QuietServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # Clients killed mid-request (e.g. an interrupted batch) are expected
+        if not isinstance(sys.exc_info()[1], (BrokenPipeError, ConnectionResetError)):
+            super().handle_error(request, client_address)
+
+
+class FakeServices:
+    """Threaded HTTP server hosting all the fakes on one local port."""
+
+    def __init__(self, latency=1.0, jitter=0.25, failure_rate=0.0, image_size=1024, seed=0,
+                 slow_rate=0.0, slow_latency=10.0):
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.slow_rate = slow_rate
+        self.slow_latency = slow_latency
+        self.image_size = image_size
+        self.random = random.Random(seed)
+        self.requests = {"predictions": 0, "images": 0, "failures": 0}
+        self._predictions = {}
+        self._ids = itertools.count(1)
+        self._images = {}
+        self._lock = threading.Lock()
+        self._server = _QuietServer(("127.0.0.1", 0), self._handler())
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self._server.server_address[1]}"
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def env(self):
+        """Environment variables pointing the pipeline at these fakes."""
+        return {
+            "REPLICATE_API_TOKEN": "fake-token",
+            "REPLICATE_BASE_URL": self.base_url,
+            "VISION_DIARY_GENERATOR_URL": f"{self.base_url}/generator.html",
+            "VISION_DIARY_TTS_BACKEND": "fakes:synthesize",
+        }
+
+    def _delay(self):
+        with self._lock:
+            if self.random.random() < self.slow_rate:
+                return self.slow_latency
+            return max(0.0, self.random.gauss(self.latency, self.jitter))
+
+    def _should_fail(self):
+        with self._lock:
+            return self.random.random() < self.failure_rate
+
+    def image_bytes(self, name):
+        with self._lock:
+            if name not in self._images:
+                self._images[name] = make_jpeg(len(self._images), self.image_size)
+            self.requests["images"] += 1
+            return self._images[name]
+
+    def create_prediction(self, body):
+        time.sleep(self._delay())
+        prediction_id = f"fake{next(self._ids)}"
+        failed = self._should_fail()
+        with self._lock:
+            self.requests["predictions"] += 1
+            self.requests["failures"] += failed
+        prediction = {
+            "id": prediction_id,
+            "model": "stability-ai/sdxl",
+            "version": body.get("version"),
+            "input": body.get("input", {}),
+            "status": "failed" if failed else "succeeded",
+            "output": None if failed else [f"{self.base_url}/images/{prediction_id}.jpg"],
+            "error": "Injected failure" if failed else None,
+            "logs": "",
+            "created_at": "2024-01-01T00:00:00Z",
+            "urls": {"get": f"{self.base_url}/v1/predictions/{prediction_id}",
+                     "cancel": f"{self.base_url}/v1/predictions/{prediction_id}/cancel"},
+        }
+        self._predictions[prediction_id] = prediction
+        return prediction
+
+    def _handler(self):
+        services = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def _send(self, status, body, content_type="application/json"):
+                if not isinstance(body, bytes):
+                    body = json.dumps(body).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                body = json.loads(self.rfile.read(length) or b"{}")
+                if self.path.rstrip("/") == "/v1/predictions":
+                    self._send(201, services.create_prediction(body))
+                else:
+                    self._send(404, {"detail": "Not found"})
+
+            def do_GET(self):
+                path = self.path.split("?", 1)[0]
+                if path.startswith("/images/"):
+                    self._send(200, services.image_bytes(path.rsplit("/", 1)[-1]), "image/jpeg")
+                elif path == "/generator.html":
+                    page = GENERATOR_PAGE % {"latency_ms": int(services._delay() * 1000)}
+                    self._send(200, page.encode("utf-8"), "text/html")
+                elif path.startswith("/v1/predictions/"):
+                    prediction = services._predictions.get(path.rsplit("/", 1)[-1])
+                    self._send(200 if prediction else 404, prediction or {"detail": "Not found"})
+                elif re.match(r"^/v1/models/[^/]+/[^/]+/versions/[^/]+$", path):
+                    self._send(200, {
+                        "id": path.rsplit("/", 1)[-1],
+                        "created_at": "2024-01-01T00:00:00Z",
+                        "cog_version": "0.9.0",
+                        "openapi_schema": {"components": {"schemas": {
+                            "Output": {"type": "array", "items": {"type": "string", "format": "uri"}},
+                        }}},
+                    })
+                else:
+                    self._send(404, {"detail": "Not found"})
+
+        return Handler
+
+
+def synthesize(text, lang, out_path):
+    """Offline TTS stand-in: a tone lasting as long as the sentence would take to read."""
+    seconds = max(0.5, len(text.split()) / WORDS_PER_SECOND)
+    subprocess.run(
+        [imageio_ffmpeg.get_ffmpeg_exe(), "-y", "-loglevel", "error", "-f", "lavfi",
+         "-i", f"sine=frequency=220:duration={seconds:.2f}", "-ar", "24000", "-ac", "1",
+         "-b:a", "32k", "-f", "mp3", out_path],
+        check=True,
+    )
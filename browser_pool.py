@@ -0,0 +1,198 @@
+"""
+Process-wide pool of pre-warmed headless Chrome drivers.
+
+Starting Chrome (and resolving ChromeDriver) costs several seconds per video,
+so drivers are created once, parked on the generator page and handed out to
+whichever session needs one. Drivers are health-checked on checkout and
+recycled after `max_uses` prompts or as soon as a prompt fails on them.
+With `admit`, every live driver also holds a machine-wide browser slot
+(see admission.py), so the number of Chrome instances stays bounded across
+worker processes as well as within this one.
+"""
+
+import atexit
+import queue
+import threading
+import time
+from contextlib import contextmanager
+
+from selenium import webdriver
+from selenium.webdriver.chrome.service import Service
+from selenium.webdriver.chrome.options import Options
+from webdriver_manager.chrome import ChromeDriverManager
+
+from telemetry import log
+
+_pools = []
+_driver_path = None
+_driver_path_lock = threading.Lock()
+
+
+def chrome_options():
+    # Setup Chrome options for headless mode (Render compatible)
+    options = Options()
+    options.add_argument("--headless")
+    options.add_argument("--no-sandbox")
+    options.add_argument("--disable-dev-shm-usage")
+    options.add_argument("--disable-gpu")
+    options.add_argument("--window-size=1920,1080")
+    options.add_argument("--disable-blink-features=AutomationControlled")
+    options.add_argument("--user-agent=Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36")
+    return options
+
+
+def chromedriver_path():
+    """Resolve ChromeDriver once per process; None means use the one on PATH."""
+    global _driver_path
+    with _driver_path_lock:
+        if _driver_path is None:
+            try:
+                _driver_path = ChromeDriverManager().install()
+            except Exception as e:
+                # Fallback for Render deployment
+                log(f"ChromeDriverManager failed ({e}), using chromedriver from PATH", level="warning")
+                _driver_path = ""
+        return _driver_path or None
+
+
+def create_driver():
+    """Launch a new headless Chrome."""
+    path = chromedriver_path()
+    if path:
+        try:
+            return webdriver.Chrome(service=Service(path), options=chrome_options())
+        except Exception:
+            pass
+    return webdriver.Chrome(options=chrome_options())
+
+
+class BrowserPool:
+    """Bounded pool of warm WebDriver instances shared across sessions."""
+
+    def __init__(self, factory=create_driver, size=2, max_uses=25, warm_url=None, prewarm=True, admit=None):
+        self.factory = factory
+        self.size = size
+        self.max_uses = max_uses
+        self.warm_url = warm_url
+        self.admit = admit  # admit(deadline) -> slot with release(), held for the driver's lifetime
+        self.stats = {"created": 0, "recycled": 0, "checkouts": 0, "health_failures": 0}
+        self._slots = threading.BoundedSemaphore(size)
+        self._idle = queue.LifoQueue()  # most recently used first, keeps hot drivers hot
+        self._uses = {}
+        self._admissions = {}
+        self._lock = threading.Lock()
+        self._closed = False
+        _pools.append(self)
+        if prewarm:
+            threading.Thread(target=self._prewarm, name="browser-pool-prewarm", daemon=True).start()
+
+    def _prewarm(self):
+        for _ in range(self.size):
+            if not self._slots.acquire(blocking=False):
+                return
+            try:
+                # Prewarming never waits for a browser slot another process holds
+                self._idle.put(self._launch(deadline=time.monotonic()))
+            except Exception as e:
+                log(f"Browser prewarm failed: {e}", level="warning")
+            finally:
+                self._slots.release()
+
+    def _launch(self, deadline=None):
+        admission = self.admit(deadline) if self.admit is not None else None
+        try:
+            driver = self.factory()
+            if self.warm_url:
+                driver.get(self.warm_url)
+        except BaseException:
+            if admission is not None:
+                admission.release()
+            raise
+        with self._lock:
+            self.stats["created"] += 1
+            self._uses[id(driver)] = 0
+            self._admissions[id(driver)] = admission
+        return driver
+
+    def _discard(self, driver):
+        with self._lock:
+            self._uses.pop(id(driver), None)
+            admission = self._admissions.pop(id(driver), None)
+            self.stats["recycled"] += 1
+        try:
+            driver.quit()
+        except Exception:
+            pass
+        if admission is not None:
+            admission.release()
+
+    @staticmethod
+    def _healthy(driver):
+        try:
+            driver.execute_script("return document.readyState")
+            return True
+        except Exception:
+            return False
+
+    def acquire(self, timeout=None):
+        """Check out a healthy driver, launching one if none are idle."""
+        if self._closed:
+            raise RuntimeError("Browser pool is closed")
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        if not self._slots.acquire(timeout=timeout):
+            raise TimeoutError("No browser available in the pool")
+        try:
+            while True:
+                try:
+                    driver = self._idle.get_nowait()
+                except queue.Empty:
+                    driver = self._launch(deadline)
+                    break
+                if self._healthy(driver):
+                    break
+                with self._lock:
+                    self.stats["health_failures"] += 1
+                self._discard(driver)
+        except Exception:
+            self._slots.release()
+            raise
+        with self._lock:
+            self.stats["checkouts"] += 1
+        return driver
+
+    def release(self, driver, broken=False):
+        """Return a driver; broken or worn-out drivers are quit instead of reused."""
+        with self._lock:
+            uses = self._uses.get(id(driver), 0) + 1
+            self._uses[id(driver)] = uses
+        if broken or self._closed or uses >= self.max_uses:
+            self._discard(driver)
+        else:
+            self._idle.put(driver)
+        self._slots.release()
+
+    @contextmanager
+    def driver(self, timeout=None):
+        """Context manager form of acquire/release that recycles on errors."""
+        driver = self.acquire(timeout=timeout)
+        try:
+            yield driver
+        except BaseException:
+            self.release(driver, broken=True)
+            raise
+        self.release(driver)
+
+    def close(self):
+        """Quit every idle driver; checked-out drivers are quit on release."""
+        self._closed = True
+        while True:
+            try:
+                self._discard(self._idle.get_nowait())
+            except queue.Empty:
+                break
+
+
+@atexit.register
+def _close_pools():
+    for pool in _pools:
+        pool.close()
@@ -0,0 +1,108 @@
+"""
+Small concurrency helpers shared by the image generators.
+
+`run_ordered` submits every item at once to a bounded thread pool, enforces a
+per-item timeout and an optional token-bucket start rate, and hands results
+back in input order while reporting each completion as it happens.
+"""
+
+import contextvars
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+
+class TokenBucket:
+    """Thread-safe token bucket limiting how many requests start per second."""
+
+    def __init__(self, rate, capacity=None):
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else max(1.0, rate))
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Block until a token is available, then consume it."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait_for = (1 - self._tokens) / self.rate
+            time.sleep(wait_for)
+
+
+def run_ordered(func, items, max_workers=4, timeout=None, rate_limiter=None, on_complete=None, slots=None):
+    """
+    Call func(index, item) for every item with at most max_workers in flight.
+    slots is an optional semaphore shared with other calls (e.g. other
+    entries rendering in the same process) that every item holds while it
+    runs, capping the combined concurrency.
+
+    Returns a list of (result, error) tuples in the same order as items. An
+    item that runs longer than `timeout` seconds is reported as a TimeoutError
+    and its late result is discarded. on_complete(index, result, error, done,
+    total) is called from the calling thread as each item finishes, so it is
+    safe to update Streamlit widgets from it.
+    """
+    items = list(items)
+    total = len(items)
+    outcomes = [(None, None)] * total
+    if not total:
+        return outcomes
+
+    started = {}
+
+    def call(index, item):
+        if slots is not None:
+            slots.acquire()
+        try:
+            if rate_limiter is not None:
+                rate_limiter.acquire()
+            started[index] = time.monotonic()
+            return func(index, item)
+        finally:
+            if slots is not None:
+                slots.release()
+
+    executor = ThreadPoolExecutor(max_workers=max(1, min(max_workers, total)))
+    try:
+        # Each call runs in a copy of the caller's context so trace spans nest across threads
+        pending = {executor.submit(contextvars.copy_context().run, call, i, item): i
+                   for i, item in enumerate(items)}
+        done_count = 0
+        while pending:
+            finished, _ = wait(pending, timeout=0.25 if timeout else None, return_when=FIRST_COMPLETED)
+            completed = []
+
+            for future in finished:
+                index = pending.pop(future)
+                try:
+                    outcomes[index] = (future.result(), None)
+                except Exception as e:
+                    outcomes[index] = (None, e)
+                completed.append(index)
+
+            if timeout:
+                now = time.monotonic()
+                for future, index in list(pending.items()):
+                    began = started.get(index)
+                    if began is not None and now - began > timeout:
+                        del pending[future]
+                        outcomes[index] = (None, TimeoutError(f"timed out after {timeout}s"))
+                        completed.append(index)
+
+            for index in completed:
+                done_count += 1
+                if on_complete is not None:
+                    result, error = outcomes[index]
+                    on_complete(index, result, error, done_count, total)
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+    return outcomes
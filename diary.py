@@ -11,87 +11,57 @@ To use this version:
 """
 
 import os
+import time
+import uuid
 import datetime
 import streamlit as st
-from gtts import gTTS
-from moviepy.editor import ImageSequenceClip, AudioFileClip
-import requests
-import replicate
-
-def generate_prompts(story):
-    """Split story into individual prompts."""
-    prompts = story.split('. ')
-    detailed_prompts = []
-    for prompt in prompts:
-        if prompt.strip():
-            detailed_prompt = f"{prompt.strip()}."
-            detailed_prompts.append(detailed_prompt)
-    return detailed_prompts[:8]  # Limit to 8 images to save time/cost
-
-def generate_images_replicate(prompts, save_directory):
-    """Generate images using Replicate API (much faster and more reliable)."""
-    api_token = os.getenv("REPLICATE_API_TOKEN")
-    if not api_token:
-        raise ValueError("REPLICATE_API_TOKEN environment variable not set!")
-    
-    images = []
-    
-    for i, prompt in enumerate(prompts):
-        try:
-            st.info(f"Generating image {i+1}/{len(prompts)}...")
-            
-            # Use SDXL model via Replicate
-            output = replicate.run(
-                "stability-ai/sdxl:39ed52f2a78e934b3ba6e2a89f5b1c712de7dfea535525255b1aa35c5565e08b",
-                input={
-                    "prompt": f"Professional photo-realistic image: {prompt}",
-                    "width": 1024,
-                    "height": 1024,
-                    "num_outputs": 1,
-                }
-            )
-            
-            # Download the generated image
-            image_url = output[0]
-            image_path = os.path.join(save_directory, f"generated_image_{i+1}.jpg")
-            
-            response = requests.get(image_url)
-            with open(image_path, "wb") as f:
-                f.write(response.content)
-            
-            images.append(image_path)
-            print(f"Image {i+1} generated successfully!")
-            
-        except Exception as e:
-            st.error(f"Error generating image {i+1}: {str(e)}")
-            print(f"Error: {e}")
-    
-    return images
-
-def generate_audio(story_text, audio_path):
-    """Generate audio from text using gTTS."""
-    tts = gTTS(story_text, lang='en')
-    tts.save(audio_path)
-    print(f"Audio generated successfully!")
-
-def create_video(images, audio_path, video_path):
-    """Create video from images and audio."""
-    if not images:
-        raise ValueError("No images were generated. Cannot create video.")
-    
-    audio = AudioFileClip(audio_path)
-    audio_duration = audio.duration
-    
-    num_images = len(images)
-    duration_per_image = audio_duration / num_images
-    
-    clip = ImageSequenceClip(images, durations=[duration_per_image] * num_images)
-    final_clip = clip.set_audio(audio)
-    final_clip.write_videofile(video_path, codec="libx264", fps=24)
-    print(f"Video created successfully!")
+from archive import count_entries, list_entries
+from jobs import submit_job, get_job, cancel_job, queue_stats, start_workers
+from media_server import get_media_server
+from planner import SCENE_BUDGET, plan_scenes
+
+# Render jobs run in background worker processes so a refresh or rerun doesn't kill them
+JOB_WORKERS = int(os.getenv("VISION_DIARY_JOB_WORKERS", "2"))
+HISTORY_PAGE_SIZE = 10
+
+@st.cache_resource
+def job_workers():
+    """Start the render workers once per server process."""
+    if os.getenv("VISION_DIARY_EXTERNAL_WORKERS") == "1":
+        return []  # workers run separately via `python jobs.py`
+    return start_workers(JOB_WORKERS)
+
+@st.cache_resource
+def media_server():
+    """Serve videos and images to the browser over HTTP ranges instead of through Streamlit."""
+    return get_media_server("replicate")
+
+def media_source(path):
+    """What to hand st.video / st.image: a media server URL when one is published, else the path."""
+    return media.url_for(path) if media is not None else path
+
+def scene_plan(text):
+    """The text's scene plan, kept in the session so reruns that did not change the text skip planning."""
+    cached = st.session_state.get("scene_plan")
+    if cached is None or cached[0] != text:
+        st.session_state.scene_plan = (text, plan_scenes(text, SCENE_BUDGET))
+    return st.session_state.scene_plan[1]
+
+def download_video(path, entry_date, **kwargs):
+    file_name = f"vision_diary_{entry_date}.mp4"
+    if media is not None:
+        # The media server sends the file, not this process
+        st.link_button("📥 Download Video", media.url_for(path, download=file_name), **kwargs)
+    else:
+        with open(path, "rb") as video_file:
+            st.download_button("📥 Download Video", data=video_file, file_name=file_name,
+                               mime="video/mp4", **kwargs)
 
 # Streamlit UI
 st.set_page_config(page_title="Vision Diary", page_icon="📔", layout="centered")
+job_workers()
+media = media_server()
+poll_job = False
 
 # Custom CSS
 st.markdown("""
@@ -118,6 +88,8 @@ st.markdown("### Transform your daily stories into beautiful AI-generated videos
 
 if 'page' not in st.session_state:
     st.session_state.page = 'home'
+if 'session_id' not in st.session_state:
+    st.session_state.session_id = uuid.uuid4().hex  # workers take turns between sessions
 
 if st.session_state.page == 'home':
     st.write("---")
@@ -137,6 +109,9 @@ if st.session_state.page == 'home':
     if st.button("🚀 Start Creating", type="primary"):
         st.session_state.page = 'calendar'
         st.rerun()
+    if st.button("📚 Past Entries"):
+        st.session_state.page = 'history'
+        st.rerun()
 
 elif st.session_state.page == 'calendar':
     st.write("---")
@@ -164,12 +139,17 @@ elif st.session_state.page == 'input':
         placeholder="Today was an amazing day. I went to the park and saw beautiful flowers. The sun was shining brightly. I met my friends and we had a great time..."
     )
     
-    st.info("💡 Tip: Write 3-8 sentences for best results. Each sentence will become an image in your video.")
+    plan = scene_plan(diary_text)
+    if plan.sentences:
+        st.caption(f"🖼️ {len(plan.sentences)} sentences → {len(plan.prompts)} scenes (at most {SCENE_BUDGET})")
+    st.info(f"💡 Tip: Every sentence is narrated. Similar or very short sentences share a scene, "
+            f"and long stories are grouped into at most {SCENE_BUDGET} images.")
     
     col1, col2 = st.columns(2)
     with col1:
         if st.button("← Back to Calendar"):
             st.session_state.page = 'calendar'
+            st.session_state.pop("job_id", None)
             st.rerun()
     
     with col2:
@@ -177,66 +157,103 @@ elif st.session_state.page == 'input':
             if not diary_text.strip():
                 st.error("❌ Please enter some text for your diary entry!")
             else:
-                with st.spinner("🎨 Creating your video... This may take 2-3 minutes."):
-                    try:
-                        # Create save directory
-                        save_directory = f"./diary_{st.session_state.selected_date}"
-                        os.makedirs(save_directory, exist_ok=True)
-                        
-                        # Progress tracking
-                        progress_bar = st.progress(0)
-                        status_text = st.empty()
-                        
-                        # Step 1: Generate prompts
-                        status_text.text("📝 Processing your story...")
-                        prompts = generate_prompts(diary_text)
-                        progress_bar.progress(20)
-                        
-                        # Step 2: Generate images
-                        status_text.text(f"🎨 Generating {len(prompts)} images with AI...")
-                        images = generate_images_replicate(prompts, save_directory)
-                        progress_bar.progress(60)
-                        
-                        if not images:
-                            st.error("❌ Failed to generate images. Please try again.")
-                        else:
-                            # Step 3: Create audio
-                            status_text.text("🎵 Creating audio narration...")
-                            audio_path = os.path.join(save_directory, f"story_audio.mp3")
-                            generate_audio(diary_text, audio_path)
-                            progress_bar.progress(80)
-                            
-                            # Step 4: Create video
-                            status_text.text("🎬 Assembling your video...")
-                            video_path = os.path.join(save_directory, f"story_video.mp4")
-                            create_video(images, audio_path, video_path)
-                            progress_bar.progress(100)
-                            
-                            status_text.text("✅ Video created successfully!")
-                            
-                            st.success("🎉 Your Vision Diary video is ready!")
-                            st.video(video_path)
-                            
-                            # Download button
-                            with open(video_path, "rb") as video_file:
-                                st.download_button(
-                                    label="📥 Download Video",
-                                    data=video_file,
-                                    file_name=f"vision_diary_{st.session_state.selected_date}.mp4",
-                                    mime="video/mp4",
-                                    type="primary"
-                                )
-                            
-                            # Show generated images
-                            with st.expander("🖼️ View Generated Images"):
-                                cols = st.columns(3)
-                                for idx, img_path in enumerate(images):
-                                    with cols[idx % 3]:
-                                        st.image(img_path, caption=f"Scene {idx+1}")
-                                        
-                    except Exception as e:
-                        st.error(f"❌ An error occurred: {str(e)}")
-                        st.error("Please check your API token and try again.")
+                # Resubmitting the same entry returns the existing job instead of rendering again
+                job = submit_job("replicate", st.session_state.selected_date, diary_text,
+                                 session=st.session_state.session_id)
+                st.session_state.job_id = job["id"]
+
+    job = get_job(st.session_state.job_id) if st.session_state.get("job_id") else None
+    if job is not None:
+        if job["status"] in ("queued", "running"):
+            st.progress(int(job["progress"] * 100))
+            if job["status"] == "queued" and job["queue_position"]:
+                eta = f", starting in about {job['eta']:.0f}s" if job["eta"] is not None else ""
+                st.text(f"⏳ Waiting for a free worker... You are #{job['queue_position']} in line{eta}")
+            elif job["status"] == "queued":
+                st.text("⏳ Waiting for a free worker...")
+            else:
+                st.text(f"🎨 {job['message'] or 'Creating your video... This may take 2-3 minutes.'}")
+            if job["preview_path"] and os.path.exists(job["preview_path"]):
+                # Low-resolution draft; the full-quality video replaces it when it is done
+                st.caption(f"👀 Draft preview, ready after {job['time_to_preview']:.0f}s. "
+                           "The full-quality video is still rendering...")
+                st.video(media_source(job["preview_path"]))
+            if st.button("✖️ Cancel"):
+                cancel_job(job["id"])
+                st.rerun()
+            poll_job = True
+
+        elif job["status"] == "done":
+            result = job["result"]
+            video_path = result["video_path"]
+            images = result["images"]
+
+            st.success("🎉 Your Vision Diary video is ready!")
+            if job["time_to_preview"] is not None:
+                st.caption(f"⚡ Preview after {job['time_to_preview']:.1f}s, "
+                           f"full-quality video after {job['time_to_final']:.1f}s")
+            placeholders = result.get("stats", {}).get("backends", {}).get("placeholder", 0)
+            if placeholders:
+                st.warning(f"⚠️ {placeholders} scene(s) use a placeholder because image generation was "
+                           "unavailable. Generate again later to replace them.")
+            st.video(media_source(video_path))
+            
+            # Download button
+            download_video(video_path, job["entry_date"], type="primary")
+            
+            # Show generated images
+            with st.expander("🖼️ View Generated Images"):
+                cols = st.columns(3)
+                for idx, img_path in enumerate(images):
+                    with cols[idx % 3]:
+                        st.image(media_source(img_path), caption=f"Scene {idx+1}")
+
+            with st.expander("⏱️ Stage Timings"):
+                for line in result["timings"]:
+                    st.text(line)
+                stats = result["stats"]
+                st.text(f"Image cache: {stats['cache_hits']} hits, {stats['cache_misses']} misses; "
+                        f"downloaded {stats['downloaded_bytes'] / 1e6:.1f} MB")
+                if "queue_wait" in stats:
+                    st.text(f"Queued for {stats['queue_wait']:.1f}s")
+
+        elif job["status"] == "failed":
+            st.error(f"❌ An error occurred: {job['error']}")
+            st.error("Please check your API token and try again.")
+
+        elif job["status"] == "cancelled":
+            st.warning(f"Video generation was cancelled. {job['error'] or ''}")
+
+elif st.session_state.page == 'history':
+    st.write("---")
+    st.subheader(f"📚 Past Entries ({count_entries('replicate')})")
+    # One index lookup per page: the last date shown is where the next page starts
+    cursors = st.session_state.setdefault("history_cursors", [None])
+    entries = list_entries("replicate", limit=HISTORY_PAGE_SIZE, before=cursors[-1])
+    if not entries:
+        st.info("No videos yet. Write your first entry!")
+    for entry in entries:
+        length = f" · {entry['duration']:.0f}s" if entry["duration"] else ""
+        with st.expander(f"📅 {entry['entry_date']} · {entry['scenes']} scenes{length}"):
+            if os.path.exists(entry["video_path"]):
+                st.video(media_source(entry["video_path"]))
+                download_video(entry["video_path"], entry["entry_date"])
+            else:
+                st.warning("This video is no longer on disk.")
+
+    col1, col2 = st.columns(2)
+    with col1:
+        if len(cursors) > 1 and st.button("← Newer"):
+            cursors.pop()
+            st.rerun()
+    with col2:
+        if len(entries) == HISTORY_PAGE_SIZE and st.button("Older →"):
+            cursors.append(entries[-1]["entry_date"])
+            st.rerun()
+    if st.button("🏠 Home"):
+        st.session_state.page = 'home'
+        st.session_state.pop("history_cursors", None)
+        st.rerun()
 
 # Sidebar info
 with st.sidebar:
@@ -251,4 +268,13 @@ with st.sidebar:
     if os.getenv("REPLICATE_API_TOKEN"):
         st.success("✅ API Token: Configured")
     else:
-        st.error("❌ API Token: Not configured")
\ No newline at end of file
+        st.error("❌ API Token: Not configured")
+    queue = queue_stats()
+    st.write(f"🎬 {queue['running']} rendering, {queue['queued']} waiting")
+    if queue["queue_wait_p50"] is not None:
+        st.caption(f"Typical wait for a worker: {queue['queue_wait_p50']:.0f}s (p95 {queue['queue_wait_p95']:.0f}s)")
+
+# Poll the running job until it finishes
+if poll_job:
+    time.sleep(1)
+    st.rerun()
@@ -0,0 +1,149 @@
+"""
+Shared download layer for generated images.
+
+All downloads go through one pooled `requests.Session` (keep-alive, retries
+with backoff on connection failures and 5xx) and are streamed in chunks to a
+temp file next to the destination, then atomically renamed into place. A
+connection reset or a body cut off partway through is fetched again by
+download_file. Each failure is retried in exactly one of these two places, so
+an unreachable host costs at most MAX_RETRIES + 1 connection attempts. Peak memory per download is one chunk regardless of
+image size.
+"""
+
+import hashlib
+import os
+import tempfile
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import ProtocolError
+from urllib3.util.retry import Retry
+
+CHUNK_SIZE = 64 * 1024
+POOL_SIZE = 16
+MAX_RETRIES = 3
+BACKOFF_FACTOR = 0.5
+TIMEOUT = (10, 60)  # (connect, read) seconds
+
+
+class DownloadError(Exception):
+    """Raised when a download exceeds its size cap or fails verification."""
+
+
+_session = None
+_session_lock = threading.Lock()
+_stats = {"downloads": 0, "failures": 0, "bytes": 0, "seconds": 0.0}
+_stats_lock = threading.Lock()
+
+
+def get_session():
+    """Return the process-wide pooled session, creating it on first use."""
+    global _session
+    with _session_lock:
+        if _session is None:
+            # Connect errors and 5xx only: a read timeout has already waited out TIMEOUT,
+            # and resets and bodies cut off mid-stream are retried by download_file
+            retry = Retry(
+                total=MAX_RETRIES,
+                connect=MAX_RETRIES,
+                read=0,
+                status=MAX_RETRIES,
+                status_forcelist=(500, 502, 503, 504),
+                allowed_methods=frozenset(["GET", "HEAD"]),
+                backoff_factor=BACKOFF_FACTOR,
+                raise_on_status=False,
+            )
+            adapter = HTTPAdapter(pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE, max_retries=retry)
+            session = requests.Session()
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            _session = session
+        return _session
+
+
+def download_file(url, dest_path, verify=True, max_bytes=None, sha256=None, timeout=TIMEOUT):
+    """
+    Stream url to dest_path and return per-download stats.
+
+    The body is written to a temp file in the destination directory and
+    renamed over dest_path only once it is complete (and matches `sha256`, if
+    given). A connection reset, or a body that breaks off partway through, is
+    fetched again with backoff; failures to connect are retried by the
+    session and raise here. Bodies larger than `max_bytes` raise DownloadError.
+    """
+    started = time.monotonic()
+    for attempt in range(MAX_RETRIES + 1):
+        try:
+            size = _stream_to_file(url, dest_path, verify, max_bytes, sha256, timeout)
+            break
+        except (requests.exceptions.ConnectionError, requests.exceptions.ChunkedEncodingError) as e:
+            if attempt == MAX_RETRIES or not _is_reset(e):
+                _record(0, time.monotonic() - started, failed=True)
+                raise
+            time.sleep(BACKOFF_FACTOR * (2 ** attempt))
+        except Exception:
+            _record(0, time.monotonic() - started, failed=True)
+            raise
+
+    elapsed = time.monotonic() - started
+    _record(size, elapsed)
+    return {"url": url, "path": dest_path, "bytes": size, "seconds": elapsed, "attempts": attempt + 1}
+
+
+def _is_reset(error):
+    """Whether error is a connection dropped or reset once made, rather than one that could not be made."""
+    if isinstance(error, requests.exceptions.ChunkedEncodingError):
+        return True
+    reason = error.args[0] if error.args else None
+    return isinstance(getattr(reason, "reason", reason), (ProtocolError, ConnectionResetError))
+
+
+def _stream_to_file(url, dest_path, verify, max_bytes, sha256, timeout):
+    directory = os.path.dirname(os.path.abspath(dest_path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".part")
+    digest = hashlib.sha256() if sha256 else None
+    size = 0
+    try:
+        with os.fdopen(fd, "wb") as handler, \
+                get_session().get(url, stream=True, verify=verify, timeout=timeout) as response:
+            response.raise_for_status()
+            declared = response.headers.get("Content-Length")
+            if max_bytes is not None and declared and int(declared) > max_bytes:
+                raise DownloadError(f"{url} is {declared} bytes, over the {max_bytes} byte cap")
+
+            for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                size += len(chunk)
+                if max_bytes is not None and size > max_bytes:
+                    raise DownloadError(f"{url} exceeded the {max_bytes} byte cap")
+                if digest is not None:
+                    digest.update(chunk)
+                handler.write(chunk)
+
+        if digest is not None and digest.hexdigest() != sha256.lower():
+            raise DownloadError(f"Checksum mismatch for {url}")
+        os.replace(tmp_path, dest_path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except FileNotFoundError:
+            pass
+        raise
+    return size
+
+
+def _record(size, elapsed, failed=False):
+    with _stats_lock:
+        if failed:
+            _stats["failures"] += 1
+        else:
+            _stats["downloads"] += 1
+            _stats["bytes"] += size
+        _stats["seconds"] += elapsed
+
+
+def download_stats():
+    """Return aggregate download counters for this process."""
+    with _stats_lock:
+        return dict(_stats)
@@ -0,0 +1,240 @@
+"""
+Still-image video encoder that drives ffmpeg directly.
+
+Each scene is a single image held for a few seconds, so instead of having
+MoviePy render and re-encode every frame at 24 fps we hand ffmpeg the stills
+and their durations through the concat demuxer, encode at a low frame rate
+with x264's still-image tuning, and copy the narration into the MP4 without
+re-encoding it when the container allows.
+
+For incremental re-renders each scene can instead be encoded to its own
+segment, named by a hash of the image and its frame count, and the segments
+stream-copied together with the narration; re-rendering after a one-sentence
+edit then only encodes the scenes that changed.
+
+Every x264 encode first takes a machine-wide encoder slot (admission.py),
+so concurrent renders queue for the CPU instead of thrashing it. Stitching
+only copies streams and runs without one.
+"""
+
+import hashlib
+import math
+import os
+import re
+import subprocess
+import tempfile
+
+import imageio_ffmpeg
+
+from admission import get_admission
+from concurrency import run_ordered
+from telemetry import span
+
+FPS = 5
+PRESET = os.getenv("VISION_DIARY_X264_PRESET", "veryfast")
+CRF = int(os.getenv("VISION_DIARY_X264_CRF", "23"))
+THREADS = int(os.getenv("VISION_DIARY_X264_THREADS", "0"))  # 0 lets x264 use every core
+
+
+_ffmpeg = None
+
+
+def ffmpeg_binary():
+    """Return the ffmpeg executable bundled with imageio-ffmpeg (or IMAGEIO_FFMPEG_EXE), found once."""
+    global _ffmpeg
+    if _ffmpeg is None:
+        _ffmpeg = imageio_ffmpeg.get_ffmpeg_exe()
+    return _ffmpeg
+
+
+def probe_duration(media_path):
+    """Return the duration of an audio or video file in seconds."""
+    result = subprocess.run(
+        [ffmpeg_binary(), "-hide_banner", "-i", media_path],
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True,
+    )
+    match = re.search(r"Duration: (\d+):(\d+):(\d+(?:\.\d+)?)", result.stderr)
+    if not match:
+        raise ValueError(f"Could not read duration of {media_path}")
+    hours, minutes, seconds = match.groups()
+    return int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+
+
+def write_concat_list(images, durations, list_path):
+    """Write an ffconcat script holding each image for its duration."""
+    with open(list_path, "w") as f:
+        f.write("ffconcat version 1.0\n")
+        for image, duration in zip(images, durations):
+            f.write(f"file '{_escape(os.path.abspath(image))}'\n")
+            f.write(f"duration {duration:.3f}\n")
+        # The concat demuxer ignores the last duration unless the file is repeated
+        f.write(f"file '{_escape(os.path.abspath(images[-1]))}'\n")
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _escape(path):
+    return path.replace("'", "'\\''")
+
+
+def _video_filter(size):
+    width, height = size
+    return (
+        f"scale={width}:{height}:force_original_aspect_ratio=decrease,"
+        f"pad={width}:{height}:(ow-iw)/2:(oh-ih)/2,setsar=1,format=yuv420p"
+    )
+
+
+def encode_stills(images, durations, audio_path, video_path, size=(1024, 1024), fps=FPS,
+                  preset=PRESET, crf=CRF, threads=THREADS, audio_codec="copy"):
+    """
+    Encode still images (paths) shown for the given durations, muxed with
+    audio_path, into an H.264 MP4 at video_path.
+
+    The narration is stream-copied by default; if the container rejects it
+    the mux is retried with AAC.
+    """
+    if not images:
+        raise ValueError("No images were generated. Cannot create video.")
+    if len(images) != len(durations):
+        raise ValueError("Each image needs a duration")
+
+    video_filter = _video_filter(size)
+    with tempfile.TemporaryDirectory(prefix="vision_diary_encode_") as workdir:
+        list_path = os.path.join(workdir, "scenes.ffconcat")
+        write_concat_list(images, durations, list_path)
+
+        def command(codec):
+            return [
+                ffmpeg_binary(), "-y", "-hide_banner", "-loglevel", "error",
+                "-f", "concat", "-safe", "0", "-i", list_path,
+                "-i", audio_path,
+                "-map", "0:v:0", "-map", "1:a:0",
+                "-vf", video_filter, "-r", str(fps),
+                "-c:v", "libx264", "-preset", preset, "-tune", "stillimage",
+                "-crf", str(crf), "-threads", str(threads),
+                "-c:a", codec,
+                "-movflags", "+faststart", "-shortest",
+                video_path,
+            ]
+
+        # Encode and mux happen in one ffmpeg pass; a rejected audio copy is retried as AAC
+        with get_admission().slot("encoders"), \
+                span("encode", backend="ffmpeg", scenes=len(images), audio_codec=audio_codec) as encode:
+            result = subprocess.run(command(audio_codec), stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+            if result.returncode != 0 and audio_codec == "copy":
+                encode.set(retries=1, audio_codec="aac")
+                result = subprocess.run(command("aac"), stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+            if result.returncode != 0:
+                raise RuntimeError(f"ffmpeg failed: {result.stderr.strip()}")
+            encode.set(bytes=os.path.getsize(video_path))
+    return video_path
+
+
+def segment_frames(duration, fps=FPS, last=False):
+    """
+    Frames for a scene segment. Segments are rounded down (the stitch places
+    every segment at its exact start time, so the previous frame covers the
+    gap); the last one is rounded up so the video covers the narration.
+    """
+    frames = math.ceil(duration * fps) if last else math.floor(duration * fps)
+    return max(1, frames)
+
+
+def segment_path(segment_dir, image, frames, size=(1024, 1024), fps=FPS, preset=PRESET, crf=CRF):
+    """Content-addressed path of the segment for image held for `frames` frames."""
+    raw = "\x1f".join([file_sha256(image), str(frames), f"{size[0]}x{size[1]}", str(fps), preset, str(crf)])
+    return os.path.join(segment_dir, f"scene_{hashlib.sha256(raw.encode('utf-8')).hexdigest()[:24]}.mp4")
+
+
+def encode_segment(image, frames, output_path, size=(1024, 1024), fps=FPS, preset=PRESET, crf=CRF,
+                   threads=THREADS):
+    """Encode one still as a silent H.264 segment of `frames` frames."""
+    directory, name = os.path.split(os.path.abspath(output_path))
+    tmp_path = os.path.join(directory, f".partial-{name}")
+    with get_admission().slot("encoders"):
+        result = subprocess.run(
+            [
+                ffmpeg_binary(), "-y", "-hide_banner", "-loglevel", "error",
+                "-loop", "1", "-framerate", str(fps), "-i", image,
+                "-frames:v", str(frames), "-vf", _video_filter(size),
+                "-c:v", "libx264", "-preset", preset, "-tune", "stillimage",
+                "-crf", str(crf), "-threads", str(threads), "-an",
+                tmp_path,
+            ],
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True,
+        )
+    if result.returncode != 0:
+        raise RuntimeError(f"ffmpeg failed: {result.stderr.strip()}")
+    os.replace(tmp_path, output_path)
+    return output_path
+
+
+def encode_segments(images, durations, segment_dir, size=(1024, 1024), fps=FPS, preset=PRESET, crf=CRF,
+                    max_workers=2):
+    """
+    Return a segment path for every scene, encoding only the segments that
+    are not in segment_dir yet (in parallel).
+    """
+    if len(images) != len(durations):
+        raise ValueError("Each image needs a duration")
+    os.makedirs(segment_dir, exist_ok=True)
+    frames = [segment_frames(d, fps, last=(i == len(durations) - 1)) for i, d in enumerate(durations)]
+    paths = [segment_path(segment_dir, image, n, size, fps, preset, crf) for image, n in zip(images, frames)]
+    missing = [i for i, path in enumerate(paths) if not os.path.exists(path)]
+
+    def encode_one(slot, i):
+        with span("encode.segment", scene=i + 1, frames=frames[i]):
+            return encode_segment(images[i], frames[i], paths[i], size, fps, preset, crf)
+
+    for i, (_, error) in zip(missing, run_ordered(encode_one, missing, max_workers=max_workers)):
+        if error is not None:
+            raise RuntimeError(f"Could not encode scene {i + 1}: {error}")
+    return paths
+
+
+def stitch_segments(segments, durations, audio_path, video_path, audio_codec="copy"):
+    """
+    Stream-copy scene segments into video_path, each starting at the sum of
+    the previous durations, muxed with audio_path.
+    """
+    if not segments:
+        raise ValueError("No images were generated. Cannot create video.")
+    with tempfile.TemporaryDirectory(prefix="vision_diary_stitch_") as workdir:
+        list_path = os.path.join(workdir, "segments.ffconcat")
+        with open(list_path, "w") as f:
+            f.write("ffconcat version 1.0\n")
+            for segment, duration in zip(segments, durations):
+                f.write(f"file '{_escape(os.path.abspath(segment))}'\n")
+                f.write(f"duration {duration:.3f}\n")
+
+        directory, name = os.path.split(os.path.abspath(video_path))
+        tmp_path = os.path.join(directory, f".partial-{name}")
+
+        def command(codec):
+            return [
+                ffmpeg_binary(), "-y", "-hide_banner", "-loglevel", "error",
+                "-f", "concat", "-safe", "0", "-i", list_path,
+                "-i", audio_path,
+                "-map", "0:v:0", "-map", "1:a:0",
+                "-c:v", "copy", "-c:a", codec,
+                "-movflags", "+faststart",
+                tmp_path,
+            ]
+
+        with span("encode.stitch", scenes=len(segments), audio_codec=audio_codec) as stitch:
+            result = subprocess.run(command(audio_codec), stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+            if result.returncode != 0 and audio_codec == "copy":
+                stitch.set(retries=1, audio_codec="aac")
+                result = subprocess.run(command("aac"), stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+            if result.returncode != 0:
+                raise RuntimeError(f"ffmpeg failed: {result.stderr.strip()}")
+            os.replace(tmp_path, video_path)
+            stitch.set(bytes=os.path.getsize(video_path))
+    return video_path
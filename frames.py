@@ -0,0 +1,81 @@
+"""
+Bounded-memory frame source for the MoviePy encoder.
+
+ImageSequenceClip needs every scene decoded up front (or decodes each file
+once just to check sizes), so a long entry keeps every 1024x1024 image
+resident for the whole encode. StreamingFrames decodes a scene only when the
+encoder first asks for one of its frames, fits it to the output size once,
+shares the buffer between scenes that use the same image, and keeps at most
+`window` decoded frames alive; MoviePy reads frames in time order, so a
+window of two is enough.
+"""
+
+import bisect
+import itertools
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from PIL import Image
+
+WINDOW = 2
+
+
+def fit_frame(image_path, size):
+    """Decode image_path and letterbox it to size (width, height) as an RGB array."""
+    width, height = size
+    with Image.open(image_path) as image:
+        image = image.convert("RGB")
+        if image.size != (width, height):
+            image.thumbnail((width, height), Image.LANCZOS)
+            if image.size != (width, height):
+                canvas = Image.new("RGB", (width, height))
+                canvas.paste(image, ((width - image.width) // 2, (height - image.height) // 2))
+                image = canvas
+        frame = np.asarray(image)
+    frame.setflags(write=False)  # shared between scenes and handed to the encoder as-is
+    return frame
+
+
+class StreamingFrames:
+    """Lazily decoded frames for a slideshow of (image path, duration) scenes."""
+
+    def __init__(self, images, durations, size=(1024, 1024), window=WINDOW):
+        if not images:
+            raise ValueError("No images were generated. Cannot create video.")
+        if len(images) != len(durations):
+            raise ValueError("Each image needs a duration")
+        self.images = list(images)
+        self.size = tuple(size)
+        self.window = max(1, window)
+        self.starts = [0.0] + list(itertools.accumulate(durations))[:-1]
+        self.duration = float(sum(durations))
+        self.stats = {"decodes": 0, "peak_resident": 0}
+        self._frames = OrderedDict()  # image path -> frame, least recently used first
+        self._lock = threading.Lock()
+
+    def scene_at(self, t):
+        return max(0, bisect.bisect_right(self.starts, t) - 1)
+
+    def frame_at(self, t):
+        """Return the frame shown at time t (seconds)."""
+        image = self.images[self.scene_at(t)]
+        with self._lock:
+            frame = self._frames.get(image)
+            if frame is not None:
+                self._frames.move_to_end(image)
+                return frame
+            # Drop old frames before decoding so at most `window` are ever resident
+            while len(self._frames) >= self.window:
+                self._frames.popitem(last=False)
+            frame = fit_frame(image, self.size)
+            self._frames[image] = frame
+            self.stats["decodes"] += 1
+            self.stats["peak_resident"] = max(self.stats["peak_resident"], len(self._frames))
+            return frame
+
+    def clip(self):
+        """A MoviePy VideoClip reading from this source."""
+        from moviepy.video.VideoClip import VideoClip  # not moviepy.editor, which also loads IPython
+
+        return VideoClip(self.frame_at, duration=self.duration)
@@ -0,0 +1,162 @@
+"""
+Content-addressed on-disk cache for generated scene images.
+
+Images are keyed by a hash of the normalized prompt plus everything else that
+changes the picture (model version, size, prompt prefix) and live outside the
+per-date save directories. A byte budget is enforced with LRU eviction, using
+file mtimes as the recency marker so several Streamlit sessions (or processes)
+can share one cache directory safely.
+"""
+
+import hashlib
+import os
+import re
+import shutil
+import tempfile
+import threading
+
+try:
+    import fcntl
+except ImportError:  # Windows: fall back to in-process locking only
+    fcntl = None
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "vision_diary", "images")
+DEFAULT_MAX_BYTES = 1024 * 1024 * 1024  # 1 GiB
+
+
+def normalize_prompt(prompt):
+    """Lower-case and collapse whitespace so trivial edits share a cache entry."""
+    return re.sub(r"\s+", " ", prompt).strip().lower()
+
+
+class ImageCache:
+    """LRU image cache with atomic writes and hit/miss/eviction counters."""
+
+    def __init__(self, root=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES, extension=".jpg"):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.extension = extension
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        os.makedirs(self.root, exist_ok=True)
+
+    @staticmethod
+    def key(prompt, model, width, height, prompt_prefix=""):
+        """Return the cache key for one generation request."""
+        raw = "\x1f".join([normalize_prompt(prompt), model, str(width), str(height), prompt_prefix])
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def path_for(self, key):
+        return os.path.join(self.root, key[:2], key + self.extension)
+
+    def get(self, key, dest_path):
+        """
+        Place the cached image for key at dest_path (hard link, or copy when
+        linking is not possible). Returns False on a miss.
+        """
+        cached = self.path_for(key)
+        try:
+            os.utime(cached)  # mark as recently used
+            _remove_quietly(dest_path)
+            try:
+                os.link(cached, dest_path)
+            except OSError:
+                shutil.copyfile(cached, dest_path)
+        except FileNotFoundError:
+            with self._lock:
+                self.misses += 1
+            return False
+        with self._lock:
+            self.hits += 1
+        return True
+
+    def put(self, key, src_path):
+        """Copy src_path into the cache atomically, then enforce the byte budget."""
+        cached = self.path_for(key)
+        os.makedirs(os.path.dirname(cached), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(cached), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as dst, open(src_path, "rb") as src:
+                shutil.copyfileobj(src, dst)
+            os.replace(tmp_path, cached)
+        except Exception:
+            _remove_quietly(tmp_path)
+            raise
+        self.evict()
+
+    def evict(self):
+        """Remove least recently used images until the cache fits max_bytes."""
+        with self._lock, self._file_lock():
+            entries = []
+            total = 0
+            for dirpath, _, filenames in os.walk(self.root):
+                for name in filenames:
+                    if not name.endswith(self.extension):
+                        continue
+                    path = os.path.join(dirpath, name)
+                    try:
+                        st = os.stat(path)
+                    except FileNotFoundError:
+                        continue
+                    entries.append((st.st_mtime, st.st_size, path))
+                    total += st.st_size
+
+            entries.sort()
+            for _, size, path in entries:
+                if total <= self.max_bytes:
+                    break
+                _remove_quietly(path)
+                total -= size
+                self.evictions += 1
+
+    def stats(self):
+        """Return the hit/miss/eviction counters for this process."""
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions}
+
+    def _file_lock(self):
+        return _FileLock(os.path.join(self.root, ".lock"))
+
+
+class _FileLock:
+    """Exclusive advisory lock on a file, shared across processes."""
+
+    def __init__(self, path):
+        self.path = path
+        self._fh = None
+
+    def __enter__(self):
+        self._fh = open(self.path, "a")
+        if fcntl is not None:
+            fcntl.flock(self._fh, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        if fcntl is not None:
+            fcntl.flock(self._fh, fcntl.LOCK_UN)
+        self._fh.close()
+
+
+def _remove_quietly(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+def get_image_cache():
+    """Return the process-wide cache configured from the environment."""
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = ImageCache(
+                root=os.getenv("VISION_DIARY_CACHE_DIR", DEFAULT_CACHE_DIR),
+                max_bytes=int(os.getenv("VISION_DIARY_CACHE_BYTES", str(DEFAULT_MAX_BYTES))),
+            )
+        return _default_cache
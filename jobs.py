@@ -0,0 +1,472 @@
+"""
+SQLite-backed queue of diary render jobs.
+
+The Streamlit apps submit a job and poll its row; a pool of worker processes
+claims queued jobs and runs the render stages, writing status and per-stage
+progress back to the database as they go. Submitting the same (app, date,
+text) again returns the existing job instead of rendering twice. Workers
+take turns between sessions (see `fair_queue`), so one user's burst of
+submissions cannot starve everyone else, and a queued job reports its place
+in line and an ETA. No external broker is needed:
+
+    python jobs.py --workers 2     # run workers in the foreground
+"""
+
+import argparse
+import hashlib
+import heapq
+import json
+import multiprocessing
+import os
+import signal
+import sqlite3
+import threading
+import time
+
+from telemetry import log, metrics, span
+from workspace import Superseded, read_stamp
+
+DB_PATH = os.getenv("VISION_DIARY_JOBS_DB", "./vision_diary_jobs.sqlite3")
+POLL_INTERVAL = 1.0
+ETA_SAMPLE = 20  # recent finished jobs whose run time predicts a queued job's wait
+SUPERVISE_INTERVAL = 5.0  # seconds between checks for worker processes that exited
+MAX_ATTEMPTS = 3  # a job whose worker dies this many times fails instead of taking down the next one
+# Workers load the render stack and create backend clients at startup rather than on their first job
+PREWARM = os.getenv("VISION_DIARY_PREWARM", "1") == "1"
+
+# Share of overall progress each render stage accounts for
+STAGE_WEIGHTS = {"prompts": 0.10, "images": 0.50, "audio": 0.10, "segments": 0.05, "preview": 0.05, "video": 0.20}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    app TEXT NOT NULL,
+    entry_date TEXT NOT NULL,
+    text TEXT NOT NULL,
+    text_hash TEXT NOT NULL,
+    status TEXT NOT NULL,
+    progress REAL NOT NULL DEFAULT 0,
+    message TEXT,
+    stages TEXT NOT NULL DEFAULT '{}',
+    result TEXT,
+    error TEXT,
+    cancel_requested INTEGER NOT NULL DEFAULT 0,
+    worker_pid INTEGER,
+    session TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_status_created ON jobs (status, created_at);
+"""
+
+
+class JobCancelled(Exception):
+    """Raised inside a worker when the job it is running has been cancelled."""
+
+
+def connect(db_path=DB_PATH):
+    """Open the job database, creating the schema on first use."""
+    conn = sqlite3.connect(db_path, timeout=30, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.executescript(SCHEMA)
+    columns = {row["name"] for row in conn.execute("PRAGMA table_info(jobs)")}
+    # Databases from before fair queueing and dead-worker recovery
+    for column, definition in (("session", "TEXT"), ("attempts", "INTEGER NOT NULL DEFAULT 0")):
+        if column not in columns:
+            try:
+                conn.execute(f"ALTER TABLE jobs ADD COLUMN {column} {definition}")
+            except sqlite3.OperationalError:
+                pass  # another process added it first
+    return conn
+
+
+def job_id_for(app, entry_date, text):
+    """Jobs are keyed by (app, date, text hash) so resubmission is idempotent."""
+    text_hash = hashlib.sha256(text.encode("utf-8")).hexdigest()
+    job_id = hashlib.sha256(f"{app}|{entry_date}|{text_hash}".encode("utf-8")).hexdigest()[:16]
+    return job_id, text_hash
+
+
+def _row_to_job(row):
+    if row is None:
+        return None
+    job = dict(row)
+    job["stages"] = json.loads(job["stages"] or "{}")
+    job["result"] = json.loads(job["result"]) if job["result"] else None
+    # The draft video shown while the full-quality one renders, and how long each took since submission
+    preview = job["stages"].get("preview", {})
+    job["preview_path"] = preview.get("path")
+    job["time_to_preview"] = preview["done_at"] - job["created_at"] if preview.get("done_at") else None
+    job["time_to_final"] = (job["finished_at"] - job["created_at"]
+                            if job["status"] == "done" and job["finished_at"] else None)
+    job["queue_wait"] = job["started_at"] - job["created_at"] if job["started_at"] else None
+    job["queue_position"] = job["eta"] = None  # filled in by get_job while queued
+    return job
+
+
+def fair_queue(conn):
+    """
+    Queued job ids in the order workers claim them: round robin over
+    sessions, oldest first within each. A session's running jobs count as
+    turns it has already had, so a user with a batch in flight waits behind
+    other users' first jobs.
+    """
+    turns = {row["session"]: row["n"] for row in conn.execute(
+        "SELECT session, COUNT(*) AS n FROM jobs WHERE status = 'running' GROUP BY session")}
+    order = []
+    for row in conn.execute("SELECT id, session, created_at FROM jobs WHERE status = 'queued' ORDER BY created_at"):
+        turn = turns.get(row["session"], 0)
+        turns[row["session"]] = turn + 1
+        order.append((turn, row["created_at"], row["id"]))
+    return [job_id for _, _, job_id in sorted(order)]
+
+
+def estimate_wait(conn, position, now=None):
+    """
+    Seconds until the job at `position` in line (1 = next) starts: the
+    running jobs and everything ahead of it are assumed to take as long as
+    the recent average. None until a job has finished.
+    """
+    rows = conn.execute(
+        "SELECT finished_at - started_at AS seconds FROM jobs WHERE status = 'done' AND started_at IS NOT NULL "
+        "ORDER BY finished_at DESC LIMIT ?", (ETA_SAMPLE,)).fetchall()
+    if not rows:
+        return None
+    average = sum(row["seconds"] for row in rows) / len(rows)
+    now = time.time() if now is None else now
+    # When each busy worker frees up; with none busy, the job only waits for a worker's next poll
+    free_at = [max(0.0, average - (now - row["started_at"]))
+               for row in conn.execute("SELECT started_at FROM jobs WHERE status = 'running'")] or [0.0]
+    heapq.heapify(free_at)
+    for _ in range(position - 1):
+        heapq.heappush(free_at, heapq.heappop(free_at) + average)
+    return free_at[0]
+
+
+def queue_stats(db_path=DB_PATH, sample=100):
+    """Jobs waiting and running now, and the median and p95 queue wait of recently started jobs."""
+    conn = connect(db_path)
+    try:
+        counts = {row["status"]: row["n"] for row in conn.execute(
+            "SELECT status, COUNT(*) AS n FROM jobs WHERE status IN ('queued', 'running') GROUP BY status")}
+        waits = sorted(row["wait"] for row in conn.execute(
+            "SELECT started_at - created_at AS wait FROM jobs WHERE started_at IS NOT NULL "
+            "ORDER BY started_at DESC LIMIT ?", (sample,)))
+    finally:
+        conn.close()
+    stats = {"queued": counts.get("queued", 0), "running": counts.get("running", 0),
+             "queue_wait_p50": None, "queue_wait_p95": None}
+    if waits:
+        stats["queue_wait_p50"] = round(waits[len(waits) // 2], 3)
+        stats["queue_wait_p95"] = round(waits[min(len(waits) - 1, int(len(waits) * 0.95))], 3)
+    return stats
+
+
+def _needs_rerender(job):
+    """
+    A finished render is redone if its video is gone, it fell back to
+    placeholder scenes, or another text for the same date has since been
+    published over it (every text of a date shares the entry's paths).
+    """
+    result = job["result"]
+    placeholders = result.get("stats", {}).get("backends", {}).get("placeholder", 0)
+    if placeholders > 0 or not os.path.exists(result["video_path"]):
+        return True
+    stamp = read_stamp(os.path.dirname(result["video_path"]))
+    return stamp is None or stamp.get("text_hash") != job["text_hash"]
+
+
+def submit_job(app, entry_date, text, db_path=DB_PATH, session=None):
+    """
+    Queue a render and return the job. An identical job that is queued,
+    running or done (with its video still on disk and no placeholder
+    scenes) is returned as is; a failed or cancelled one is queued again.
+    session identifies the submitter (e.g. a browser session) for fair
+    queueing; jobs without one share a single turn.
+    """
+    job_id, text_hash = job_id_for(app, str(entry_date), text)
+    conn = connect(db_path)
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        _reap_dead_jobs(conn, job_id)
+        row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        existing = _row_to_job(row)
+        if existing is None:
+            conn.execute(
+                "INSERT INTO jobs (id, app, entry_date, text, text_hash, status, session, created_at) "
+                "VALUES (?, ?, ?, ?, ?, 'queued', ?, ?)",
+                (job_id, app, str(entry_date), text, text_hash, session, time.time()),
+            )
+        elif existing["status"] in ("failed", "cancelled") or (
+                existing["status"] == "done" and _needs_rerender(existing)):
+            conn.execute(
+                "UPDATE jobs SET status = 'queued', progress = 0, message = NULL, stages = '{}', "
+                "result = NULL, error = NULL, cancel_requested = 0, worker_pid = NULL, session = ?, "
+                "attempts = 0, created_at = ?, started_at = NULL, finished_at = NULL WHERE id = ?",
+                (session, time.time(), job_id),
+            )
+        conn.execute("COMMIT")
+        return _row_to_job(conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone())
+    finally:
+        conn.close()
+
+
+def get_job(job_id, db_path=DB_PATH):
+    """
+    Return the job as a dict, or None if it does not exist. A queued job
+    also has its queue_position (1 = next) and eta in seconds. A running job
+    whose worker has died is put back in the queue first.
+    """
+    conn = connect(db_path)
+    try:
+        job = _row_to_job(conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone())
+        if job is not None and job["status"] == "running" and not _pid_alive(job["worker_pid"]):
+            conn.execute("BEGIN IMMEDIATE")
+            _reap_dead_jobs(conn, job_id)
+            conn.execute("COMMIT")
+            job = _row_to_job(conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone())
+        if job is not None and job["status"] == "queued":
+            queue = fair_queue(conn)
+            if job_id in queue:
+                job["queue_position"] = queue.index(job_id) + 1
+                job["eta"] = estimate_wait(conn, job["queue_position"])
+        return job
+    finally:
+        conn.close()
+
+
+def cancel_job(job_id, db_path=DB_PATH):
+    """
+    Cancel a queued job (or a running one whose worker has died) immediately,
+    or ask the worker running it to stop.
+    """
+    conn = connect(db_path)
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        conn.execute("UPDATE jobs SET cancel_requested = 1 WHERE id = ? AND status = 'running'", (job_id,))
+        _reap_dead_jobs(conn, job_id)
+        conn.execute(
+            "UPDATE jobs SET status = 'cancelled', finished_at = ? WHERE id = ? AND status = 'queued'",
+            (time.time(), job_id),
+        )
+        conn.execute("COMMIT")
+    finally:
+        conn.close()
+
+
+def claim_job(db_path=DB_PATH):
+    """Atomically move the next queued job (see fair_queue) to running and return it."""
+    conn = connect(db_path)
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        _reap_dead_jobs(conn)
+        queue = fair_queue(conn)
+        if not queue:
+            conn.execute("COMMIT")
+            return None
+        conn.execute(
+            "UPDATE jobs SET status = 'running', worker_pid = ?, started_at = ?, attempts = attempts + 1 "
+            "WHERE id = ?",
+            (os.getpid(), time.time(), queue[0]),
+        )
+        conn.execute("COMMIT")
+        job = _row_to_job(conn.execute("SELECT * FROM jobs WHERE id = ?", (queue[0],)).fetchone())
+    finally:
+        conn.close()
+    metrics.observe("job.queue_wait", job["queue_wait"])
+    return job
+
+
+def update_progress(job_id, stage, fraction, message=None, db_path=DB_PATH, details=None):
+    """
+    Record a stage's progress (plus any details, e.g. the preview's path);
+    returns True if the job has been cancelled.
+    """
+    conn = connect(db_path)
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        row = conn.execute("SELECT stages, cancel_requested FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        stages = json.loads(row["stages"] or "{}")
+        stages[stage] = dict(details or {}, progress=fraction, status="done" if fraction >= 1 else "running")
+        if fraction >= 1:
+            stages[stage]["done_at"] = time.time()
+        progress = sum(STAGE_WEIGHTS.get(name, 0) * state["progress"] for name, state in stages.items())
+        conn.execute(
+            "UPDATE jobs SET stages = ?, progress = ?, message = COALESCE(?, message) WHERE id = ?",
+            (json.dumps(stages), min(progress, 1.0), message, job_id),
+        )
+        conn.execute("COMMIT")
+        return bool(row["cancel_requested"])
+    finally:
+        conn.close()
+
+
+def finish_job(job_id, status, result=None, error=None, db_path=DB_PATH):
+    conn = connect(db_path)
+    try:
+        conn.execute(
+            "UPDATE jobs SET status = ?, result = ?, error = ?, finished_at = ?, "
+            "progress = CASE WHEN ? = 'done' THEN 1 ELSE progress END WHERE id = ?",
+            (status, json.dumps(result) if result is not None else None, error, time.time(), status, job_id),
+        )
+    finally:
+        conn.close()
+
+
+def requeue_stale_jobs(db_path=DB_PATH):
+    """Put jobs whose worker process died back in the queue."""
+    conn = connect(db_path)
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        _reap_dead_jobs(conn)
+        conn.execute("COMMIT")
+    finally:
+        conn.close()
+
+
+def _reap_dead_jobs(conn, job_id=None):
+    """
+    Settle running jobs (all of them, or just job_id) whose worker process is
+    gone; call inside a transaction. A job that was asked to stop is
+    cancelled, one whose workers have died MAX_ATTEMPTS times fails, and any
+    other goes back in the queue.
+    """
+    query = "SELECT id, worker_pid, cancel_requested, attempts FROM jobs WHERE status = 'running'"
+    params = ()
+    if job_id is not None:
+        query, params = query + " AND id = ?", (job_id,)
+    for row in conn.execute(query, params).fetchall():
+        if _pid_alive(row["worker_pid"]):
+            continue
+        if row["cancel_requested"]:
+            conn.execute("UPDATE jobs SET status = 'cancelled', finished_at = ? WHERE id = ?",
+                         (time.time(), row["id"]))
+        elif row["attempts"] >= MAX_ATTEMPTS:
+            conn.execute("UPDATE jobs SET status = 'failed', error = ?, finished_at = ? WHERE id = ?",
+                         (f"The worker rendering this entry stopped {row['attempts']} times", time.time(),
+                          row["id"]))
+        else:
+            conn.execute("UPDATE jobs SET status = 'queued', worker_pid = NULL, stages = '{}', progress = 0, "
+                         "message = NULL, started_at = NULL WHERE id = ?", (row["id"],))
+        log(f"Worker {row['worker_pid']} died running job {row['id']}", level="warning", job=row["id"])
+
+
+def _pid_alive(pid):
+    if not pid:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def execute_job(job, db_path=DB_PATH, **render_options):
+    """Run one claimed job to completion and record the outcome."""
+    from render import render_entry  # heavy imports stay out of the Streamlit process
+
+    def on_progress(stage, fraction, message, **details):
+        if update_progress(job["id"], stage, fraction, message, db_path=db_path, details=details):
+            raise JobCancelled(job["id"])
+
+    try:
+        with span("job", job=job["id"], app=job["app"], queue_wait=job["queue_wait"]):
+            # The job id names its workspace, so a retry after a crash starts from a clean one
+            result = render_entry(job["app"], job["entry_date"], job["text"], on_progress=on_progress,
+                                  workspace=job["id"], submitted_at=job["created_at"], **render_options)
+    except JobCancelled:
+        log(f"Job {job['id']} cancelled", job=job["id"])
+        finish_job(job["id"], "cancelled", db_path=db_path)
+    except Superseded as e:
+        # A later edit of the same date already published; this older render must not replace it
+        log(f"Job {job['id']} superseded: {e}", level="warning", job=job["id"])
+        finish_job(job["id"], "cancelled", error=str(e), db_path=db_path)
+    except Exception as e:
+        log(f"Job {job['id']} failed: {e}", level="error", job=job["id"])
+        finish_job(job["id"], "failed", error=str(e), db_path=db_path)
+    else:
+        result["stats"]["queue_wait"] = round(job["queue_wait"], 3)
+        finish_job(job["id"], "done", result=result, db_path=db_path)
+
+
+def run_worker(db_path=DB_PATH, poll_interval=POLL_INTERVAL, prewarm_browsers=False, prewarm=PREWARM):
+    """Claim and execute jobs forever, after prewarming (see render.prewarm) if asked to."""
+    if prewarm:
+        from render import prewarm as prewarm_render
+        prewarm_render(browsers=prewarm_browsers)
+    elif prewarm_browsers:
+        from backends import get_browser_pool
+        get_browser_pool()
+    while True:
+        job = claim_job(db_path)
+        if job is None:
+            time.sleep(poll_interval)
+            continue
+        log(f"Worker {os.getpid()} running job {job['id']} ({job['app']}, {job['entry_date']}) "
+            f"after {job['queue_wait']:.1f}s in the queue", job=job["id"], queue_wait=job["queue_wait"])
+        execute_job(job, db_path)
+
+
+def _start_worker(db_path, prewarm_browsers, prewarm):
+    context = multiprocessing.get_context("spawn")  # never fork the Streamlit server's threads
+    process = context.Process(target=run_worker, args=(db_path, POLL_INTERVAL, prewarm_browsers, prewarm),
+                              daemon=True)
+    process.start()
+    return process
+
+
+def start_workers(count=2, db_path=DB_PATH, prewarm_browsers=False, prewarm=PREWARM, supervise=True):
+    """
+    Start `count` daemon worker processes and return the list of them. With
+    supervise, a background thread runs supervise_workers on that list.
+    """
+    connect(db_path).close()
+    requeue_stale_jobs(db_path)
+    workers = [_start_worker(db_path, prewarm_browsers, prewarm) for _ in range(count)]
+    if supervise:
+        threading.Thread(target=supervise_workers, args=(workers, db_path, prewarm_browsers, prewarm),
+                         name="job-supervisor", daemon=True).start()
+    return workers
+
+
+def supervise_workers(workers, db_path=DB_PATH, prewarm_browsers=False, prewarm=PREWARM,
+                      interval=SUPERVISE_INTERVAL):
+    """
+    Replace (in the list) any worker that exits, e.g. after a crash or the
+    OOM killer, and requeue the job it was running. Workers stopped with
+    terminate() stay stopped; once all of them are, this returns.
+    """
+    while True:
+        time.sleep(interval)
+        if all(process.exitcode == -signal.SIGTERM for process in workers):
+            return
+        for i, process in enumerate(workers):
+            if process.exitcode is None or process.exitcode == -signal.SIGTERM:
+                continue
+            log(f"Worker {process.pid} exited with code {process.exitcode}; starting a replacement",
+                level="warning")
+            requeue_stale_jobs(db_path)
+            workers[i] = _start_worker(db_path, prewarm_browsers, prewarm)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run Vision Diary render workers.")
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--db", default=DB_PATH)
+    parser.add_argument("--prewarm-browsers", action="store_true")
+    parser.add_argument("--no-prewarm", action="store_true", help="load the render stack on the first job instead")
+    args = parser.parse_args()
+
+    workers = start_workers(args.workers, args.db, args.prewarm_browsers, prewarm=not args.no_prewarm,
+                            supervise=False)
+    print(f"Started {len(workers)} workers on {args.db}")
+    supervise_workers(workers, args.db, args.prewarm_browsers, prewarm=not args.no_prewarm)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+"""
+Per-entry render manifest for incremental re-renders.
+
+manifest.json in an entry's directory records, for every scene of the last
+successful render, the prompt hash and the image with its content hash, plus
+every shot's duration and encoded video segment and every sentence's
+narration segment. The next render of the entry diffs its prompts against it:
+scenes whose prompt did not change keep their image without going back to
+the generator, and their video segments are found again by content hash, so
+a one-sentence edit regenerates and re-encodes one scene before the segments
+are stitched back together.
+"""
+
+import hashlib
+import json
+import os
+
+from backends import PLACEHOLDER
+from encoder import file_sha256
+from image_cache import normalize_prompt
+
+MANIFEST_NAME = "manifest.json"
+VERSION = 2
+
+
+def prompt_hash(prompt):
+    return hashlib.sha256(normalize_prompt(prompt).encode("utf-8")).hexdigest()
+
+
+def manifest_path(save_directory):
+    return os.path.join(save_directory, MANIFEST_NAME)
+
+
+def load_manifest(save_directory):
+    """Return the entry's manifest, or None if it is missing or unreadable."""
+    try:
+        with open(manifest_path(save_directory)) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return manifest if manifest.get("version") == VERSION else None
+
+
+def save_manifest(save_directory, manifest):
+    """Write the manifest atomically."""
+    path = manifest_path(save_directory)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, path)
+    return path
+
+
+def diff_prompts(manifest, prompts):
+    """Return {"unchanged", "changed", "added", "removed"} lists of scene indices."""
+    old = [scene["prompt_hash"] for scene in (manifest or {}).get("scenes", [])]
+    diff = {"unchanged": [], "changed": [], "added": [], "removed": list(range(len(prompts), len(old)))}
+    for i, prompt in enumerate(prompts):
+        if i >= len(old):
+            diff["added"].append(i)
+        elif old[i] == prompt_hash(prompt):
+            diff["unchanged"].append(i)
+        else:
+            diff["changed"].append(i)
+    return diff
+
+
+def reusable_images(manifest, prompts, save_directory):
+    """
+    Indices of scenes whose prompt is unchanged and whose image on disk is
+    still the one the manifest recorded. Placeholder images are never kept,
+    so those scenes go back to the real backends.
+    """
+    if manifest is None:
+        return set()
+    scenes = manifest["scenes"]
+    reuse = set()
+    for i in diff_prompts(manifest, prompts)["unchanged"]:
+        image, digest = scenes[i].get("image"), scenes[i].get("image_sha256")
+        if not image or not digest or scenes[i].get("backend") == PLACEHOLDER:
+            continue
+        path = os.path.join(save_directory, image)
+        if os.path.exists(path) and file_sha256(path) == digest:
+            reuse.add(i)
+    return reuse
+
+
+def build_manifest(app, save_directory, prompts, image_paths, images, shots, segments, sources,
+                   sentences, sentence_segments, sentence_durations, audio_path, video_path):
+    """
+    Describe a finished render. image_paths holds every scene's expected image
+    path and images the ones that were generated; shots are the video's
+    [(position in images, seconds)] and segments their encoded segments (None
+    when the video was not segmented). sources maps scene index to the
+    backend that made its image.
+    """
+    rendered = {path: position for position, path in enumerate(images)}
+    scene_of = {}
+    scenes = []
+    for i, (prompt, path) in enumerate(zip(prompts, image_paths)):
+        scene = {"index": i, "prompt_hash": prompt_hash(prompt), "image": None, "image_sha256": None,
+                 "backend": sources.get(i)}
+        if path in rendered:
+            scene_of[rendered[path]] = i
+            scene["image"] = os.path.relpath(path, save_directory)
+            scene["image_sha256"] = file_sha256(path)
+        scenes.append(scene)
+    return {
+        "version": VERSION,
+        "app": app,
+        "scenes": scenes,
+        "shots": [
+            {"scene": scene_of[position], "duration": round(seconds, 3),
+             "segment": os.path.relpath(segments[n], save_directory) if segments else None}
+            for n, (position, seconds) in enumerate(shots)
+        ],
+        "sentences": [
+            {"hash": prompt_hash(sentence), "audio_segment": segment, "duration": round(duration, 3)}
+            for sentence, segment, duration in zip(sentences, sentence_segments, sentence_durations)
+        ],
+        "audio": os.path.relpath(audio_path, save_directory),
+        "video": os.path.relpath(video_path, save_directory),
+    }
+
+
+def prune_segments(segment_dir, keep):
+    """Delete segments in segment_dir that the latest render no longer uses."""
+    keep = {os.path.abspath(path) for path in keep}
+    try:
+        names = os.listdir(segment_dir)
+    except FileNotFoundError:
+        return 0
+    removed = 0
+    for name in names:
+        path = os.path.abspath(os.path.join(segment_dir, name))
+        if path not in keep:
+            try:
+                os.remove(path)
+                removed += 1
+            except OSError:
+                pass
+    return removed
@@ -0,0 +1,226 @@
+"""
+Small local HTTP server for rendered videos, audio and images.
+
+Handing st.video or st.download_button a path or an open file copies the
+whole MP4 into the Streamlit process for every session that views it. When
+VISION_DIARY_MEDIA_URL says where browsers can reach this server (usually a
+path on the app's own domain that a reverse proxy forwards here), the apps
+give the browser a URL on it instead; without one they fall back to sending
+files through Streamlit, which works wherever the app does. The server
+answers HTTP range requests, so players seek and fetch incrementally. It revalidates with ETags
+(304 Not Modified) and sends file bytes with sendfile(2), so they are never
+copied through Python. Only media files under the root directory are served.
+"""
+
+import email.utils
+import os
+import sys
+import threading
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from telemetry import log
+
+MEDIA_HOST = os.getenv("VISION_DIARY_MEDIA_HOST", "127.0.0.1")
+# Each app's server has its own default port, clear of Streamlit's 8501 and of the 8502 the
+# README suggests for a second app; VISION_DIARY_MEDIA_PORT overrides both
+DEFAULT_PORTS = {"replicate": 8511, "selenium": 8512}
+MEDIA_PORT = os.getenv("VISION_DIARY_MEDIA_PORT")
+# Base URL browsers reach the server at, e.g. https://diary.example.com/media-server or
+# http://localhost:8511 for a local run of diary.py; unset, the apps send media through Streamlit
+MEDIA_URL = os.getenv("VISION_DIARY_MEDIA_URL")
+
+MEDIA_TYPES = {
+    ".mp4": "video/mp4",
+    ".mp3": "audio/mpeg",
+    ".jpg": "image/jpeg",
+    ".jpeg": "image/jpeg",
+    ".png": "image/png",
+}
+
+
+def parse_range(header, size):
+    """
+    Return (start, end) inclusive for a single "bytes=" range, None to send
+    the whole file (no range, or one this server does not handle), or
+    ValueError if the range cannot be satisfied.
+    """
+    if not header or not header.startswith("bytes=") or "," in header:
+        return None
+    first, _, last = header[len("bytes="):].strip().partition("-")
+    try:
+        if not first:  # suffix range: the last N bytes
+            length = int(last)
+            if length <= 0:
+                raise ValueError
+            return max(0, size - length), size - 1
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+    except ValueError:
+        raise ValueError(f"Bad range {header!r}")
+    if start >= size or end < start:
+        raise ValueError(f"Range {header!r} outside {size} bytes")
+    return start, end
+
+
+def etag_for(stat):
+    return f'"{stat.st_size:x}-{stat.st_mtime_ns:x}"'
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # Players routinely abort a range request once they have what they need
+        if not isinstance(sys.exc_info()[1], (BrokenPipeError, ConnectionResetError)):
+            super().handle_error(request, client_address)
+
+
+class MediaServer:
+    """Serves media files under root at /media/<path relative to root> (port 0 picks a free port)."""
+
+    def __init__(self, root=".", host=MEDIA_HOST, port=0, public_url=MEDIA_URL):
+        self.root = os.path.realpath(root)
+        self.host = host
+        self.port = port
+        self.public_url = public_url.rstrip("/") if public_url else None
+        self.stats = {"requests": 0, "partial": 0, "not_modified": 0, "bytes_sent": 0}
+        self._lock = threading.Lock()
+        self._server = None
+
+    @property
+    def base_url(self):
+        if self.public_url:
+            return self.public_url
+        host = "localhost" if self.host in ("", "0.0.0.0", "::") else self.host
+        return f"http://{host}:{self._server.server_address[1]}"
+
+    def start(self):
+        try:
+            self._server = _Server((self.host, self.port), self._handler())
+        except OSError as e:
+            # The public URL routes to this port; another one would leave every media link dead
+            raise RuntimeError(f"Media server cannot listen on {self.host}:{self.port}: {e}. "
+                               "Free the port or set VISION_DIARY_MEDIA_PORT") from e
+        threading.Thread(target=self._server.serve_forever, name="media-server", daemon=True).start()
+        log(f"Media server for {self.root} at {self.base_url}")
+        return self
+
+    def close(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def url_for(self, path, download=None):
+        """URL of a file under root; download= a file name makes browsers save it instead of playing it."""
+        relative = os.path.relpath(os.path.realpath(path), self.root)
+        url = f"{self.base_url}/media/{urllib.parse.quote(relative.replace(os.sep, '/'))}"
+        if download:
+            url += "?" + urllib.parse.urlencode({"download": download})
+        return url
+
+    def resolve(self, url_path):
+        """The file a /media/ URL path refers to, or None if it must not be served."""
+        if not url_path.startswith("/media/"):
+            return None
+        path = os.path.realpath(os.path.join(self.root, urllib.parse.unquote(url_path[len("/media/"):])))
+        if not path.startswith(self.root + os.sep) or os.path.splitext(path)[1].lower() not in MEDIA_TYPES:
+            return None
+        return path if os.path.isfile(path) else None
+
+    def _count(self, **amounts):
+        with self._lock:
+            for key, amount in amounts.items():
+                self.stats[key] += amount
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def do_HEAD(self):
+                self._serve(send_body=False)
+
+            def do_GET(self):
+                self._serve(send_body=True)
+
+            def _error(self, status, headers=()):
+                self.send_response(status)
+                for name, value in headers:
+                    self.send_header(name, value)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+
+            def _serve(self, send_body):
+                server._count(requests=1)
+                url = urllib.parse.urlsplit(self.path)
+                path = server.resolve(url.path)
+                if path is None:
+                    return self._error(404)
+                with open(path, "rb") as f:
+                    stat = os.fstat(f.fileno())
+                    etag = etag_for(stat)
+                    if etag in [tag.strip() for tag in self.headers.get("If-None-Match", "").split(",")]:
+                        server._count(not_modified=1)
+                        return self._error(304, [("ETag", etag)])
+
+                    range_header = self.headers.get("Range")
+                    if_range = self.headers.get("If-Range")
+                    if if_range and if_range != etag:
+                        range_header = None  # the file changed since the client's first chunk
+                    try:
+                        byte_range = parse_range(range_header, stat.st_size)
+                    except ValueError:
+                        return self._error(416, [("Content-Range", f"bytes */{stat.st_size}")])
+                    start, end = byte_range or (0, stat.st_size - 1)
+                    length = max(0, end - start + 1)
+
+                    self.send_response(206 if byte_range else 200)
+                    self.send_header("Content-Type", MEDIA_TYPES[os.path.splitext(path)[1].lower()])
+                    self.send_header("Content-Length", str(length))
+                    self.send_header("Accept-Ranges", "bytes")
+                    self.send_header("ETag", etag)
+                    self.send_header("Last-Modified", email.utils.formatdate(stat.st_mtime, usegmt=True))
+                    self.send_header("Cache-Control", "no-cache")  # re-renders reuse the path; revalidate
+                    if byte_range:
+                        self.send_header("Content-Range", f"bytes {start}-{end}/{stat.st_size}")
+                    download = urllib.parse.parse_qs(url.query).get("download")
+                    if download:
+                        name = os.path.basename(download[0]).replace('"', "")
+                        self.send_header("Content-Disposition", f'attachment; filename="{name}"')
+                    self.end_headers()
+                    if send_body and length:
+                        # Zero-copy from the page cache to the socket where the OS supports it
+                        sent = self.connection.sendfile(f, start, length)
+                        server._count(bytes_sent=sent, partial=int(bool(byte_range)))
+
+        return Handler
+
+
+_media_server = None
+_media_server_lock = threading.Lock()
+
+
+def media_port(app):
+    """The port app's media server listens on: VISION_DIARY_MEDIA_PORT, else the app's default."""
+    return int(MEDIA_PORT) if MEDIA_PORT else DEFAULT_PORTS[app]
+
+
+def get_media_server(app, root="."):
+    """
+    The process's media server for app ("replicate" or "selenium"), started
+    on first use, or None when no VISION_DIARY_MEDIA_URL is set and media
+    should go through Streamlit.
+    """
+    global _media_server
+    if not MEDIA_URL:
+        return None
+    with _media_server_lock:
+        if _media_server is None:
+            _media_server = MediaServer(root, port=media_port(app)).start()
+        return _media_server
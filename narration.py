@@ -0,0 +1,153 @@
+"""
+Sentence-level narration.
+
+Each sentence is synthesized separately (in parallel), cached by (sentence,
+language, backend) and the pieces are concatenated into the final track. The
+measured length of every sentence is returned so each scene can be held on
+screen exactly while its sentences are being read. Editing one sentence only
+re-synthesizes that sentence.
+
+The TTS backend is pluggable: VISION_DIARY_TTS_BACKEND is either a registered
+name ("gtts") or a "module:function" path to any callable
+synthesize(text, lang, out_path), which lets worker processes use an offline
+stand-in.
+"""
+
+import hashlib
+import importlib
+import os
+import subprocess
+import tempfile
+import threading
+
+from concurrency import run_ordered
+from encoder import ffmpeg_binary, probe_duration
+from image_cache import ImageCache
+from telemetry import span
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "vision_diary", "tts")
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+MAX_WORKERS = int(os.getenv("VISION_DIARY_TTS_CONCURRENCY", "4"))
+# Caps TTS requests across every entry narrating in this process
+_tts_slots = threading.BoundedSemaphore(MAX_WORKERS)
+
+
+def gtts_synthesize(text, lang, out_path):
+    """Synthesize text with Google Text-to-Speech."""
+    from gtts import gTTS
+
+    gTTS(text, lang=lang).save(out_path)
+
+
+BACKENDS = {"gtts": gtts_synthesize}
+
+
+def get_tts_backend(name=None):
+    """Resolve a backend by registered name or "module:function" path."""
+    name = name or os.getenv("VISION_DIARY_TTS_BACKEND", "gtts")
+    if name in BACKENDS:
+        return name, BACKENDS[name]
+    module_name, _, attr = name.partition(":")
+    if not attr:
+        raise ValueError(f"Unknown TTS backend: {name}")
+    return name, getattr(importlib.import_module(module_name), attr)
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_sentence_cache():
+    """Per-sentence audio shares the image cache's LRU store, in its own directory."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = ImageCache(
+                root=os.getenv("VISION_DIARY_TTS_CACHE_DIR", DEFAULT_CACHE_DIR),
+                max_bytes=int(os.getenv("VISION_DIARY_TTS_CACHE_BYTES", str(DEFAULT_MAX_BYTES))),
+                extension=".mp3",
+            )
+        return _cache
+
+
+def sentence_key(sentence, lang, backend_name):
+    raw = "\x1f".join([sentence.strip(), lang, backend_name])
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def sentence_path(sentence, lang="en", backend=None):
+    """Cache path holding the audio for sentence (whether or not it exists yet)."""
+    backend_name, _ = get_tts_backend(backend)
+    return get_sentence_cache().path_for(sentence_key(sentence, lang, backend_name))
+
+
+def synthesize_sentences(sentences, lang="en", backend=None, max_workers=MAX_WORKERS):
+    """
+    Return the cached audio path for every sentence, synthesizing only the
+    ones not cached yet.
+    """
+    backend_name, synthesize = get_tts_backend(backend)
+    cache = get_sentence_cache()
+
+    def synthesize_one(i, sentence):
+        cached = cache.path_for(sentence_key(sentence, lang, backend_name))
+        with span("tts.sentence", sentence=i + 1, backend=backend_name) as tts:
+            if os.path.exists(cached):
+                os.utime(cached)  # mark as recently used
+                tts.set(cached=True)
+                return cached
+            fd, tmp_path = tempfile.mkstemp(suffix=".mp3")
+            os.close(fd)
+            try:
+                synthesize(sentence, lang, tmp_path)
+                tts.set(cached=False, bytes=os.path.getsize(tmp_path))
+                cache.put(sentence_key(sentence, lang, backend_name), tmp_path)
+            finally:
+                os.remove(tmp_path)
+            return cached
+
+    outcomes = run_ordered(synthesize_one, sentences, max_workers=max_workers, slots=_tts_slots)
+    for sentence, (_, error) in zip(sentences, outcomes):
+        if error is not None:
+            raise RuntimeError(f"Could not synthesize {sentence!r}: {error}")
+    return [path for path, _ in outcomes]
+
+
+def concat_audio(segment_paths, audio_path):
+    """Join audio segments into one track, stream-copying when possible."""
+    with tempfile.TemporaryDirectory(prefix="vision_diary_tts_") as workdir:
+        list_path = os.path.join(workdir, "segments.ffconcat")
+        with open(list_path, "w") as f:
+            f.write("ffconcat version 1.0\n")
+            for path in segment_paths:
+                escaped = os.path.abspath(path).replace("'", "'\\''")
+                f.write(f"file '{escaped}'\n")
+
+        # Write beside the target (keeping the extension ffmpeg uses to pick the format), then rename
+        directory, name = os.path.split(os.path.abspath(audio_path))
+        tmp_path = os.path.join(directory, f".partial-{name}")
+        base = [ffmpeg_binary(), "-y", "-hide_banner", "-loglevel", "error",
+                "-f", "concat", "-safe", "0", "-i", list_path]
+        result = subprocess.run(base + ["-c", "copy", tmp_path], stdout=subprocess.PIPE,
+                                stderr=subprocess.PIPE, text=True)
+        if result.returncode != 0:
+            result = subprocess.run(base + [tmp_path], stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+        if result.returncode != 0:
+            raise RuntimeError(f"ffmpeg failed: {result.stderr.strip()}")
+        os.replace(tmp_path, audio_path)
+    return audio_path
+
+
+def narrate(sentences, audio_path, lang="en", backend=None):
+    """
+    Synthesize sentences into audio_path and return each sentence's duration
+    in seconds.
+    """
+    if not sentences:
+        raise ValueError("Nothing to narrate.")
+    segments = synthesize_sentences(sentences, lang=lang, backend=backend)
+    durations = [probe_duration(path) for path in segments]
+    with span("tts.concat", sentences=len(segments)):
+        concat_audio(segments, audio_path)
+    return durations
+
@@ -0,0 +1,267 @@
+"""
+Stage DAG executor for rendering a diary entry.
+
+Each stage declares the stages it depends on and starts as soon as they have
+finished, so narration runs alongside image generation and each scene's
+video segment is encoded while the remaining images are still being
+generated. Per-stage wall times are recorded so the critical path can be
+reported.
+"""
+
+import contextlib
+import contextvars
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+from telemetry import log, span
+
+
+class Pipeline:
+    """Runs named stages concurrently, respecting their dependencies."""
+
+    def __init__(self, max_workers=4, thread_initializer=None):
+        self.max_workers = max_workers
+        self.thread_initializer = thread_initializer
+        self.stages = {}
+        self.timings = {}
+
+    def add(self, name, func, deps=()):
+        """
+        Register a stage. func is called with one keyword argument per
+        dependency, named after the dependency and bound to its result.
+        """
+        if name in self.stages:
+            raise ValueError(f"Duplicate stage: {name}")
+        for dep in deps:
+            if dep not in self.stages:
+                raise ValueError(f"Stage {name} depends on unknown stage {dep}")
+        self.stages[name] = (func, tuple(deps))
+        return self
+
+    def run(self, on_stage_done=None):
+        """
+        Execute every stage and return {stage name: result}.
+
+        The first stage to raise cancels the stages that have not started and
+        re-raises its exception. on_stage_done(name, seconds) is called from
+        the calling thread as stages finish.
+        """
+        results = {}
+        self.timings = {}
+        remaining = dict(self.stages)
+        running = {}
+
+        def timed(name, func, kwargs):
+            started = time.monotonic()
+            try:
+                with span(f"stage.{name}"):
+                    return func(**kwargs)
+            finally:
+                self.timings[name] = (started, time.monotonic())
+
+        with ThreadPoolExecutor(max_workers=self.max_workers, initializer=self.thread_initializer) as executor:
+            while remaining or running:
+                for name, (func, deps) in list(remaining.items()):
+                    if all(dep in results for dep in deps):
+                        kwargs = {dep: results[dep] for dep in deps}
+                        context = contextvars.copy_context()
+                        running[executor.submit(context.run, timed, name, func, kwargs)] = name
+                        del remaining[name]
+
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    name = running.pop(future)
+                    error = future.exception()
+                    if error is not None:
+                        for other in running:
+                            other.cancel()
+                        raise error
+                    results[name] = future.result()
+                    if on_stage_done is not None:
+                        start, end = self.timings[name]
+                        on_stage_done(name, end - start)
+        return results
+
+    def critical_path(self):
+        """Return the chain of stages that determined the total wall time."""
+        if not self.timings:
+            return []
+        name = max(self.timings, key=lambda n: self.timings[n][1])
+        path = [name]
+        while self.stages[name][1]:
+            name = max(self.stages[name][1], key=lambda n: self.timings[n][1])
+            path.append(name)
+        return list(reversed(path))
+
+    def report(self):
+        """Return human readable per-stage timing lines, critical path first."""
+        if not self.timings:
+            return []
+        origin = min(start for start, _ in self.timings.values())
+        total = max(end for _, end in self.timings.values()) - origin
+        lines = [f"Total: {total:.1f}s, critical path: {' → '.join(self.critical_path())}"]
+        for name, (start, end) in sorted(self.timings.items(), key=lambda item: item[1][0]):
+            lines.append(f"{name}: {end - start:.1f}s (started at +{start - origin:.1f}s)")
+        return lines
+
+
+class SceneSegments:
+    """
+    Calls prepare(index, image_path, narration) for each scene as soon as its
+    image has landed and the narration is done, on a small thread pool.
+    Preparing is best effort: a failure is logged and left to the final
+    encode. Scenes that have not started wait while `held()` (e.g. while the
+    draft preview encodes).
+    """
+
+    def __init__(self, prepare, max_workers=1):
+        self.prepare = prepare
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+        self._lock = threading.Lock()
+        self._scenes = []
+        self._narration = None
+        self._narrated = False
+        self._futures = []
+        self._running = threading.Event()
+        self._running.set()
+
+    def add(self, index, image_path):
+        """Queue a scene whose image has landed; safe to call from any thread."""
+        with self._lock:
+            self._scenes.append((index, image_path))
+            if self._narrated:
+                self._submit(index, image_path)
+
+    def narrate(self, narration):
+        """Record the narration, start the scenes that were waiting for it and return it."""
+        with self._lock:
+            self._narration, self._narrated = narration, True
+            for index, image_path in self._scenes:
+                self._submit(index, image_path)
+        return narration
+
+    def _submit(self, index, image_path):
+        context = contextvars.copy_context()
+        self._futures.append(self._executor.submit(context.run, self._prepare_one, index, image_path))
+
+    @contextlib.contextmanager
+    def held(self):
+        """Keep scenes that have not started from starting inside the block."""
+        self._running.clear()
+        try:
+            yield
+        finally:
+            self._running.set()
+
+    def _prepare_one(self, index, image_path):
+        self._running.wait()
+        try:
+            self.prepare(index, image_path, self._narration)
+        except Exception as e:
+            log(f"Could not prepare scene {index + 1} early: {e}", level="warning", scene=index + 1)
+
+    def wait(self):
+        """Wait for every queued scene, then stop the pool."""
+        with self._lock:
+            futures = list(self._futures)
+        for future in futures:
+            future.result()
+        self._executor.shutdown()
+
+    def cancel(self):
+        """Drop the scenes that have not started (the render failed)."""
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+def build_render_pipeline(story, save_directory, audio_path, video_path,
+                          generate_prompts, generate_images, generate_audio, create_video,
+                          scene_timeline=None, create_preview=None, prepare_scene=None, max_workers=4,
+                          thread_initializer=None):
+    """
+    Build the render DAG shared by both apps:
+
+        prompts → images ┐ ┌→ [preview] ─┐
+        audio ───────────┴─┴→ [segments] ─┴→ video
+
+    Whatever generate_audio returns (e.g. per-sentence durations) is passed
+    with the image paths to scene_timeline(images, narration), which returns
+    the shots as [(image position, seconds)] (an image may appear in several
+    shots); without it create_video shows every image once and splits the
+    audio evenly. Both encoders read the stills from disk themselves.
+    create_preview(images, audio_path, durations), if given, runs as soon
+    as images and narration exist and before the full-quality video, with
+    the same shots (durations is None without a scene_timeline).
+    prepare_scene(index, image_path, narration), if given, runs through
+    SceneSegments for each image as it lands (generate_images then gets an
+    on_scene callback) so its segment is encoded before the video stage
+    starts; the "segments" stage waits for it.
+    """
+    timeline = {}
+    scene_segments = SceneSegments(prepare_scene) if prepare_scene is not None else None
+
+    def shots_for(images, audio):
+        # Computed once and shared by the preview and the final video
+        if "shots" not in timeline:
+            timeline["shots"] = scene_timeline(images, audio) if scene_timeline is not None else None
+        return timeline["shots"]
+
+    def run_preview(audio, images):
+        if not images:
+            return None
+        if scene_segments is not None:
+            # The draft is what the user waits for; queued segments start after it
+            with scene_segments.held():
+                return draft(audio, images)
+        return draft(audio, images)
+
+    def draft(audio, images):
+        shots = shots_for(images, audio)
+        if shots is None:
+            return create_preview(images, audio_path, None)
+        return create_preview([images[position] for position, _ in shots], audio_path,
+                              [seconds for _, seconds in shots])
+
+    def run_video(audio, images, preview=None, segments=None):
+        if not images:
+            return None  # nothing to render; callers report the failed image stage
+        shots = shots_for(images, audio)
+        if shots is None:
+            create_video(images, audio_path, video_path, durations=None)
+            return video_path
+        create_video([images[position] for position, _ in shots], audio_path, video_path,
+                     durations=[seconds for _, seconds in shots])
+        return video_path
+
+    def run_audio():
+        if scene_segments is None:
+            return generate_audio(story, audio_path)
+        try:
+            return scene_segments.narrate(generate_audio(story, audio_path))
+        except BaseException:
+            scene_segments.cancel()
+            raise
+
+    def run_images(prompts):
+        if scene_segments is None:
+            return generate_images(prompts, save_directory)
+        try:
+            return generate_images(prompts, save_directory, on_scene=scene_segments.add)
+        except BaseException:
+            scene_segments.cancel()
+            raise
+
+    pipeline = Pipeline(max_workers=max_workers, thread_initializer=thread_initializer)
+    pipeline.add("prompts", lambda: generate_prompts(story))
+    pipeline.add("audio", run_audio)
+    pipeline.add("images", run_images, deps=["prompts"])
+    video_deps = ["audio", "images"]
+    if scene_segments is not None:
+        pipeline.add("segments", lambda audio, images: scene_segments.wait(), deps=["audio", "images"])
+        video_deps.append("segments")
+    if create_preview is not None:
+        # The draft goes first so it does not compete with the final encode for the CPU
+        pipeline.add("preview", run_preview, deps=["audio", "images"])
+        video_deps.append("preview")
+    pipeline.add("video", run_video, deps=video_deps)
+    return pipeline
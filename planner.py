@@ -0,0 +1,250 @@
+"""
+Scene planner: turns a diary entry into the scenes worth generating.
+
+The story is split into sentences (handling "!", "?", ellipses, line breaks,
+common abbreviations, initials and decimals), sentences that say nearly the same
+thing as an earlier one reuse its scene, fragments too short to draw are
+merged into their neighbour, and adjacent scenes are merged until the
+plan fits the scene budget, so the whole story is covered instead of just
+its first sentences. Every sentence still gets narrated; `sentence_scenes`
+says which scene is on screen while it is read.
+
+Planning is pure Python, deterministic and close to linear in the length of
+the story: well under a millisecond for a typical entry and a few tens of
+milliseconds for a thousand sentences.
+"""
+
+import collections
+import heapq
+import math
+import os
+import re
+
+# Most scenes the Replicate app generates per entry; the planner fits the whole story into them
+SCENE_BUDGET = int(os.getenv("VISION_DIARY_SCENE_BUDGET", "8"))
+MIN_WORDS = 4
+# A sentence only reuses an earlier scene when it has this many content words and
+# at least this share of its word pairs (in order) appear in the earlier sentence
+MIN_CONTENT_WORDS = 4
+SIMILARITY = 0.8
+
+ABBREVIATIONS = {
+    "mr", "mrs", "ms", "dr", "prof", "sr", "jr", "st", "mt", "ave", "rd", "no", "vs", "etc", "e.g", "i.e",
+    "a.m", "p.m", "approx", "dept", "est", "inc", "ltd", "co", "jan", "feb", "mar", "apr", "jun", "jul",
+    "aug", "sep", "sept", "oct", "nov", "dec", "mon", "tue", "wed", "thu", "fri", "sat", "sun",
+}
+
+# Candidate sentence ends: terminal punctuation (plus closing quotes/brackets) followed by whitespace
+_BOUNDARY = re.compile(r"""([.!?…]+["'”’)\]]*)(\s+)""")
+_WORD = re.compile(r"[a-z0-9']+")
+_STOPWORDS = {
+    "a", "an", "the", "and", "or", "but", "to", "of", "in", "on", "at", "for", "with", "was", "were", "is",
+    "are", "it", "i", "we", "my", "our", "me", "us", "so", "then", "that", "this", "had", "have", "be",
+    "again", "along", "also", "very", "too", "just", "really", "some", "there", "here", "all",
+}
+
+
+def split_sentences(text):
+    """Split text into sentences without breaking on abbreviations, initials or decimals."""
+    sentences = []
+    for block in _blocks(text):
+        start = 0
+        for match in _BOUNDARY.finditer(block):
+            end = match.end(1)
+            if match.group(1) == "." and _is_abbreviation(block, end - 1):
+                continue
+            sentence = block[start:end].strip()
+            if sentence:
+                sentences.append(sentence)
+            start = match.end()
+        tail = block[start:].strip()
+        if tail:
+            sentences.append(tail)
+    return sentences
+
+
+def _blocks(text):
+    """
+    Group lines into blocks that cannot share a sentence. A line break ends
+    a block after a blank line, terminal punctuation, or before a bullet or a
+    capitalised line; otherwise it is a wrapped line and is joined.
+    """
+    blocks, current = [], []
+    for raw in text.splitlines():
+        line = raw.strip()
+        bullet = line[:1] in ("-", "*", "•")
+        line = line.strip("-*• \t")
+        if not line:
+            if current:
+                blocks.append(" ".join(current))
+                current = []
+            continue
+        if current and (bullet or line[0].isupper() or line[0].isdigit() or current[-1][-1] in ".!?…"):
+            blocks.append(" ".join(current))
+            current = []
+        current.append(line)
+    if current:
+        blocks.append(" ".join(current))
+    return blocks
+
+
+def _is_abbreviation(text, end):
+    """Whether the word before the full stop at text[end] is an abbreviation or an initial."""
+    start = end
+    while start and not text[start - 1].isspace():  # only the last word, however long the block
+        start -= 1
+    word = text[start:end].lower().lstrip("(\"'")
+    if word in ABBREVIATIONS:
+        return True
+    return len(word) == 1 and word.isalpha()  # an initial, as in "J. K. Rowling"
+
+
+class ScenePlan:
+    """
+    sentences: every sentence of the story, in order (all of them are narrated).
+    prompts: one prompt per scene to generate.
+    sentence_scenes: for each sentence, the index of the scene shown while it is read.
+    """
+
+    def __init__(self, sentences, prompts, sentence_scenes):
+        self.sentences = sentences
+        self.prompts = prompts
+        self.sentence_scenes = sentence_scenes
+
+    def __repr__(self):
+        return f"ScenePlan({len(self.sentences)} sentences, {len(self.prompts)} scenes)"
+
+
+def _word_pairs(words):
+    """Adjacent pairs of a sentence's content words, so word order and every changed word count."""
+    content = [word for word in words if word not in _STOPWORDS]
+    return content, set(zip(content, content[1:]))
+
+
+def plan_scenes(story, max_scenes=None, min_words=MIN_WORDS, similarity_threshold=SIMILARITY,
+                min_content_words=MIN_CONTENT_WORDS):
+    """Plan the scenes for story, using at most max_scenes (None for no limit)."""
+    sentences = split_sentences(story)
+    if not sentences:
+        return ScenePlan([], [], [])
+
+    words = [_WORD.findall(sentence.lower()) for sentence in sentences]
+
+    # 1. A sentence that nearly repeats an earlier one is shown with that sentence's scene
+    #    (Jaccard similarity of their content-word pairs). Two sentences that similar share
+    #    one of the rarest pairs of each (prefix filtering), so only sentences sharing one of
+    #    those are compared; the index maps each such pair to the sentences it leads
+    repeats = {}
+    word_pairs = [_word_pairs(sentence_words) for sentence_words in words]
+    frequency = collections.Counter(pair for _, pairs in word_pairs for pair in pairs)
+    seen_pairs = {}  # sentence index -> word pairs, for sentences that start scenes
+    index = {}  # rare word pair -> sentences in seen_pairs led by it, in order
+    for i, (content, pairs) in enumerate(word_pairs):
+        if len(words[i]) < min_words or len(content) < min_content_words:
+            continue
+        if similarity_threshold <= 0 and seen_pairs:
+            repeats[i] = next(iter(seen_pairs))  # even sentences sharing no pair are similar enough
+            continue
+        rarest = sorted(pairs, key=lambda pair: (frequency[pair], pair))
+        rarest = rarest[:len(pairs) - math.ceil(similarity_threshold * len(pairs) - 1e-9) + 1]
+        candidates = sorted({j for pair in rarest for j in index.get(pair, ())})
+        match = next((j for j in candidates
+                      if len(pairs & seen_pairs[j]) / len(pairs | seen_pairs[j]) >= similarity_threshold), None)
+        if match is not None:
+            repeats[i] = match
+            continue
+        seen_pairs[i] = pairs
+        for pair in rarest:
+            index.setdefault(pair, []).append(i)
+
+    # 2. Scenes are runs of sentences; short fragments join the scene before them (or after, at the start)
+    scene_sentences = []
+    sentence_scene = {}
+    for i in range(len(sentences)):
+        if i in repeats:
+            sentence_scene[i] = sentence_scene[repeats[i]]
+        elif scene_sentences and len(words[i]) < min_words:
+            sentence_scene[i] = sentence_scene[i - 1]
+            scene_sentences[sentence_scene[i]].append(i)
+        else:
+            sentence_scene[i] = len(scene_sentences)
+            scene_sentences.append([i])
+    if len(scene_sentences) > 1 and sum(len(words[i]) for i in scene_sentences[0]) < min_words:
+        scene_sentences[1] = scene_sentences[0] + scene_sentences[1]
+        del scene_sentences[0]
+        sentence_scene = {i: max(0, scene - 1) for i, scene in sentence_scene.items()}
+
+    # 3. Merge neighbouring scenes (smallest combined text first) until the budget is met
+    prompts, scene_of = _merge_scenes(sentences, scene_sentences, max_scenes)
+    sentence_scenes = [scene_of[sentence_scene[i]] for i in range(len(sentences))]
+    return ScenePlan(sentences, prompts, sentence_scenes)
+
+
+def _merge_scenes(sentences, scene_sentences, max_scenes):
+    """
+    Merge the adjacent pair of scenes with the least text (the leftmost on a
+    tie) until at most max_scenes remain. The scenes form a linked list and
+    the candidate pairs a heap, whose stale entries are skipped when popped.
+    Returns (prompts, merged scene of every original scene).
+    """
+    count = len(scene_sentences)
+    members = [list(group) for group in scene_sentences]
+    originals = [[scene] for scene in range(count)]
+    sizes = [sum(len(sentences[i]) for i in group) for group in scene_sentences]
+    following = list(range(1, count)) + [None]
+    preceding = [None] + list(range(count - 1))
+    heap = [(sizes[k] + sizes[k + 1], k, k + 1) for k in range(count - 1)]
+    heapq.heapify(heap)
+    remaining = count
+    while max_scenes and remaining > max_scenes:
+        combined, k, right = heapq.heappop(heap)
+        if following[k] != right or sizes[k] + sizes[right] != combined:
+            continue  # one of the two has merged since this entry was pushed
+        for merged in (members, originals):
+            # The longer list absorbs the shorter one, so a scene's sentences are copied few times
+            small, large = sorted((merged[k], merged[right]), key=len)
+            large.extend(small)
+            merged[k], merged[right] = large, None
+        sizes[k] += sizes[right]
+        following[k] = following[right]
+        if following[k] is not None:
+            preceding[following[k]] = k
+            heapq.heappush(heap, (sizes[k] + sizes[following[k]], k, following[k]))
+        if preceding[k] is not None:
+            heapq.heappush(heap, (sizes[preceding[k]] + sizes[k], preceding[k], k))
+        following[right] = preceding[right] = None
+        remaining -= 1
+
+    prompts, scene_of = [], [0] * count
+    k = 0 if count else None
+    while k is not None:
+        for scene in originals[k]:
+            scene_of[scene] = len(prompts)
+        prompts.append(" ".join(sentences[i] for i in sorted(members[k])))
+        k = following[k]
+    return prompts, scene_of
+
+
+def shot_timeline(sentence_scenes, sentence_durations, available):
+    """
+    Return [(scene, seconds)] shots for the video: consecutive sentences on
+    the same scene become one shot. A sentence whose scene has no image keeps
+    the previous shot on screen; sentences before the first image are added
+    to the first shot.
+    """
+    shots = []
+    pending = 0.0
+    for scene, seconds in zip(sentence_scenes, sentence_durations):
+        if scene not in available:
+            if shots:
+                shots[-1][1] += seconds
+            else:
+                pending += seconds
+            continue
+        if shots and shots[-1][0] == scene:
+            shots[-1][1] += seconds
+        else:
+            shots.append([scene, seconds])
+    if shots:
+        shots[0][1] += pending
+    return [(scene, seconds) for scene, seconds in shots]
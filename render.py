@@ -0,0 +1,513 @@
+"""
+Headless render stages shared by both Streamlit apps and the job workers.
+
+Nothing in here imports Streamlit: the apps only submit jobs and display
+results, while worker processes call `render_entry` to run the prompt, image,
+audio and video stages for one diary entry.
+"""
+
+import glob
+import hashlib
+import importlib
+import os
+import threading
+import time
+
+import archive
+from admission import get_admission
+from backends import REQUEST_TIMEOUT, backend_stats, generate_scene, get_backend, get_chain
+from concurrency import TokenBucket, run_ordered
+from downloads import download_stats, get_session
+from encoder import (encode_segment, encode_segments, encode_stills, ffmpeg_binary, probe_duration, segment_frames,
+                     segment_path, stitch_segments)
+from frames import StreamingFrames
+from image_cache import get_image_cache
+from manifest import build_manifest, diff_prompts, load_manifest, prune_segments, reusable_images, save_manifest
+from narration import get_sentence_cache, get_tts_backend, narrate, sentence_path
+from pipeline import build_render_pipeline
+from planner import SCENE_BUDGET, plan_scenes, shot_timeline, split_sentences
+from telemetry import flush_metrics, log, span
+from workspace import Workspace, entry_lock
+
+# "ffmpeg" encodes the stills directly; "moviepy" renders every frame at 24 fps
+VIDEO_ENCODER = os.getenv("VISION_DIARY_VIDEO_ENCODER", "ffmpeg")
+# Re-renders only regenerate and re-encode the scenes whose sentence changed
+INCREMENTAL = os.getenv("VISION_DIARY_INCREMENTAL", "1") == "1"
+# A small draft video is encoded first and shown while the full-quality one renders
+PREVIEW = os.getenv("VISION_DIARY_PREVIEW", "1") == "1"
+PREVIEW_SIZE = int(os.getenv("VISION_DIARY_PREVIEW_SIZE", "360"))
+PREVIEW_CRF = 30
+
+# Overrides both apps' image backend chains, e.g. "replicate,selenium,placeholder"
+IMAGE_BACKENDS = os.getenv("VISION_DIARY_IMAGE_BACKENDS")
+# Extra time a scene gets past its deadline for the local placeholder to be drawn
+PLACEHOLDER_GRACE = 30
+
+# Per-app render settings: which image backends run (in failover order) and where the files go
+APPS = {
+    "replicate": {
+        "backends": IMAGE_BACKENDS or "replicate,placeholder",
+        "max_scenes": SCENE_BUDGET,  # Limit images to save time/cost
+        "save_directory": "./diary_{date}",
+        "audio_name": "story_audio.mp3",
+        "video_name": "story_video.mp4",
+    },
+    "selenium": {
+        "backends": IMAGE_BACKENDS or "selenium,placeholder",
+        "max_scenes": None,
+        "save_directory": "./{date}",
+        "audio_name": "{date}_story_audio.mp3",
+        "video_name": "{date}_story_video.mp4",
+    },
+}
+
+
+def _serve_from_cache(prompts, save_directory, backends, on_scene, reuse=(), sources=None):
+    """
+    Place cached images for prompts; scenes in `reuse` already have their
+    image on disk. An image cached for any backend in the chain counts.
+    Returns (cache, paths, generated flags, misses).
+    """
+    cache = get_image_cache()
+    image_paths = [scene_image_path(save_directory, i) for i in range(len(prompts))]
+    cacheable = [backend for backend in backends if backend.cacheable]
+    with span("cache.lookup", scenes=len(prompts), reused=len(reuse)) as lookup:
+        generated = []
+        for i, (prompt, path) in enumerate(zip(prompts, image_paths)):
+            source = "reused" if i in reuse else next(
+                (backend.name for backend in cacheable if cache.get(backend.cache_key(cache, prompt), path)), None)
+            generated.append(source is not None)
+            if source is not None and sources is not None:
+                sources[i] = source
+        misses = [i for i, hit in enumerate(generated) if not hit]
+        lookup.set(hits=len(prompts) - len(misses))
+    if on_scene is not None:
+        for i, hit in enumerate(generated):
+            if hit:
+                on_scene(i, image_paths[i])
+    if len(misses) < len(prompts):
+        log(f"{len(prompts) - len(misses)}/{len(prompts)} images served from cache",
+            cache_hits=len(prompts) - len(misses), scenes=len(prompts))
+    return cache, image_paths, generated, misses
+
+
+def generate_scene_images(prompts, save_directory, backends, max_concurrency=None, timeout=None,
+                          requests_per_second=None, on_progress=None, on_scene=None, reuse=(), sources=None):
+    """
+    Generate one image per prompt through a chain of backends (see backends.py).
+
+    All prompts are submitted at once, at most `max_concurrency` at a time;
+    each scene falls back along the chain when a backend fails, has its
+    circuit open or misses the `timeout` deadline. The returned paths keep
+    prompt order; scenes no backend could make are skipped. on_progress(done,
+    total) is called as each scene completes and on_scene(index, image_path)
+    as each image lands on disk. Scenes in `reuse` keep the image already on
+    disk. `sources`, if given, is filled with {index: backend name} ("reused"
+    or a backend's name for cache hits).
+    """
+    backends[0].check()
+    timeout = timeout or REQUEST_TIMEOUT
+
+    # Cache hits skip the network entirely
+    cache, image_paths, generated, misses = _serve_from_cache(prompts, save_directory, backends, on_scene, reuse,
+                                                              sources)
+    cached_count = len(prompts) - len(misses)
+    if cached_count and on_progress is not None:
+        on_progress(cached_count, len(prompts))
+    if not misses:
+        return image_paths
+
+    def generate_one(slot, i):
+        with span("scene", scene=i + 1) as scene:
+            backend = generate_scene(backends, prompts[i], image_paths[i], timeout)
+            scene.set(backend=backend.name)
+            if backend.cacheable:
+                cache.put(backend.cache_key(cache, prompts[i]), image_paths[i])
+            return backend
+
+    def scene_done(slot, backend, error, done, total):
+        i = misses[slot]
+        if error is not None:
+            log(f"Error generating image {i+1}: {error}", level="error", scene=i + 1)
+        else:
+            generated[i] = True
+            if sources is not None:
+                sources[i] = backend.name
+            log(f"Image {i+1} generated with {backend.name}", scene=i + 1, backend=backend.name)
+            if on_scene is not None:
+                on_scene(i, image_paths[i])
+        if on_progress is not None:
+            on_progress(cached_count + done, len(prompts))
+
+    run_ordered(
+        generate_one,
+        misses,
+        max_workers=max_concurrency or backends[0].concurrency(),
+        timeout=timeout + PLACEHOLDER_GRACE,
+        rate_limiter=TokenBucket(requests_per_second) if requests_per_second else None,
+        on_complete=scene_done,
+        # Entries rendering side by side in one process share the lead backend's slots
+        slots=backends[0].slots(),
+    )
+    return [path for path, ok in zip(image_paths, generated) if ok]
+
+
+def generate_audio(story_text, audio_path, lang='en'):
+    """
+    Narrate the story sentence by sentence (cached per sentence) into
+    audio_path and return each sentence's duration.
+    """
+    durations = narrate(split_sentences(story_text), audio_path, lang=lang)
+    log(f"Audio generated successfully! Saved at {audio_path}", sentences=len(durations))
+    return durations
+
+
+def scene_image_path(save_directory, index):
+    return os.path.join(save_directory, f"generated_image_{index+1}.jpg")
+
+
+def narrated_shots(images, sentence_durations, sentence_scenes, save_directory):
+    """
+    Return [(position in images, seconds)]: each scene's image stays on
+    screen while the sentences it illustrates are read.
+    """
+    scene_count = max([len(images)] + [scene + 1 for scene in sentence_scenes])
+    expected = [scene_image_path(save_directory, i) for i in range(scene_count)]
+    position_of = {expected.index(path): position for position, path in enumerate(images)}
+    shots = shot_timeline(sentence_scenes, sentence_durations, set(position_of))
+    return [(position_of[scene], seconds) for scene, seconds in shots]
+
+
+def _audio_clip(audio_path):
+    # Only the MoviePy encoder needs MoviePy, and importing it costs a cold worker most of a second
+    from moviepy.audio.io.AudioFileClip import AudioFileClip
+
+    return AudioFileClip(audio_path)
+
+
+def _moviepy_encode(images, durations, audio_path, video_path, audio=None):
+    """Render at 24 fps with MoviePy, decoding scenes lazily through a small frame window."""
+    frames = StreamingFrames(images, durations)
+    with get_admission().slot("encoders"), span("encode", backend="moviepy", scenes=len(images)) as encode:
+        audio = audio or _audio_clip(audio_path)
+        frames.clip().set_audio(audio).write_videofile(video_path, codec="libx264", fps=24)
+        encode.set(decodes=frames.stats["decodes"])
+
+
+def create_video(images, audio_path, video_path, durations=None, segment_dir=None):
+    """
+    Create video from image paths and audio.
+    Each image is shown for its entry in durations, or for an equal share of
+    the audio.
+
+    With durations, the ffmpeg encoder and a segment_dir, every scene is
+    encoded to its own (reusable) segment and the segments are stitched;
+    the segment paths are returned. Otherwise returns None.
+    """
+    if not images:
+        raise ValueError("No images were generated. Cannot create video.")
+
+    if durations is not None:
+        if VIDEO_ENCODER == "ffmpeg" and segment_dir is not None:
+            segments = encode_segments(images, durations, segment_dir)
+            stitch_segments(segments, durations, audio_path, video_path)
+            log(f"Video created successfully! Saved at {video_path}")
+            return segments
+        if VIDEO_ENCODER == "ffmpeg":
+            encode_stills(images, durations, audio_path, video_path)
+        else:
+            _moviepy_encode(images, durations, audio_path, video_path)
+        log(f"Video created successfully! Saved at {video_path}")
+        return
+
+    if VIDEO_ENCODER == "ffmpeg":
+        audio_duration = probe_duration(audio_path)
+    else:
+        audio = _audio_clip(audio_path)
+        audio_duration = audio.duration
+
+    num_images = len(images)
+    duration_per_image = audio_duration / num_images
+
+    if VIDEO_ENCODER == "ffmpeg":
+        # Fast path: ffmpeg holds each still for its duration and copies the narration
+        encode_stills(images, [duration_per_image] * num_images, audio_path, video_path)
+    else:
+        _moviepy_encode(images, [duration_per_image] * num_images, audio_path, video_path, audio)
+    log(f"Video created successfully! Saved at {video_path}")
+
+
+def create_preview(images, audio_path, preview_path, durations=None):
+    """
+    Encode a low-resolution draft of the video with x264's ultrafast preset,
+    whichever encoder renders the final one. Without durations the images
+    share the audio evenly, as in create_video.
+    """
+    if durations is None:
+        durations = [probe_duration(audio_path) / len(images)] * len(images)
+    encode_stills(images, durations, audio_path, preview_path, size=(PREVIEW_SIZE, PREVIEW_SIZE),
+                  preset="ultrafast", crf=PREVIEW_CRF)
+    log(f"Preview created! Saved at {preview_path}")
+    return preview_path
+
+
+def preview_path_for(video_path):
+    base, extension = os.path.splitext(video_path)
+    return f"{base}_preview{extension}"
+
+
+def entry_paths(app, entry_date):
+    """Return (save_directory, audio_path, video_path) for an app's diary entry."""
+    settings = APPS[app]
+    save_directory = settings["save_directory"].format(date=entry_date)
+    return (
+        save_directory,
+        os.path.join(save_directory, settings["audio_name"].format(date=entry_date)),
+        os.path.join(save_directory, settings["video_name"].format(date=entry_date)),
+    )
+
+
+def prewarm(browsers=False):
+    """
+    Pay a worker's one-off costs before its first job: locate ffmpeg, load
+    the TTS backend, open the image and sentence caches and the download
+    session, and create every app's image backends (SDKs, API clients,
+    fonts). The Selenium backend's browsers are only launched with
+    browsers=True. Best effort: anything that fails is left to the first job.
+    """
+    started = time.perf_counter()
+    steps = [ffmpeg_binary, get_tts_backend, get_image_cache, get_sentence_cache, get_session]
+    if VIDEO_ENCODER == "moviepy":
+        steps.append(lambda: importlib.import_module("moviepy.video.VideoClip"))
+    names = {name.strip() for settings in APPS.values() for name in settings["backends"].split(",")}
+    for name in sorted(names - (set() if browsers else {"selenium"})):
+        steps.append(lambda name=name: get_backend(name).prewarm())
+    for step in steps:
+        try:
+            step()
+        except Exception as e:
+            log(f"Prewarm step failed: {e}", level="warning")
+    seconds = time.perf_counter() - started
+    log(f"Prewarmed in {seconds:.2f}s", seconds=round(seconds, 3))
+
+
+def render_entry(app, entry_date, story, on_progress=None, encode_executor=None, workspace=None,
+                 submitted_at=None):
+    """
+    Render one diary entry end to end with the app's image backends.
+
+    on_progress(stage, fraction, message, **details) is called as stages
+    advance; it may raise to abort the render. With PREVIEW, the "preview"
+    stage reports path= the draft video, ready before the final one. Returns
+    a dict with the video and preview paths, the generated image paths and
+    the per-stage timing report. encode_executor (e.g. a process pool) runs
+    create_video off this process's threads.
+
+    The render works in a private workspace (see workspace.py) named
+    `workspace` (e.g. the job id) or a fresh one, and publishes its files into
+    the entry directory once the video is done, so concurrent renders of the
+    same date never see each other's half-written files. Of two renders of
+    the same date, the one submitted later (`submitted_at`, a time.time()
+    value, defaults to now) keeps the entry: the earlier one raises
+    workspace.Superseded instead of publishing if it finishes last.
+
+    With INCREMENTAL, the entry's manifest from the previous render is used
+    to keep unchanged scenes' images and video segments, and is rewritten
+    once the new video is in place. Finished entries are recorded in the
+    archive index for the history pages.
+    """
+    settings = APPS[app]
+    submitted_at = time.time() if submitted_at is None else submitted_at
+    save_directory, audio_path, video_path = entry_paths(app, entry_date)
+    os.makedirs(save_directory, exist_ok=True)
+    workspace = Workspace(save_directory, workspace)
+    work_directory = workspace.path
+    work_audio, work_video = workspace.local(audio_path), workspace.local(video_path)
+
+    def report(stage, fraction, message, **details):
+        if on_progress is not None:
+            on_progress(stage, fraction, message, **details)
+
+    def scene_progress(done, total):
+        report("images", done / total, f"Generated {done}/{total} images...")
+
+    backends = get_chain(settings["backends"])
+    stage_messages = {
+        "prompts": "Generating images and audio narration...",
+        "audio": "Narration ready, still generating images...",
+        "images": "Images generated, assembling your video...",
+        "segments": "Scenes encoded, assembling your video...",
+        "preview": "Preview ready, rendering the full-quality video...",
+        "video": "Video created successfully!",
+    }
+
+    manifest = load_manifest(save_directory) if INCREMENTAL else None
+    segment_dir = os.path.join(work_directory, "segments") if INCREMENTAL else None
+    if manifest is not None:
+        # The previous render's segments are found again by content hash
+        with entry_lock(save_directory):
+            workspace.adopt(os.path.join(save_directory, shot["segment"])
+                            for shot in manifest["shots"] if shot.get("segment"))
+    rendered = {}  # what the stages produced, for the manifest
+
+    def make_images(prompts, directory, on_scene=None):
+        rendered["prompts"] = prompts
+        with entry_lock(save_directory):
+            reuse = reusable_images(manifest, prompts, save_directory)
+            workspace.adopt(scene_image_path(save_directory, i) for i in reuse)
+        rendered["reused_images"] = len(reuse)
+        return generate_scene_images(prompts, directory, backends, on_progress=scene_progress, on_scene=on_scene,
+                                     reuse=reuse, sources=rendered.setdefault("sources", {}))
+
+    encoding, lock = set(), threading.Lock()  # segments encoded early; scenes with the same image share one
+
+    def prepare_scene(index, image_path, sentence_durations):
+        # Shots as they will be if every scene's image arrives. A missing scene lengthens its
+        # neighbour's shot, and the final encode_segments makes that segment again
+        plan = rendered["plan"]
+        shots = shot_timeline(plan.sentence_scenes, sentence_durations, set(range(len(plan.prompts))))
+        os.makedirs(segment_dir, exist_ok=True)
+        for n, (scene, seconds) in enumerate(shots):
+            if scene != index:
+                continue
+            frames = segment_frames(seconds, last=(n == len(shots) - 1))
+            path = segment_path(segment_dir, image_path, frames)
+            with lock:
+                if path in encoding or os.path.exists(path):
+                    continue
+                encoding.add(path)
+            with span("encode.segment", scene=index + 1, frames=frames, early=True):
+                encode_segment(image_path, frames, path)
+
+    def make_prompts():
+        rendered["plan"] = plan_scenes(story, settings["max_scenes"])
+        return rendered["plan"].prompts
+
+    def make_timeline(images, sentence_durations):
+        rendered["sentence_durations"] = sentence_durations
+        rendered["shots"] = narrated_shots(images, sentence_durations, rendered["plan"].sentence_scenes,
+                                           work_directory)
+        return rendered["shots"]
+
+    def make_video(images, audio_path, video_path, durations=None):
+        args = (images, audio_path, video_path, durations, segment_dir)
+        if encode_executor is not None:
+            rendered["segments"] = encode_executor.submit(create_video, *args).result()
+        else:
+            rendered["segments"] = create_video(*args)
+
+    def make_preview(images, audio_path, durations):
+        # The draft is best effort: the full-quality video still follows if it fails
+        try:
+            rendered["preview"] = create_preview(images, audio_path, preview_path_for(work_video), durations)
+        except Exception as e:
+            log(f"Preview failed: {e}", level="warning")
+        return rendered.get("preview")
+
+    def stage_done(stage, seconds):
+        details = {"path": rendered["preview"]} if stage == "preview" and rendered.get("preview") else {}
+        report(stage, 1, stage_messages[stage], **details)
+
+    pipeline = build_render_pipeline(
+        story, work_directory, work_audio, work_video,
+        lambda story: make_prompts(),
+        make_images,
+        generate_audio,
+        make_video,
+        scene_timeline=make_timeline,
+        create_preview=make_preview if PREVIEW else None,
+        # Each scene's segment is encoded as its image lands; only ffmpeg segments can be made ahead
+        prepare_scene=prepare_scene if VIDEO_ENCODER == "ffmpeg" and segment_dir is not None else None,
+    )
+    cache_before, downloads_before = get_image_cache().stats(), download_stats()
+    admission_before = get_admission().stats()
+    report("prompts", 0, "Processing your story...")
+    try:
+        with span("render", app=app, entry=str(entry_date)):
+            results = pipeline.run(on_stage_done=stage_done)
+        if not results["images"]:
+            raise RuntimeError("Failed to generate images. Please try again.")
+    except BaseException:
+        workspace.discard()
+        raise
+    finally:
+        flush_metrics()
+    timings = pipeline.report()
+    for line in timings:
+        log(line)
+
+    cache_after, downloads_after = get_image_cache().stats(), download_stats()
+    admission_after = get_admission().stats()
+    stats = {
+        "cache_hits": cache_after["hits"] - cache_before["hits"],
+        "cache_misses": cache_after["misses"] - cache_before["misses"],
+        "downloaded_bytes": downloads_after["bytes"] - downloads_before["bytes"],
+        "reused_images": rendered.get("reused_images", 0),
+        "sentences": len(rendered["plan"].sentences),
+        "scenes": len(rendered["plan"].prompts),
+        "backends": _count(rendered.get("sources", {}).values()),
+        # Seconds this render spent waiting for machine-wide image, browser and encoder slots
+        "admission_wait": {resource: round(admission_after[resource]["wait_seconds"]
+                                           - admission_before[resource]["wait_seconds"], 3)
+                           for resource in admission_after},
+    }
+    prompts = rendered["prompts"]
+    last = [work_video]
+    if INCREMENTAL:
+        diff = diff_prompts(manifest, prompts)
+        stats["changed_scenes"] = len(diff["changed"]) + len(diff["added"])
+        sentences = rendered["plan"].sentences
+        last.append(save_manifest(work_directory, build_manifest(
+            app, work_directory, prompts, [scene_image_path(work_directory, i) for i in range(len(prompts))],
+            results["images"], rendered["shots"], rendered["segments"], rendered.get("sources", {}),
+            sentences, [sentence_path(sentence) for sentence in sentences], rendered["sentence_durations"],
+            work_audio, work_video,
+        )))
+
+    # Scenes the new render no longer has, and a draft from an earlier render, are not kept
+    stale = [path for path in glob.glob(os.path.join(save_directory, "generated_image_*.jpg"))
+             if _scene_number(path) > len(prompts)]
+    if not rendered.get("preview"):
+        stale.append(preview_path_for(video_path))
+
+    def prune():
+        # Under the publish lock: another render of this date must not publish between the two
+        if rendered.get("segments"):
+            prune_segments(os.path.join(save_directory, "segments"),
+                           [workspace.published(segment) for segment in rendered["segments"]])
+
+    # The stamp lets a resubmitted job see whether the video on disk is still this text's
+    text_hash = hashlib.sha256(story.encode("utf-8")).hexdigest()
+    workspace.publish(last=last, remove=stale, after=prune, stamp={"text_hash": text_hash},
+                      submitted_at=submitted_at)
+
+    images = [workspace.published(path) for path in results["images"]]
+    preview = preview_path_for(video_path) if rendered.get("preview") else None
+    stage_seconds = {stage: end - start for stage, (start, end) in pipeline.timings.items()}
+    origin = min(start for start, _ in pipeline.timings.values())
+    if preview:
+        stats["time_to_preview"] = round(pipeline.timings["preview"][1] - origin, 3)
+    stats["time_to_final"] = round(pipeline.timings["video"][1] - origin, 3)
+    try:
+        duration = probe_duration(video_path)
+    except ValueError:
+        duration = None
+    archive.record_entry(app, entry_date, story, video_path, images, audio_path, preview, duration)
+    return {"video_path": video_path, "preview_path": preview, "images": images, "text_hash": text_hash,
+            "timings": timings, "stage_seconds": stage_seconds, "stats": stats, "backend_stats": backend_stats()}
+
+
+def _scene_number(path):
+    """N of a generated_image_N.jpg path."""
+    name = os.path.splitext(os.path.basename(path))[0]
+    try:
+        return int(name.rsplit("_", 1)[1])
+    except (IndexError, ValueError):
+        return 0
+
+
+def _count(values):
+    counts = {}
+    for value in values:
+        counts[value] = counts.get(value, 0) + 1
+    return counts
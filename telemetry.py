@@ -0,0 +1,226 @@
+"""
+Stage-level tracing, structured logs and Prometheus metrics.
+
+`span(name, **attributes)` times a block of work and records its outcome
+(ok/error), retries, bytes and any other attributes; spans nest, including
+across the thread pools used by the pipeline and the image generators, and
+share the trace id of the render they belong to. `log(message, **fields)`
+replaces bare prints.
+
+Sinks are configured from the environment:
+
+* VISION_DIARY_TRACE_LOG: append spans and log lines as JSON, one object per
+  line ("-" for stderr). Without it log() prints the message as before.
+* VISION_DIARY_METRICS_FILE: Prometheus text-format file with a duration
+  histogram per span name and failure/retry/byte counters, rewritten
+  atomically by flush_metrics(). "{pid}" in the path is replaced by the
+  process id so each worker writes its own file (e.g. for node_exporter's
+  textfile collector).
+
+With neither set, span() returns a shared no-op object, so instrumented code
+pays one function call per span.
+"""
+
+import atexit
+import contextvars
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+
+BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+METRIC_PREFIX = "vision_diary"
+
+_trace_log = None
+_metrics_file = None
+_enabled = False
+_write_lock = threading.Lock()
+_current = contextvars.ContextVar("vision_diary_span", default=None)
+
+
+class _NoopSpan:
+    """Stand-in returned by span() while telemetry is disabled."""
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def set(self, **attributes):
+        pass
+
+    def add(self, key, amount=1):
+        pass
+
+
+_NOOP = _NoopSpan()
+
+
+class Span:
+    """A timed unit of work; use through span()."""
+
+    __slots__ = ("name", "attributes", "span_id", "parent_id", "trace_id", "started", "duration", "_token")
+
+    def __init__(self, name, attributes):
+        self.name = name
+        self.attributes = attributes
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = None
+        self.trace_id = None
+        self.started = None
+        self.duration = None
+        self._token = None
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def add(self, key, amount=1):
+        self.attributes[key] = self.attributes.get(key, 0) + amount
+
+    def __enter__(self):
+        parent = _current.get()
+        if parent is not None:
+            self.parent_id = parent.span_id
+            self.trace_id = parent.trace_id
+        else:
+            self.trace_id = uuid.uuid4().hex
+        self._token = _current.set(self)
+        self.started = time.monotonic()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.duration = time.monotonic() - self.started
+        _current.reset(self._token)
+        outcome = "ok" if exc_type is None else "error"
+        metrics.observe(self.name, self.duration, outcome,
+                        retries=self.attributes.get("retries", 0), size=self.attributes.get("bytes", 0))
+        if _trace_log is not None:
+            record = {"type": "span", "name": self.name, "trace": self.trace_id, "span": self.span_id,
+                      "parent": self.parent_id, "duration": round(self.duration, 6), "outcome": outcome}
+            if exc_type is not None:
+                record["error"] = f"{exc_type.__name__}: {exc}"
+            record.update(self.attributes)
+            _write(record)
+        return False
+
+
+def span(name, **attributes):
+    """Return a context manager that traces the enclosed block as `name`."""
+    if not _enabled:
+        return _NOOP
+    return Span(name, attributes)
+
+
+def current_span():
+    """The innermost active span, or the no-op span."""
+    return _current.get() or _NOOP
+
+
+def log(message, level="info", **fields):
+    """Log a message: a JSON line when the trace log is configured, else a print."""
+    if _trace_log is None:
+        print(message)
+        return
+    record = {"type": "log", "level": level, "msg": message}
+    active = _current.get()
+    if active is not None:
+        record["trace"] = active.trace_id
+        record["span"] = active.span_id
+    record.update(fields)
+    _write(record)
+
+
+def _write(record):
+    record["ts"] = round(time.time(), 6)
+    record["pid"] = os.getpid()
+    line = json.dumps(record, default=str) + "\n"
+    with _write_lock:
+        if _trace_log == "-":
+            sys.stderr.write(line)
+            sys.stderr.flush()
+        else:
+            with open(_trace_log, "a") as f:
+                f.write(line)
+
+
+class Metrics:
+    """Per-process span histograms and counters."""
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self._histograms = {}
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    def observe(self, name, seconds, outcome="ok", retries=0, size=0):
+        with self._lock:
+            histogram = self._histograms.get(name)
+            if histogram is None:
+                histogram = self._histograms[name] = {"buckets": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    histogram["buckets"][i] += 1
+            histogram["sum"] += seconds
+            histogram["count"] += 1
+            counters = self._counters.setdefault(name, {"failures": 0, "retries": 0, "bytes": 0})
+            counters["failures"] += outcome != "ok"
+            counters["retries"] += retries
+            counters["bytes"] += size
+
+    def render(self):
+        """Return the metrics in Prometheus text exposition format."""
+        with self._lock:
+            histograms = {name: dict(h, buckets=list(h["buckets"])) for name, h in self._histograms.items()}
+            counters = {name: dict(c) for name, c in self._counters.items()}
+
+        metric = f"{METRIC_PREFIX}_span_seconds"
+        lines = [f"# HELP {metric} Duration of traced pipeline spans.", f"# TYPE {metric} histogram"]
+        for name, histogram in sorted(histograms.items()):
+            for bound, count in zip(self.buckets, histogram["buckets"]):
+                lines.append(f'{metric}_bucket{{span="{name}",le="{bound}"}} {count}')
+            lines.append(f'{metric}_bucket{{span="{name}",le="+Inf"}} {histogram["count"]}')
+            lines.append(f'{metric}_sum{{span="{name}"}} {histogram["sum"]:.6f}')
+            lines.append(f'{metric}_count{{span="{name}"}} {histogram["count"]}')
+
+        for key, help_text in (("failures", "Spans that ended with an error."),
+                               ("retries", "Retries recorded by spans."),
+                               ("bytes", "Bytes transferred by spans.")):
+            metric = f"{METRIC_PREFIX}_span_{key}_total"
+            lines += [f"# HELP {metric} {help_text}", f"# TYPE {metric} counter"]
+            for name, values in sorted(counters.items()):
+                lines.append(f'{metric}{{span="{name}"}} {values[key]}')
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()
+
+
+def flush_metrics():
+    """Rewrite the metrics file, if one is configured."""
+    if _metrics_file is None:
+        return None
+    path = _metrics_file.replace("{pid}", str(os.getpid()))
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    tmp_path = os.path.join(directory, f".{os.path.basename(path)}.tmp")
+    with open(tmp_path, "w") as f:
+        f.write(metrics.render())
+    os.replace(tmp_path, path)
+    return path
+
+
+def configure(trace_log=None, metrics_file=None):
+    """Set the sinks (None disables one); called at import from the environment."""
+    global _trace_log, _metrics_file, _enabled
+    _trace_log = trace_log or None
+    _metrics_file = metrics_file or None
+    _enabled = _trace_log is not None or _metrics_file is not None
+
+
+configure(os.getenv("VISION_DIARY_TRACE_LOG"), os.getenv("VISION_DIARY_METRICS_FILE"))
+atexit.register(flush_metrics)
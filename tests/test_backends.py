@@ -0,0 +1,120 @@
+"""Image backend failover: circuit breaker transitions and abandoned requests."""
+
+import os
+import threading
+import time
+import types
+
+import pytest
+
+import backends
+from admission import AdmissionController
+from backends import CircuitBreaker, ImageBackend
+
+
+def test_circuit_breaker_transitions():
+    breaker = CircuitBreaker(failures=2, cooldown=0.05)
+    assert breaker.allow()
+    assert not breaker.failure()
+    assert breaker.failure()  # second failure in a row trips it
+    assert breaker.state == "open" and not breaker.allow()
+
+    time.sleep(0.06)
+    assert breaker.allow()  # the half-open trial
+    assert breaker.state == "half_open"
+    assert not breaker.allow()  # only one trial at a time
+    assert not breaker.allow(wait_until=time.monotonic() + 0.01)
+    assert breaker.failure()  # a failed trial re-opens it
+    assert breaker.state == "open" and breaker.trips == 2
+
+    time.sleep(0.06)
+    assert breaker.allow()
+    breaker.success()
+    assert breaker.state == "closed" and breaker.allow()
+
+
+def test_circuit_breaker_waiter_sees_trial_outcome():
+    breaker = CircuitBreaker(failures=1, cooldown=0)
+    breaker.failure()
+    assert breaker.allow()  # this caller runs the trial
+    allowed = []
+    waiter = threading.Thread(target=lambda: allowed.append(breaker.allow(wait_until=time.monotonic() + 5)))
+    waiter.start()
+    time.sleep(0.05)
+    breaker.success()
+    waiter.join(1)
+    assert allowed == [True]
+
+
+class _BlockingBackend(ImageBackend):
+    """A remote backend whose requests run until `finish` is set, then fail or succeed."""
+
+    name = "blocking"
+    hedge = False
+
+    def __init__(self, fail):
+        super().__init__()
+        self.fail = fail
+        self.finish = threading.Event()
+        self.finished = threading.Event()
+
+    def generate(self, prompt, image_path, deadline):
+        self.finish.wait()
+        try:
+            if self.fail:
+                raise RuntimeError("late failure")
+            with open(image_path, "wb") as f:
+                f.write(b"image")
+        finally:
+            self.finished.set()
+
+
+def _abandoned_request(tmp_path, monkeypatch, fail):
+    admission = AdmissionController(limits={"images": 1}, directory=str(tmp_path / "slots"))
+    monkeypatch.setattr(backends, "get_admission", lambda: admission)
+    backend = _BlockingBackend(fail)
+    backend.breaker = CircuitBreaker(failures=1, cooldown=60)
+    with pytest.raises(TimeoutError):
+        backends._hedged(backend, "prompt", str(tmp_path / "scene.jpg"), time.monotonic() + 0.1)
+    # The request is still running, but its slot is free for the next scene
+    admission.acquire("images", deadline=time.monotonic() + 0.5).release()
+    assert backend.breaker.state == "open" and backend.breaker.trips == 1
+    backend.finish.set()
+    assert backend.finished.wait(1)
+    time.sleep(0.05)
+    return backend
+
+
+def test_abandoned_request_frees_its_slot_and_a_late_failure_is_not_counted(tmp_path, monkeypatch):
+    backend = _abandoned_request(tmp_path, monkeypatch, fail=True)
+    assert backend.breaker.trips == 1 and backend.breaker._consecutive == 1
+
+
+def test_late_success_of_an_abandoned_request_does_not_close_the_breaker(tmp_path, monkeypatch):
+    backend = _abandoned_request(tmp_path, monkeypatch, fail=False)
+    assert backend.breaker.state == "open"
+    assert not os.path.exists(tmp_path / "scene.jpg")
+
+
+class _RunningPrediction:
+    id = "p1"
+    status = "processing"
+    cancelled = False
+
+    def reload(self):
+        pass
+
+    def cancel(self):
+        self.cancelled = True
+
+
+def test_replicate_stops_waiting_at_the_deadline():
+    prediction = _RunningPrediction()
+    client = types.SimpleNamespace(poll_interval=0.05,
+                                   predictions=types.SimpleNamespace(create=lambda **kwargs: prediction))
+    backend = backends.ReplicateBackend()
+    backend._client = client
+    started = time.monotonic()
+    with pytest.raises(TimeoutError):
+        backend.generate("prompt", "unused.jpg", started + 0.2)
+    assert time.monotonic() - started < 1 and prediction.cancelled
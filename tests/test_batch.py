@@ -0,0 +1,77 @@
+"""The batch CLI, run against the local stand-in services from benchmarks/fakes.py."""
+
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BENCH_DIR = os.path.join(REPO_DIR, "benchmarks")
+sys.path.insert(0, BENCH_DIR)
+
+from bench_pipeline import make_story  # noqa: E402
+from fakes import FakeServices  # noqa: E402
+
+# Narration that fails for stories mentioning a storm while FLAKY_TTS_DOWN=1
+FLAKY_TTS = '''
+import os
+
+from fakes import synthesize as fake_synthesize
+
+
+def synthesize(text, lang, out_path):
+    if os.getenv("FLAKY_TTS_DOWN") == "1" and "storm" in text:
+        raise RuntimeError("TTS unavailable")
+    return fake_synthesize(text, lang, out_path)
+'''
+
+
+@pytest.fixture
+def batch(tmp_path):
+    """Run batch.py over three entries, one of which fails while the TTS is down; returns a runner."""
+    with open(tmp_path / "flaky_tts.py", "w") as f:
+        f.write(FLAKY_TTS)
+    source = tmp_path / "entries.jsonl"
+    with open(source, "w") as f:
+        for day, salt in ((1, "calm-1"), (2, "storm-2"), (3, "calm-3")):
+            f.write(json.dumps({"date": f"2024-01-0{day}", "text": make_story(2, f"{salt}-{tmp_path.name}")}) + "\n")
+
+    with FakeServices(latency=0.05, jitter=0) as services:
+        env = dict(os.environ, **services.env())
+        env.update({
+            "PYTHONPATH": os.pathsep.join([str(tmp_path), REPO_DIR, BENCH_DIR]),
+            "VISION_DIARY_TTS_BACKEND": "flaky_tts:synthesize",
+            "VISION_DIARY_CACHE_DIR": str(tmp_path / "image-cache"),
+            "VISION_DIARY_TTS_CACHE_DIR": str(tmp_path / "tts-cache"),
+            "VISION_DIARY_SLOTS_DIR": str(tmp_path / "slots"),
+            "VISION_DIARY_REQUESTS_PER_SECOND": "1000",
+            "VISION_DIARY_PREWARM": "0",
+        })
+
+        def run(tts_down=False):
+            result = subprocess.run(
+                [sys.executable, os.path.join(REPO_DIR, "batch.py"), str(source), "--workdir", str(tmp_path),
+                 "--db", str(tmp_path / "batch.sqlite3"), "--parallel", "2", "--encoders", "1"],
+                env=dict(env, FLAKY_TTS_DOWN="1" if tts_down else "0"),
+                stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, timeout=300,
+            )
+            assert result.returncode == 0, result.stderr
+            return json.loads(result.stdout[result.stdout.rindex("\n{") + 1:])
+
+        yield run
+
+
+def test_batch_skips_finished_entries_and_requeues_failed_ones(batch, tmp_path):
+    first = batch(tts_down=True)
+    assert (first["entries"], first["skipped"], first["rendered"], first["failed"]) == (3, 0, 2, 1)
+    assert list(first["failures"]) == ["2024-01-02"]
+
+    # Resuming renders only the entry that failed
+    second = batch()
+    assert (second["skipped"], second["rendered"], second["failed"]) == (2, 1, 0)
+    assert os.path.exists(tmp_path / "diary_2024-01-02" / "story_video.mp4")
+
+    third = batch()
+    assert (third["skipped"], third["rendered"], third["failed"]) == (3, 0, 0)
@@ -0,0 +1,28 @@
+"""Bounded, ordered concurrent execution of scene requests."""
+
+import time
+
+from concurrency import run_ordered
+
+
+def test_run_ordered_keeps_input_order():
+    completed = []
+
+    def work(index, delay):
+        time.sleep(delay)
+        if index == 2:
+            raise ValueError("bad item")
+        return index * 10
+
+    outcomes = run_ordered(work, [0.05, 0.0, 0.01, 0.02], max_workers=4,
+                           on_complete=lambda index, result, error, done, total: completed.append((done, total)))
+    assert [result for result, _ in outcomes] == [0, 10, None, 30]
+    assert isinstance(outcomes[2][1], ValueError)
+    assert completed == [(1, 4), (2, 4), (3, 4), (4, 4)]
+
+
+def test_run_ordered_times_out_slow_items():
+    outcomes = run_ordered(lambda index, delay: time.sleep(delay) or index, [0.0, 2.0], max_workers=2, timeout=0.3)
+    assert outcomes[0] == (0, None)
+    assert isinstance(outcomes[1][1], TimeoutError)
+    assert run_ordered(lambda index, item: item, []) == []
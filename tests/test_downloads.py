@@ -0,0 +1,78 @@
+"""Retries in the shared download layer."""
+
+import socket
+import struct
+import threading
+
+import pytest
+import requests
+import urllib3.connection
+
+import downloads
+
+BODY = b"0123456789" * 1000
+
+
+def serve(responses):
+    """A local HTTP server answering one connection per entry of responses, then the full body."""
+    server = socket.socket()
+    server.bind(("127.0.0.1", 0))
+    server.listen()
+    connections = []
+
+    def run():
+        while True:
+            conn, _ = server.accept()
+            conn.recv(65536)
+            behaviour = responses[len(connections)] if len(connections) < len(responses) else "ok"
+            connections.append(behaviour)
+            if behaviour == "reset":
+                conn.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, struct.pack("ii", 1, 0))  # RST on close
+            elif behaviour == "truncated":
+                conn.sendall(b"HTTP/1.1 200 OK\r\nContent-Length: %d\r\n\r\n" % len(BODY) + BODY[:100])
+            else:
+                conn.sendall(b"HTTP/1.1 200 OK\r\nContent-Length: %d\r\nConnection: close\r\n\r\n" % len(BODY)
+                             + BODY)
+            conn.close()
+
+    threading.Thread(target=run, daemon=True).start()
+    return f"http://127.0.0.1:{server.getsockname()[1]}/image.jpg", connections
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(downloads, "BACKOFF_FACTOR", 0)
+
+
+@pytest.mark.parametrize("failure", ["reset", "truncated"])
+def test_dropped_connections_are_retried(tmp_path, failure):
+    url, connections = serve([failure, failure])
+    stats = downloads.download_file(url, str(tmp_path / "image.jpg"))
+    assert stats["attempts"] == 3 and connections == [failure, failure, "ok"]
+    assert (tmp_path / "image.jpg").read_bytes() == BODY
+
+
+def test_persistent_resets_give_up(tmp_path):
+    url, connections = serve(["reset"] * 10)
+    with pytest.raises(requests.exceptions.ConnectionError):
+        downloads.download_file(url, str(tmp_path / "image.jpg"))
+    assert len(connections) == downloads.MAX_RETRIES + 1
+    assert list(tmp_path.iterdir()) == []  # no partial file left behind
+
+
+def test_refused_connections_are_retried_once_per_attempt(tmp_path, monkeypatch):
+    probe = socket.socket()
+    probe.bind(("127.0.0.1", 0))
+    port = probe.getsockname()[1]
+    probe.close()
+    attempts = []
+    connect = urllib3.connection.connection.create_connection
+
+    def counting(*args, **kwargs):
+        attempts.append(args[0])
+        return connect(*args, **kwargs)
+
+    monkeypatch.setattr(urllib3.connection.connection, "create_connection", counting)
+    with pytest.raises(requests.exceptions.ConnectionError):
+        downloads.download_file(f"http://127.0.0.1:{port}/image.jpg", str(tmp_path / "image.jpg"))
+    assert len(attempts) == downloads.MAX_RETRIES + 1
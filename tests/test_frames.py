@@ -0,0 +1,66 @@
+"""Bounded-memory frame source for the MoviePy encoder."""
+
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+from PIL import Image
+
+from frames import WINDOW, StreamingFrames
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SIZE = (1024, 1024)
+FRAME_MB = SIZE[0] * SIZE[1] * 3 / 1e6
+SECONDS_PER_SCENE = 0.5
+FPS = 4
+
+# Reads every frame in time order, as the encoder does, and reports peak RSS over the post-import baseline
+_READ_ALL = """
+import json, platform, resource, sys
+from frames import StreamingFrames
+
+def peak_mb():
+    scale = 1 if platform.system() == "Darwin" else 1024  # ru_maxrss is bytes on macOS, KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale / 1e6
+
+seconds_per_scene, fps, images = float(sys.argv[1]), float(sys.argv[2]), sys.argv[3:]
+baseline = peak_mb()
+frames = StreamingFrames(images, [seconds_per_scene] * len(images))
+for n in range(int(frames.duration * fps)):
+    frames.frame_at(n / fps)
+print(json.dumps({"stats": frames.stats, "rss_over_baseline_mb": peak_mb() - baseline}))
+"""
+
+
+def make_images(directory, count):
+    paths = []
+    for i in range(count):
+        path = os.path.join(directory, f"generated_image_{i + 1}.jpg")
+        Image.new("RGB", SIZE, ((i * 37) % 256, (i * 91) % 256, (i * 53) % 256)).save(path)
+        paths.append(path)
+    return paths
+
+
+@pytest.mark.parametrize("scenes", [8, 32, 128])
+def test_long_entries_keep_a_bounded_window(tmp_path, scenes):
+    images = make_images(str(tmp_path), scenes)
+    # A fresh interpreter, so the peak is this read's and not the test run's
+    output = subprocess.run([sys.executable, "-c", _READ_ALL, str(SECONDS_PER_SCENE), str(FPS), *images],
+                            cwd=REPO_DIR, check=True, stdout=subprocess.PIPE, text=True).stdout
+    result = json.loads(output.strip().splitlines()[-1])
+
+    assert result["stats"]["decodes"] == scenes  # each scene decoded once
+    assert result["stats"]["peak_resident"] <= WINDOW
+    # The window plus one frame being decoded and fitted, however many scenes there are
+    assert result["rss_over_baseline_mb"] < (WINDOW + 4) * FRAME_MB
+
+
+def test_repeated_image_shares_one_decode(tmp_path):
+    first, second = make_images(str(tmp_path), 2)
+    frames = StreamingFrames([first, second, first], [1, 1, 1], size=(64, 64))
+    assert frames.frame_at(0.5) is frames.frame_at(0.9)
+    frames.frame_at(1.5)
+    frames.frame_at(2.5)
+    assert frames.stats == {"decodes": 2, "peak_resident": 2}
@@ -0,0 +1,74 @@
+"""The render job queue."""
+
+import os
+
+import pytest
+
+import jobs
+from workspace import Superseded, Workspace, read_stamp
+
+
+def _queue(tmp_path, rows):
+    """A job database holding (id, session, status) rows created in that order."""
+    conn = jobs.connect(str(tmp_path / "jobs.sqlite3"))
+    for n, (job_id, session, status) in enumerate(rows):
+        conn.execute("INSERT INTO jobs (id, app, entry_date, text, text_hash, status, session, created_at) "
+                     "VALUES (?, 'replicate', ?, '', '', ?, ?, ?)", (job_id, job_id, status, session, 1000.0 + n))
+    return conn
+
+
+def test_fair_queue_takes_turns_between_sessions(tmp_path):
+    conn = _queue(tmp_path, [("a1", "a", "queued"), ("a2", "a", "queued"), ("a3", "a", "queued"),
+                             ("b1", "b", "queued"), ("c1", "c", "queued"), ("b2", "b", "queued")])
+    assert jobs.fair_queue(conn) == ["a1", "b1", "c1", "a2", "b2", "a3"]
+
+
+def test_fair_queue_counts_running_jobs_as_turns(tmp_path):
+    conn = _queue(tmp_path, [("a0", "a", "running"), ("a1", "a", "queued"), ("b1", "b", "queued"),
+                             ("done", "b", "done")])
+    assert jobs.fair_queue(conn) == ["b1", "a1"]
+
+
+def _render(db_path, entry, text, job_id):
+    """Stand in for a worker: claim the job, publish a video for text into entry and mark it done."""
+    job = jobs.claim_job(db_path)
+    assert job["id"] == job_id
+    video_path = os.path.join(entry, "story_video.mp4")
+    workspace = Workspace(entry, job_id)
+    with open(workspace.local(video_path), "w") as f:
+        f.write(text)
+    workspace.publish(stamp={"text_hash": job["text_hash"]})
+    jobs.finish_job(job_id, "done", result={"video_path": video_path, "stats": {}}, db_path=db_path)
+
+
+def test_resubmitting_rerenders_when_another_text_was_published(tmp_path):
+    db_path, entry = str(tmp_path / "jobs.sqlite3"), str(tmp_path / "diary_2024-05-01")
+    os.makedirs(entry)
+    first = jobs.submit_job("replicate", "2024-05-01", "Text A.", db_path)
+    _render(db_path, entry, "Text A.", first["id"])
+    assert jobs.submit_job("replicate", "2024-05-01", "Text A.", db_path)["status"] == "done"
+
+    second = jobs.submit_job("replicate", "2024-05-01", "Text B.", db_path)
+    _render(db_path, entry, "Text B.", second["id"])
+    assert jobs.submit_job("replicate", "2024-05-01", "Text B.", db_path)["status"] == "done"
+    # The entry's video is B's now, so A has to be rendered again
+    assert jobs.submit_job("replicate", "2024-05-01", "Text A.", db_path)["status"] == "queued"
+
+
+def test_an_earlier_submission_finishing_last_does_not_publish(tmp_path):
+    entry = str(tmp_path / "diary_2024-05-01")
+    os.makedirs(entry)
+    video_path = os.path.join(entry, "story_video.mp4")
+    older, newer = Workspace(entry, "older"), Workspace(entry, "newer")
+    for workspace, text in ((older, "Text A."), (newer, "Text B.")):
+        with open(workspace.local(video_path), "w") as f:
+            f.write(text)
+
+    newer.publish(stamp={"text_hash": "b"}, submitted_at=2000.0)
+    pruned = []
+    with pytest.raises(Superseded):
+        older.publish(after=lambda: pruned.append(True), stamp={"text_hash": "a"}, submitted_at=1000.0)
+    with open(video_path) as f:
+        assert f.read() == "Text B."
+    assert read_stamp(entry) == {"text_hash": "b", "submitted_at": 2000.0}
+    assert not pruned and not os.path.exists(older.path)
@@ -0,0 +1,30 @@
+"""The media server: HTTP range parsing and default ports."""
+
+import pytest
+
+import media_server
+from media_server import media_port, parse_range
+
+
+def test_parse_range():
+    assert parse_range(None, 1000) is None
+    assert parse_range("bytes=0-99", 1000) == (0, 99)
+    assert parse_range("bytes=500-", 1000) == (500, 999)
+    assert parse_range("bytes=-100", 1000) == (900, 999)
+    assert parse_range("bytes=900-5000", 1000) == (900, 999)
+    assert parse_range("bytes=0-1,5-9", 1000) is None  # multiple ranges: send the whole file
+    assert parse_range("items=0-1", 1000) is None
+
+
+@pytest.mark.parametrize("header", ["bytes=1000-", "bytes=50-10", "bytes=abc-", "bytes=-0"])
+def test_parse_range_unsatisfiable(header):
+    with pytest.raises(ValueError):
+        parse_range(header, 1000)
+
+
+def test_each_app_has_its_own_default_port(monkeypatch):
+    monkeypatch.setattr(media_server, "MEDIA_PORT", None)
+    ports = {media_port("replicate"), media_port("selenium")}
+    assert len(ports) == 2 and not ports & {8501, 8502}  # Streamlit's default and the README's second port
+    monkeypatch.setattr(media_server, "MEDIA_PORT", "9000")
+    assert media_port("replicate") == media_port("selenium") == 9000
@@ -0,0 +1,60 @@
+"""Render DAG: early per-scene preparation."""
+
+import threading
+import time
+
+from pipeline import SceneSegments, build_render_pipeline
+
+
+def test_scenes_wait_for_the_narration():
+    prepared = []
+    segments = SceneSegments(lambda index, path, narration: prepared.append((index, path, narration)))
+    segments.add(0, "a.jpg")
+    time.sleep(0.05)
+    assert prepared == []
+    segments.narrate([1.0, 2.0])
+    segments.add(1, "b.jpg")
+    segments.wait()
+    assert sorted(prepared) == [(0, "a.jpg", [1.0, 2.0]), (1, "b.jpg", [1.0, 2.0])]
+
+
+def test_held_scenes_start_after_the_block():
+    started = threading.Event()
+    segments = SceneSegments(lambda index, path, narration: started.set())
+    segments.narrate(None)
+    with segments.held():
+        segments.add(0, "a.jpg")
+        assert not started.wait(0.1)
+    segments.wait()
+    assert started.is_set()
+
+
+def test_a_failed_scene_is_left_to_the_final_encode():
+    def prepare(index, path, narration):
+        raise RuntimeError("ffmpeg failed")
+
+    segments = SceneSegments(prepare)
+    segments.narrate(None)
+    segments.add(0, "a.jpg")
+    segments.wait()  # logged, not raised
+
+
+def test_segments_stage_runs_before_the_video(tmp_path):
+    events = []
+
+    def generate_images(prompts, directory, on_scene=None):
+        for i, prompt in enumerate(prompts):
+            on_scene(i, prompt)
+        return list(prompts)
+
+    pipeline = build_render_pipeline(
+        "story", str(tmp_path), "audio.mp3", "video.mp4",
+        generate_prompts=lambda story: ["a.jpg", "b.jpg"],
+        generate_images=generate_images,
+        generate_audio=lambda story, path: [1.0],
+        create_video=lambda images, audio, video, durations: events.append("video"),
+        prepare_scene=lambda index, path, narration: events.append(path),
+    )
+    results = pipeline.run()
+    assert sorted(events[:2]) == ["a.jpg", "b.jpg"] and events[2:] == ["video"]
+    assert results["video"] == "video.mp4"
@@ -0,0 +1,48 @@
+"""Scene planning: sentence deduplication, short fragments and the scene budget."""
+
+import time
+
+from planner import plan_scenes
+
+
+def test_different_activities_keep_their_scenes():
+    plan = plan_scenes("We played soccer in the park today. We played tennis in the park today.", 8)
+    assert len(plan.prompts) == 2
+    assert plan.sentence_scenes == [0, 1]
+
+
+def test_numbered_sentences_fill_the_budget():
+    story = " ".join(f"Sentence number {n} is about topic {n}." for n in range(1, 31))
+    plan = plan_scenes(story, 8)
+    assert len(plan.sentences) == 30
+    assert len(plan.prompts) == 8
+    assert sorted(set(plan.sentence_scenes)) == list(range(8))
+
+
+def test_repeated_sentence_reuses_its_scene():
+    plan = plan_scenes("We went to the beach and swam in the sea. Then we ate lunch at the pier. "
+                       "We went to the beach and swam in the sea again.")
+    assert len(plan.prompts) == 2
+    assert plan.sentence_scenes == [0, 1, 0]
+
+
+def test_short_sentences_are_not_deduplicated():
+    plan = plan_scenes("It rained all day long. It snowed all day long.", min_words=1)
+    assert len(plan.prompts) == 2
+
+
+def test_budget_covers_whole_story():
+    story = " ".join(f"On day {n} I visited a new museum in town." for n in range(12))
+    plan = plan_scenes(story, 4)
+    assert len(plan.prompts) == 4
+    assert plan.sentence_scenes == sorted(plan.sentence_scenes)
+    assert plan.sentence_scenes[-1] == 3
+
+
+def test_long_story_plans_in_linear_time():
+    # Every sentence shares word pairs with every other, and the budget takes ~1000 merges
+    story = " ".join(f"Sentence number {n} is about topic {n}." for n in range(1000))
+    started = time.perf_counter()
+    plan = plan_scenes(story, 8)
+    assert time.perf_counter() - started < 0.5  # over a second before the pair index and merge heap
+    assert len(plan.sentences) == 1000 and len(plan.prompts) == 8
@@ -0,0 +1,137 @@
+"""
+Per-render workspaces inside an entry's directory.
+
+An entry's files live at fixed paths derived from its date, so two renders
+of the same date (two users, or an edit submitted while the first render is
+still running) used to write over each other's images and narration. Each
+render now works in its own directory under <entry>/.work/. It starts with
+hard links to the published files it reuses, and the finished files are
+moved into the entry directory in one step under the entry's lock. The video
+goes last, with os.replace, so readers see the old video or the new one and
+never a partial file. A stamp file records what the published files were
+rendered from and when that render was submitted, so a job can tell whether
+the video on disk is still its own, and a render that finishes after a newer
+submission's render does not publish over it.
+"""
+
+import json
+import os
+import shutil
+import uuid
+
+from admission import file_lock
+
+WORK_DIR = ".work"
+LOCK_NAME = ".publish.lock"
+STAMP_NAME = ".published.json"
+
+
+class Superseded(Exception):
+    """Raised by Workspace.publish when a render submitted later has already published the entry."""
+
+
+def entry_lock(save_directory):
+    """Exclusive lock on an entry directory while files are adopted from or published into it."""
+    return file_lock(os.path.join(save_directory, LOCK_NAME))
+
+
+def read_stamp(save_directory):
+    """The stamp of the entry's last publish (e.g. {"text_hash": ...}), or None."""
+    try:
+        with open(os.path.join(save_directory, STAMP_NAME)) as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def _write_stamp(save_directory, stamp):
+    path = os.path.join(save_directory, STAMP_NAME)
+    with open(path + ".tmp", "w") as f:
+        json.dump(stamp, f)
+    os.replace(path + ".tmp", path)
+
+
+class Workspace:
+    """A render's private copy of an entry directory."""
+
+    def __init__(self, save_directory, name=None):
+        self.save_directory = save_directory
+        self.path = os.path.join(save_directory, WORK_DIR, name or uuid.uuid4().hex)
+        shutil.rmtree(self.path, ignore_errors=True)  # left over from a crashed attempt at the same job
+        os.makedirs(self.path)
+
+    def local(self, published_path):
+        """The workspace path of a file in the entry directory."""
+        return os.path.join(self.path, os.path.relpath(published_path, self.save_directory))
+
+    def published(self, local_path):
+        """The entry directory path a workspace file is published to."""
+        return os.path.join(self.save_directory, os.path.relpath(local_path, self.path))
+
+    def adopt(self, published_paths):
+        """
+        Hard-link published files into the workspace (copying where links are
+        not possible); call under entry_lock. Missing files are skipped.
+        """
+        adopted = []
+        for path in published_paths:
+            target = self.local(path)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            try:
+                os.link(path, target)
+            except FileNotFoundError:
+                continue
+            except FileExistsError:
+                pass
+            except OSError:
+                shutil.copy2(path, target)
+            adopted.append(target)
+        return adopted
+
+    def publish(self, last=(), remove=(), after=None, stamp=None, submitted_at=None):
+        """
+        Move every workspace file into the entry directory, the `last` ones
+        (workspace paths) at the end in the given order, and delete the
+        published files in `remove`. `after`, if given, is called while the
+        entry is still locked, so cleanup based on what was just published
+        cannot race another render's publish. `stamp` (a JSON-able dict) is
+        then written for read_stamp, with `submitted_at` (when the render was
+        submitted, e.g. the job's created_at) added. Finally drop the
+        workspace.
+
+        If the entry's stamp records a later submitted_at, nothing is
+        published: the workspace is dropped and Superseded is raised.
+        """
+        last = [os.path.relpath(path, self.path) for path in last]
+        files = []
+        for directory, _, names in os.walk(self.path):
+            files += [os.path.relpath(os.path.join(directory, name), self.path) for name in names]
+        ordered = sorted(name for name in files if name not in last) + [name for name in last if name in files]
+        with entry_lock(self.save_directory):
+            published = read_stamp(self.save_directory) or {}
+            if submitted_at is not None and (published.get("submitted_at") or 0) > submitted_at:
+                self.discard()
+                raise Superseded(f"A later edit of this entry was published while this one rendered "
+                                 f"(submitted {published['submitted_at'] - submitted_at:.0f}s later)")
+            for name in ordered:
+                target = os.path.join(self.save_directory, name)
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                os.replace(os.path.join(self.path, name), target)
+            for path in remove:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+            if after is not None:
+                after()
+            if stamp is not None:
+                _write_stamp(self.save_directory,
+                             stamp if submitted_at is None else dict(stamp, submitted_at=submitted_at))
+        self.discard()
+
+    def discard(self):
+        shutil.rmtree(self.path, ignore_errors=True)
+        try:
+            os.rmdir(os.path.dirname(self.path))  # .work, once no render is using it
+        except OSError:
+            pass